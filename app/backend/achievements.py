@@ -0,0 +1,395 @@
+"""
+Achievement rules engine.
+
+Checking achievements used to mean aggregating over a user's entire game
+history after every game, and only three achievements were covered. Instead,
+each completed game updates a small row of per-user counters in
+``user_stats``:
+
+    games_played, games_won, wins_by_game_type, current/best win streak,
+    last_played_on, current/best day streak, distinct_partners, aces, eagles,
+    best_birdies_in_game, under_par_games, low_variance_games,
+    comeback_wins, lucky_number_wins
+
+Every rule in ``RULES`` is a threshold on those counters, so evaluating all
+of them after a game costs O(rules) no matter how many games the user has
+played. Everything earned by every player in the game is then written with
+one ``unlock_many`` statement (``ON CONFLICT DO NOTHING``), which returns
+only the achievements that are actually new.
+
+Stroke-based facts (aces, birdies, variance, ...) are SQL aggregates over the
+game's ``hole_scores`` rows (hole_scores.py), which mirror the per-hole strokes
+in ``state_json`` (``scores: {email: [...]}`` or ``players[].scores``). Only
+stroke-scored game types (``STROKE_SCORED_GAME_TYPES``) add them; a wolf card
+holds points per hole, not strokes.
+Birdies, eagles and under-par need the course pars as ``state_json.pars``;
+games without pars simply never trigger those. "Tournament Organizer" has no
+rule because the app has no tournaments yet.
+
+If the counters ever drift (e.g. after editing results by hand), rebuild them
+with ``python cli.py rebuild-achievement-stats``.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from cache import MISSING, TTLCache
+import game_results
+import hole_scores
+import http_cache
+import leaderboards
+
+logger = logging.getLogger(__name__)
+
+# The catalog only changes when achievements_data.sql is re-run, so it is re-read this often at most.
+CATALOG_TTL = 300
+
+# Game types whose per-hole scores are strokes. Wolf's ``players[].scores`` hold the
+# points each hole earned (0-2), which would read as aces and very steady rounds.
+STROKE_SCORED_GAME_TYPES = ('skins', 'sixsixsix')
+
+# Games with a per-hole stroke variance below this count towards Consistency King.
+LOW_VARIANCE_THRESHOLD = 3.0
+# Strokes behind the leader after the front nine that make a win a comeback.
+COMEBACK_DEFICIT = 5
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One achievement, identified by ``achievements.name``, and when it is earned."""
+    name: str
+    earned: Callable[[dict], bool]
+
+
+def _wins_in(game_type: str, count: int) -> Callable[[dict], bool]:
+    return lambda stats: (stats['wins_by_game_type'] or {}).get(game_type, 0) >= count
+
+
+RULES: List[Rule] = [
+    # scoring
+    Rule('First Win', lambda s: s['games_won'] >= 1),
+    Rule('Hat Trick', lambda s: s['best_win_streak'] >= 3),
+    Rule('Perfect Storm', lambda s: s['best_win_streak'] >= 5),
+    Rule('Hole in One', lambda s: s['aces'] >= 1),
+    Rule('Eagle Eye', lambda s: s['eagles'] >= 1),
+    Rule('Birdie Machine', lambda s: s['best_birdies_in_game'] >= 5),
+    Rule('Under Par Master', lambda s: s['under_par_games'] >= 1),
+    # game types
+    Rule('Wolf Pack Leader', _wins_in('wolf', 10)),
+    Rule('Skins Champion', _wins_in('skins', 10)),
+    # Only formats that produce results can be won (sixsixsix has no scoring yet).
+    Rule('Multi-Format Master', lambda s: all(
+        (s['wins_by_game_type'] or {}).get(game_type, 0) >= 1 for game_type in game_results.SCORED_GAME_TYPES
+    )),
+    Rule('Century Club', lambda s: s['games_played'] >= 100),
+    # social
+    Rule('Team Player', lambda s: s['distinct_partners'] >= 10),
+    Rule('Social Butterfly', lambda s: s['distinct_partners'] >= 25),
+    # milestones
+    Rule('Getting Started', lambda s: s['games_played'] >= 1),
+    Rule('Dedicated Player', lambda s: s['best_day_streak'] >= 7),
+    Rule('Golf Addict', lambda s: s['best_day_streak'] >= 30),
+    # secret
+    Rule('Lucky Number', lambda s: s['lucky_number_wins'] >= 1),
+    Rule('Comeback Kid', lambda s: s['comeback_wins'] >= 1),
+    Rule('Consistency King', lambda s: s['low_variance_games'] >= 10),
+]
+
+
+def earned_achievements(stats: dict) -> List[str]:
+    """Names of every achievement the counters in ``stats`` qualify for."""
+    return [rule.name for rule in RULES if rule.earned(stats)]
+
+
+# -- per-game facts ------------------------------------------------------------
+
+@dataclass
+class GameFacts:
+    """What one completed game adds to one player's counters."""
+    won: bool
+    aces: int = 0
+    eagles: int = 0
+    birdies: int = 0
+    under_par: bool = False
+    low_variance: bool = False
+    comeback: bool = False
+    lucky_number: bool = False
+
+
+def game_facts(email: str, won: bool, game_type: str, aggregates: Dict[str, dict]) -> GameFacts:
+    """
+    Work out ``GameFacts`` for one player from ``hole_scores.game_aggregates``
+    (every player's, since comebacks compare front nines). Only games in
+    ``STROKE_SCORED_GAME_TYPES`` add stroke-based facts.
+    """
+    facts = GameFacts(won=won)
+    if game_type not in STROKE_SCORED_GAME_TYPES:
+        return facts
+    mine = aggregates.get(email)
+    if not mine or not mine['played']:
+        return facts
+
+    facts.aces = mine['aces']
+    if mine['pars']:
+        facts.eagles = mine['eagles']
+        facts.birdies = mine['birdies']
+        # Every hole up to the last one scored, each with a par, covering the whole card.
+        complete = mine['rated'] == mine['played'] == mine['last_hole'] and mine['played'] >= mine['pars']
+        facts.under_par = complete and mine['to_par'] < 0
+
+    if mine['played'] >= 2:
+        facts.low_variance = mine['variance'] < LOW_VARIANCE_THRESHOLD
+
+    # Read as: won with exactly 77 strokes, including a 7 on hole 7.
+    facts.lucky_number = won and mine['total'] == 77 and mine['hole_7'] == 7
+
+    if won:
+        front_nine = {other: row['front_nine'] for other, row in aggregates.items() if row['front_nine'] is not None}
+        if email in front_nine and len(front_nine) > 1:
+            facts.comeback = front_nine[email] - min(front_nine.values()) >= COMEBACK_DEFICIT
+    return facts
+
+
+# -- counters --------------------------------------------------------------------
+
+async def update_counters(db, game_id: int) -> Dict[int, dict]:
+    """
+    Add one completed game to ``user_stats`` for each registered player.
+    Needs the game's ``game_results`` rows. Returns ``{user_id: stats row}``.
+    Runs inside the caller's transaction.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT g.game_type, COALESCE(g.completed_at, NOW())::date AS day,
+                   gp.user_id, gp.email, gr.outcome
+            FROM games g
+            JOIN game_players gp ON gp.game_id = g.id
+            LEFT JOIN game_results gr ON gr.game_player_id = gp.id
+            WHERE g.id = %s
+            ORDER BY gp.id
+        """, (game_id,))
+        rows = await cursor.fetchall()
+        if not rows:
+            return {}
+        game_type = rows[0]['game_type']
+        day: date = rows[0]['day']
+        aggregates = await hole_scores.game_aggregates(db, game_id) if game_type in STROKE_SCORED_GAME_TYPES else {}
+
+        updated = {}
+        for row in rows:
+            user_id = row['user_id']
+            if user_id is None:
+                continue
+            won = row['outcome'] in (game_results.OUTCOME_WON, game_results.OUTCOME_TIED)
+            facts = game_facts(row['email'], won, game_type, aggregates)
+            partners = [
+                str(other['user_id']) if other['user_id'] is not None else f"email:{other['email'].lower()}"
+                for other in rows if other is not row and other['user_id'] != user_id
+            ]
+            new_partners = 0
+            if partners:
+                await cursor.execute("""
+                    INSERT INTO user_partners (user_id, partner)
+                    SELECT %s, unnest(%s::text[])
+                    ON CONFLICT DO NOTHING
+                    RETURNING partner
+                """, (user_id, partners))
+                new_partners = len(await cursor.fetchall())
+            await cursor.execute(_UPSERT_COUNTERS, {
+                "user_id": user_id,
+                "won": int(facts.won),
+                "wins_by_game_type": Jsonb({game_type: 1} if facts.won else {}),
+                "game_type": game_type,
+                "day": day,
+                "partners": new_partners,
+                "aces": facts.aces,
+                "eagles": facts.eagles,
+                "birdies": facts.birdies,
+                "under_par": int(facts.under_par),
+                "low_variance": int(facts.low_variance),
+                "comeback": int(facts.comeback),
+                "lucky_number": int(facts.lucky_number),
+            })
+            updated[user_id] = await cursor.fetchone()
+    return updated
+
+
+# Every SET expression sees the old row (s), so streaks are computed from the previous values.
+_UPSERT_COUNTERS = """
+    INSERT INTO user_stats AS s (
+        user_id, games_played, games_won, wins_by_game_type, current_win_streak, best_win_streak,
+        last_played_on, current_day_streak, best_day_streak, distinct_partners, aces, eagles,
+        best_birdies_in_game, under_par_games, low_variance_games, comeback_wins, lucky_number_wins
+    ) VALUES (
+        %(user_id)s, 1, %(won)s, %(wins_by_game_type)s::jsonb, %(won)s, %(won)s,
+        %(day)s, 1, 1, %(partners)s, %(aces)s, %(eagles)s,
+        %(birdies)s, %(under_par)s, %(low_variance)s, %(comeback)s, %(lucky_number)s
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        games_played = s.games_played + 1,
+        games_won = s.games_won + EXCLUDED.games_won,
+        wins_by_game_type = CASE WHEN EXCLUDED.games_won > 0
+            THEN s.wins_by_game_type || jsonb_build_object(
+                %(game_type)s::text, COALESCE((s.wins_by_game_type ->> %(game_type)s::text)::int, 0) + 1)
+            ELSE s.wins_by_game_type END,
+        current_win_streak = CASE WHEN EXCLUDED.games_won > 0 THEN s.current_win_streak + 1 ELSE 0 END,
+        best_win_streak = GREATEST(s.best_win_streak,
+            CASE WHEN EXCLUDED.games_won > 0 THEN s.current_win_streak + 1 ELSE 0 END),
+        last_played_on = GREATEST(s.last_played_on, EXCLUDED.last_played_on),
+        current_day_streak = CASE
+            WHEN s.last_played_on >= EXCLUDED.last_played_on THEN s.current_day_streak
+            WHEN s.last_played_on = EXCLUDED.last_played_on - 1 THEN s.current_day_streak + 1
+            ELSE 1 END,
+        best_day_streak = GREATEST(s.best_day_streak, CASE
+            WHEN s.last_played_on >= EXCLUDED.last_played_on THEN s.current_day_streak
+            WHEN s.last_played_on = EXCLUDED.last_played_on - 1 THEN s.current_day_streak + 1
+            ELSE 1 END),
+        distinct_partners = s.distinct_partners + EXCLUDED.distinct_partners,
+        aces = s.aces + EXCLUDED.aces,
+        eagles = s.eagles + EXCLUDED.eagles,
+        best_birdies_in_game = GREATEST(s.best_birdies_in_game, EXCLUDED.best_birdies_in_game),
+        under_par_games = s.under_par_games + EXCLUDED.under_par_games,
+        low_variance_games = s.low_variance_games + EXCLUDED.low_variance_games,
+        comeback_wins = s.comeback_wins + EXCLUDED.comeback_wins,
+        lucky_number_wins = s.lucky_number_wins + EXCLUDED.lucky_number_wins,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING *
+"""
+
+
+# -- unlocking --------------------------------------------------------------------
+
+# Achievement definitions are seed data, so their ids are read once per process.
+_ids_by_name: Dict[str, int] = {}
+
+
+async def achievement_ids(db) -> Dict[str, int]:
+    """``{name: id}`` for every achievement."""
+    if not _ids_by_name:
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT id, name FROM achievements")
+            _ids_by_name.update({name: achievement_id for achievement_id, name in await cursor.fetchall()})
+    return _ids_by_name
+
+
+_catalog_cache = TTLCache(maxsize=1, ttl=CATALOG_TTL)
+
+
+async def catalog(pool) -> Tuple[List[dict], str]:
+    """
+    Every achievement (secret ones included and flagged) and a content ETag
+    for the list. Borrows a connection from ``pool`` at most once per
+    ``CATALOG_TTL``.
+    """
+    cached = _catalog_cache.get('catalog')
+    if cached is not MISSING:
+        return cached
+    async with pool.connection() as db:
+        async with db.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("""
+                SELECT id, name, description, icon, category, points, is_secret
+                FROM achievements
+                ORDER BY category, points DESC
+            """)
+            rows = await cursor.fetchall()
+    entry = (rows, http_cache.content_etag(rows))
+    _catalog_cache.set('catalog', entry)
+    return entry
+
+
+async def unlock_many(db, unlocks: Iterable[Tuple[int, int, Optional[int]]]) -> List[dict]:
+    """
+    Unlock many ``(user_id, achievement_id, game_id)`` tuples in one statement.
+
+    Idempotent: pairs the user already has are skipped by the
+    ``UNIQUE(user_id, achievement_id)`` constraint, as are unknown users or
+    achievements. Returns only the newly unlocked rows (``user_id``,
+    ``achievement_id``, ``game_id``, ``unlocked_at``, ``name``, ``points``,
+    ``icon``), so callers can celebrate just those. The caller commits.
+    """
+    # One entry per (user, achievement); the first game id wins.
+    requested: Dict[Tuple[int, int], Optional[int]] = {}
+    for user_id, achievement_id, game_id in unlocks:
+        requested.setdefault((user_id, achievement_id), game_id)
+    if not requested:
+        return []
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            WITH requested AS (
+                SELECT * FROM unnest(%s::int[], %s::int[], %s::int[]) AS r(user_id, achievement_id, game_id)
+            ), inserted AS (
+                INSERT INTO user_achievements (user_id, achievement_id, game_id, unlocked_at)
+                SELECT r.user_id, r.achievement_id, r.game_id, CURRENT_TIMESTAMP
+                FROM requested r
+                JOIN users u ON u.id = r.user_id
+                JOIN achievements a ON a.id = r.achievement_id
+                ON CONFLICT (user_id, achievement_id) DO NOTHING
+                RETURNING user_id, achievement_id, game_id, unlocked_at
+            )
+            SELECT i.user_id, i.achievement_id, i.game_id, i.unlocked_at, a.name, a.points, a.icon
+            FROM inserted i
+            JOIN achievements a ON a.id = i.achievement_id
+            ORDER BY i.user_id, i.achievement_id
+        """, (
+            [user_id for user_id, _ in requested],
+            [achievement_id for _, achievement_id in requested],
+            list(requested.values()),
+        ))
+        unlocked = await cursor.fetchall()
+    if unlocked:
+        await leaderboards.on_achievements_unlocked(db, [row['user_id'] for row in unlocked])
+    return unlocked
+
+
+async def unlock_earned(db, stats_by_user: Dict[int, dict], game_id: Optional[int] = None) -> Dict[int, List[dict]]:
+    """Evaluate ``RULES`` for each user's counters and unlock everything earned in one statement."""
+    ids = await achievement_ids(db)
+    unlocks = [
+        (user_id, ids[name], game_id)
+        for user_id, stats in stats_by_user.items()
+        for name in earned_achievements(stats)
+        if name in ids
+    ]
+    unlocked: Dict[int, List[dict]] = {}
+    for row in await unlock_many(db, unlocks):
+        unlocked.setdefault(row['user_id'], []).append(row)
+    return unlocked
+
+
+async def on_game_completed(db, game_id: int) -> Dict[int, List[dict]]:
+    """
+    Update counters for a newly completed game, then unlock whatever the
+    players now qualify for. Call once per game, after ``record_game_results``.
+    Returns ``{user_id: [newly unlocked achievements]}`` (users with none are omitted).
+    """
+    unlocked = await unlock_earned(db, await update_counters(db, game_id), game_id)
+    for user_id, rows in unlocked.items():
+        logger.info(f"User {user_id} unlocked {[row['name'] for row in rows]} in game {game_id}")
+    return unlocked
+
+
+async def rebuild_user_stats(db) -> int:
+    """
+    Recompute ``user_stats`` and ``user_partners`` from every completed game,
+    oldest first, then unlock anything the rebuilt counters qualify for.
+    Returns the number of games replayed. The caller commits.
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute("TRUNCATE user_stats, user_partners")
+        await cursor.execute("""
+            SELECT id FROM games WHERE is_complete = TRUE ORDER BY completed_at NULLS FIRST, id
+        """)
+        game_ids = [row[0] for row in await cursor.fetchall()]
+    for count, game_id in enumerate(game_ids, start=1):
+        await update_counters(db, game_id)
+        if count % 500 == 0:
+            logger.info(f"Replayed {count}/{len(game_ids)} games into user_stats")
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("SELECT * FROM user_stats")
+        all_stats = {stats['user_id']: stats for stats in await cursor.fetchall()}
+    await unlock_earned(db, all_stats)
+    return len(game_ids)
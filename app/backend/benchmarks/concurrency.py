@@ -0,0 +1,112 @@
+"""
+Concurrent-request throughput benchmark for the FastAPI backend.
+
+Fires a fixed mix of read requests (game state, players, games won/lost,
+achievements, leaderboards) at a running server from many concurrent clients
+and reports requests/second plus p50/p95/p99 latency.
+
+To compare the old blocking (psycopg2, sync ``def``) request path with the
+async one, run two servers against the same local Postgres and benchmark both:
+
+    # "before": previous commit in a separate worktree
+    git worktree add /tmp/golf-before <commit-before-async>
+    (cd /tmp/golf-before/app/backend && uvicorn main:app --port 8001)
+
+    # "after": this tree
+    uvicorn main:app --port 8000
+
+    python -m benchmarks.concurrency --base-url http://localhost:8001 --label before
+    python -m benchmarks.concurrency --base-url http://localhost:8000 --label after
+
+Run from ``app/backend``. Requires ``pip install -r benchmarks/requirements.txt``.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+def endpoint_mix(game_id: int, user_id: int) -> List[str]:
+    return [
+        f"/games/{game_id}/state",
+        f"/games/{game_id}/players",
+        f"/users/{user_id}/games-won",
+        f"/users/{user_id}/games-lost",
+        "/achievements",
+        f"/users/{user_id}/achievements",
+        "/leaderboards/weekly",
+        "/leaderboards/all_time",
+    ]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(base_url: str, concurrency: int, duration: float, game_id: int, user_id: int) -> dict:
+    paths = endpoint_mix(game_id, user_id)
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(worker: int, client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        i = worker
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(w, client) for w in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.fmean(latencies) * 1000) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--label", default="run", help="Name printed next to the results (e.g. before/after)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--game-id", type=int, default=1)
+    parser.add_argument("--user-id", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'label':<10} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for level in args.concurrency:
+        result = asyncio.run(run(args.base_url, level, args.duration, args.game_id, args.user_id))
+        print(
+            f"{args.label:<10} {level:>5} {result['throughput_rps']:>9.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
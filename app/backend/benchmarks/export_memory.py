@@ -0,0 +1,152 @@
+"""
+Memory use of the streaming export (export.py) on a large league.
+
+Fills a throwaway local database with ``--rows`` game_players rows (4 per
+game, plus results for completed games) if it has fewer, then exports them
+all and samples this process's resident set size after every chunk:
+
+- ``stream``: ``export.open_export``, a server-side cursor read
+  ``--fetch-size`` rows at a time, as ``GET /export/games`` does.
+- ``fetchall`` (with ``--compare-fetchall``): the same query through a
+  client-side cursor and ``fetchall()``, like the listing endpoints.
+
+Chunks are discarded after counting their bytes, standing in for the socket.
+
+    createdb golf_export
+    python -m benchmarks.export_memory --dsn postgresql://localhost/golf_export --init-schema \\
+        --rows 1000000 --format csv --gzip --compare-fetchall
+
+Run from ``app/backend``.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+from pathlib import Path
+
+from benchmarks.seed import _is_local
+from database import AsyncPool
+import export
+from serialization import configure_psycopg
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PLAYERS_PER_GAME = 4
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (Linux), falling back to the peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def fill(pool: AsyncPool, rows: int) -> None:
+    async with pool.connection() as db:
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT COUNT(*) FROM game_players")
+            have = (await cursor.fetchone())[0]
+            if have >= rows:
+                print(f"{have} game_players rows already present")
+                return
+            games = (rows - have + PLAYERS_PER_GAME - 1) // PLAYERS_PER_GAME
+            started = time.perf_counter()
+            await cursor.execute("""
+                INSERT INTO games (game_type, created_at, current_hole, num_holes, is_complete, completed_at, skin_value)
+                SELECT CASE WHEN n % 2 = 0 THEN 'wolf' ELSE 'skins' END::game_type_enum,
+                       now() - (n % 365) * interval '1 day', 18, 18, n % 50 <> 0,
+                       CASE WHEN n % 50 <> 0 THEN now() - (n % 365) * interval '1 day' + interval '4 hours' END,
+                       CASE WHEN n % 2 = 1 THEN 2 END
+                FROM generate_series(1, %s) AS n
+                RETURNING id
+            """, (games,))
+            game_ids = [row[0] for row in await cursor.fetchall()]
+            await cursor.execute("""
+                INSERT INTO game_players (game_id, name, email)
+                SELECT g.id, 'Player ' || p, 'player' || ((g.id * 7 + p) % 500) || '@export.test'
+                FROM unnest(%s::int[]) AS g(id), generate_series(1, %s) AS p
+            """, (game_ids, PLAYERS_PER_GAME))
+            await cursor.execute("""
+                INSERT INTO game_results (game_id, game_player_id, email, game_type, final_score, placement,
+                                          outcome, completed_at)
+                SELECT g.id, gp.id, gp.email, g.game_type, gp.id % 10,
+                       1 + (gp.id % 4), CASE WHEN gp.id % 4 = 0 THEN 'won' ELSE 'lost' END, g.completed_at
+                FROM games g JOIN game_players gp ON gp.game_id = g.id
+                WHERE g.id = ANY(%s) AND g.is_complete
+            """, (game_ids,))
+    print(f"Inserted {games} games ({games * PLAYERS_PER_GAME} players) in {time.perf_counter() - started:.1f}s")
+
+
+async def run_stream(pool: AsyncPool, fmt: str, compress: bool, fetch_size: int) -> dict:
+    before = peak = rss_mb()
+    sent = chunks = 0
+    started = time.perf_counter()
+    async for chunk in await export.open_export(pool, export.ExportFilter(), fmt, compress, fetch_size):
+        sent += len(chunk)
+        chunks += 1
+        peak = max(peak, rss_mb())
+    return {"seconds": time.perf_counter() - started, "bytes": sent, "chunks": chunks,
+            "rss_before": before, "rss_peak": peak, "rss_after": rss_mb()}
+
+
+async def run_fetchall(pool: AsyncPool, fmt: str) -> dict:
+    before = rss_mb()
+    started = time.perf_counter()
+    query, params = export.build_query(export.ExportFilter())
+    async with pool.connection() as db:
+        async with db.cursor() as cursor:
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+    body = export.ENCODERS[fmt](rows, True)
+    peak = rss_mb()
+    sent = len(body)
+    del rows, body
+    return {"seconds": time.perf_counter() - started, "bytes": sent, "chunks": 1,
+            "rss_before": before, "rss_peak": peak, "rss_after": rss_mb()}
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    pool = AsyncPool(args.dsn, min_size=1, max_size=2, acquire_timeout=30)
+    await pool.open()
+    try:
+        if args.init_schema:
+            async with pool.connection() as db:
+                await db.execute((BACKEND_DIR / "schema.sql").read_text())
+        await fill(pool, args.rows)
+        runs = [("stream", run_stream(pool, args.format, args.gzip, args.fetch_size))]
+        if args.compare_fetchall:
+            runs.append(("fetchall", run_fetchall(pool, args.format)))
+        print(f"{'mode':<9} {'seconds':>8} {'MB out':>8} {'chunks':>7} {'RSS before':>11} {'RSS peak':>9} {'RSS after':>10}")
+        for name, run in runs:
+            r = await run
+            print(f"{name:<9} {r['seconds']:>8.1f} {r['bytes'] / 2**20:>8.1f} {r['chunks']:>7} "
+                  f"{r['rss_before']:>10.0f}M {r['rss_peak']:>8.0f}M {r['rss_after']:>9.0f}M")
+    finally:
+        await pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Database to fill and export (default $BENCH_DATABASE_URL)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="game_players rows to have in the database")
+    parser.add_argument("--format", choices=sorted(export.FORMATS), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--fetch-size", type=int, default=export.FETCH_SIZE)
+    parser.add_argument("--compare-fetchall", action="store_true", help="Also export with fetchall() for comparison")
+    parser.add_argument("--init-schema", action="store_true", help="Create the schema in an empty database first")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a database that is not on localhost")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("pass --dsn or set BENCH_DATABASE_URL")
+    if not _is_local(args.dsn) and not args.allow_remote:
+        parser.error("refusing to fill a non-local database without --allow-remote")
+    configure_psycopg()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
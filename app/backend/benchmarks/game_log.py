@@ -0,0 +1,192 @@
+"""
+Game log benchmark: write cost per event and reconstruction latency.
+
+A synthetic game of ``--players`` on ``--holes`` (per hole: a partner pick,
+a score per player, an advance; long games loop round the course again,
+correcting earlier scores) is played out event by event. Without a
+database it reports, per game length:
+
+- bytes written per change: the whole state (as ``PATCH /games/{id}/state``
+  sends and stores it), the ``patch`` event logged for such a write
+  (``game_log.diff_ops``) and one client event payload
+- rebuilding the final state by replaying every event from the start against
+  the latest snapshot plus its tail (at most ``GAME_LOG_SNAPSHOT_EVERY - 1``
+  events), as ``game_log.state_at`` does
+
+With ``--dsn`` it also times the same writes against a throwaway local
+database: a whole-state ``UPDATE`` per change against ``append_events`` with
+one event, and ``state_at`` for the latest and the middle event.
+
+    python -m benchmarks.game_log --events 250 2550 25050
+    python -m benchmarks.game_log --events 2000 --dsn postgresql://localhost/golf_bench --init-schema
+
+Run from ``app/backend``.
+"""
+import argparse
+import asyncio
+import copy
+import os
+import random
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from psycopg.types.json import Jsonb
+
+from benchmarks.seed import _is_local
+from database import AsyncPool
+import game_log
+import serialization
+from serialization import configure_psycopg
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def player_emails(players: int) -> List[str]:
+    return [f"player{p}@bench.test" for p in range(players)]
+
+
+def make_events(count: int, players: int, holes: int, seed: int = 1) -> List[dict]:
+    """``count`` client events for one game, cycling through the holes."""
+    rng = random.Random(seed)
+    emails = player_emails(players)
+    events: List[dict] = []
+    hole = 1
+    while len(events) < count:
+        wolf = emails[(hole - 1) % players]
+        events.append({"kind": "partner", "hole": hole, "wolf": wolf, "partner": emails[hole % players]})
+        for email in emails:
+            events.append({"kind": "score", "email": email, "hole": hole, "strokes": rng.randint(2, 8)})
+        events.append({"kind": "advance", "hole": hole % holes + 1})
+        hole = hole % holes + 1
+    return events[:count]
+
+
+def play(events: List[dict], holes: int, emails: List[str]) -> Tuple[List[dict], List[dict], List[int], List[int]]:
+    """
+    Apply ``events``; returns the logged rows, the snapshots taken, and the
+    state size and whole-state diff size after each event.
+    """
+    rows, snapshots, state_sizes, diff_sizes = [], [{"seq": 0, "current_hole": 0, "state": {}}], [], []
+    state, current_hole = {}, 0
+    for seq, event in enumerate(events, start=1):
+        kind, payload = game_log.validate_event(event, holes, emails)
+        before = copy.deepcopy(state)
+        state, current_hole = game_log.apply_event(state, current_hole, kind, payload)
+        rows.append({"seq": seq, "kind": kind, "payload": payload})
+        state_sizes.append(len(serialization.dumps(state)))
+        diff_sizes.append(len(serialization.dumps({"ops": game_log.diff_ops(before, state)})))
+        if seq % game_log.SNAPSHOT_EVERY == 0:
+            snapshots.append({"seq": seq, "current_hole": current_hole, "state": copy.deepcopy(state)})
+    return rows, snapshots, state_sizes, diff_sizes
+
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run_offline(args: argparse.Namespace) -> None:
+    print(f"{'events':>7} {'state B/write':>13} {'diff B/write':>12} {'event B/write':>13} {'full replay ms':>14} "
+          f"{'snapshot+tail ms':>16} {'tail':>5}")
+    for count in args.events:
+        events = make_events(count, args.players, args.holes, args.seed)
+        rows, snapshots, state_sizes, diff_sizes = play(events, args.holes, player_emails(args.players))
+        event_bytes = sum(len(serialization.dumps(row['payload'])) for row in rows) / len(rows)
+        latest = snapshots[-1]
+        tail = rows[latest['seq']:]
+        full = best_of(args.repeat, lambda: game_log.replay({}, 0, rows))
+        snap = best_of(args.repeat, lambda: game_log.replay(latest['state'], latest['current_hole'], tail))
+        assert game_log.replay({}, 0, rows) == game_log.replay(latest['state'], latest['current_hole'], tail)
+        print(f"{count:>7} {sum(state_sizes) / len(state_sizes):>13.0f} {sum(diff_sizes) / len(diff_sizes):>12.0f} "
+              f"{event_bytes:>13.0f} "
+              f"{full * 1000:>14.2f} {snap * 1000:>16.3f} {len(tail):>5}")
+
+
+async def new_game(db, players: int, holes: int) -> int:
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            INSERT INTO games (game_type, num_holes, state_json) VALUES ('wolf', %s, '{}'::jsonb) RETURNING id
+        """, (holes,))
+        game_id = (await cursor.fetchone())[0]
+        await cursor.executemany(
+            "INSERT INTO game_players (game_id, name, email) VALUES (%s, %s, %s)",
+            [(game_id, f"Player {p}", email) for p, email in enumerate(player_emails(players))],
+        )
+    return game_id
+
+
+async def run_database(args: argparse.Namespace) -> None:
+    pool = AsyncPool(args.dsn, min_size=1, max_size=2, acquire_timeout=30)
+    await pool.open()
+    try:
+        if args.init_schema:
+            async with pool.connection() as db:
+                await db.execute((BACKEND_DIR / "schema.sql").read_text())
+        print(f"{'events':>7} {'state UPDATE ms':>15} {'append ms':>10} {'state_at end ms':>15} {'state_at mid ms':>15}")
+        for count in args.events:
+            events = make_events(count, args.players, args.holes, args.seed)
+            async with pool.connection() as db:
+                full_game = await new_game(db, args.players, args.holes)
+                log_game = await new_game(db, args.players, args.holes)
+
+            emails = player_emails(args.players)
+            state, current_hole = {}, 0
+            started = time.perf_counter()
+            for event in events:
+                kind, payload = game_log.validate_event(event, args.holes, emails)
+                state, current_hole = game_log.apply_event(state, current_hole, kind, payload)
+                async with pool.connection() as db:
+                    await db.execute("""
+                        UPDATE games SET state_json = %s, current_hole = %s, state_version = state_version + 1,
+                                         state_updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s
+                    """, (Jsonb(state), current_hole, full_game))
+            full = (time.perf_counter() - started) / count
+
+            started = time.perf_counter()
+            for event in events:
+                async with pool.connection() as db:
+                    await game_log.append_events(db, log_game, [event])
+            append = (time.perf_counter() - started) / count
+
+            async with pool.connection() as db:
+                started = time.perf_counter()
+                latest = await game_log.state_at(db, log_game)
+                end = time.perf_counter() - started
+                started = time.perf_counter()
+                await game_log.state_at(db, log_game, count // 2)
+                mid = time.perf_counter() - started
+            assert latest['state_json'] == state, "replayed state differs from the written one"
+            print(f"{count:>7} {full * 1000:>15.2f} {append * 1000:>10.2f} {end * 1000:>15.2f} {mid * 1000:>15.2f}")
+    finally:
+        await pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, nargs="+", default=[250, 2550, 25050], help="Game lengths to try")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--holes", type=int, default=18)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Also time writes and replays against this database (default $BENCH_DATABASE_URL)")
+    parser.add_argument("--init-schema", action="store_true", help="Create the schema in an empty database first")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a database that is not on localhost")
+    args = parser.parse_args()
+
+    run_offline(args)
+    if args.dsn:
+        if not _is_local(args.dsn) and not args.allow_remote:
+            parser.error("refusing to write to a non-local database without --allow-remote")
+        configure_psycopg()
+        asyncio.run(run_database(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Per-hole score rows: correctness checks and sync cost against a throwaway local database.
+
+- Writes a wolf game whose ``players[].scores`` hold points per hole (0-2, as
+  the wolf screen stores them) next to a six-six-six game whose
+  ``players[].scores`` hold strokes, syncs both with ``hole_scores.sync_games``
+  and checks that only the strokes became ``hole_scores.strokes``: the wolf
+  rows carry just the ``points``.
+- Enters a skins game score by score, syncing after each one either every
+  hole or just the hole written (as the state endpoints do), and reports the
+  time per sync and the rows each one wrote. Both end with the rows a full
+  sync from scratch produces.
+
+    python -m benchmarks.hole_scores --dsn postgresql://localhost/golf_bench --init-schema
+
+Run from ``app/backend``.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from benchmarks.seed import _is_local
+from database import AsyncPool
+import hole_scores
+from serialization import configure_psycopg
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def player_emails(players: int) -> List[str]:
+    return [f"player{p}@bench.test" for p in range(players)]
+
+
+def wolf_state(emails: List[str], holes: int, rng: random.Random) -> dict:
+    """A wolf state as the frontend writes it: points per hole in both ``players[].scores`` and ``points``."""
+    points = {email: [rng.choice((0, 1, 2)) for _ in range(holes)] for email in emails}
+    return {
+        "players": [{"name": email, "email": email, "scores": points[email]} for email in emails],
+        "points": points,
+    }
+
+
+def stroke_state(emails: List[str], holes: int, rng: random.Random) -> dict:
+    return {"players": [{"name": email, "email": email, "scores": [rng.randint(1, 8) for _ in range(holes)]}
+                        for email in emails]}
+
+
+async def new_game(db, game_type: str, holes: int, emails: List[str], state: dict) -> int:
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            INSERT INTO games (game_type, num_holes, state_json, is_complete) VALUES (%s, %s, %s, TRUE) RETURNING id
+        """, (game_type, holes, Jsonb(state)))
+        game_id = (await cursor.fetchone())[0]
+        await cursor.executemany(
+            "INSERT INTO game_players (game_id, name, email) VALUES (%s, %s, %s)",
+            [(game_id, email, email) for email in emails],
+        )
+    return game_id
+
+
+async def rows_by_email(db, game_id: int) -> Dict[str, List[dict]]:
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT gp.email, hs.hole, hs.strokes, hs.points
+            FROM hole_scores hs JOIN game_players gp ON gp.id = hs.game_player_id
+            WHERE hs.game_id = %s
+            ORDER BY gp.email, hs.hole
+        """, (game_id,))
+        rows: Dict[str, List[dict]] = {}
+        for row in await cursor.fetchall():
+            rows.setdefault(row['email'], []).append(row)
+    return rows
+
+
+async def check_wolf_points(pool, args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    emails = player_emails(args.players)
+    wolf = wolf_state(emails, args.holes, rng)
+    strokes = stroke_state(emails, args.holes, rng)
+    async with pool.connection() as db:
+        wolf_game = await new_game(db, 'wolf', args.holes, emails, wolf)
+        stroke_game = await new_game(db, 'sixsixsix', args.holes, emails, strokes)
+        await hole_scores.sync_games(db, [wolf_game, stroke_game])
+        wolf_rows = await rows_by_email(db, wolf_game)
+        stroke_rows = await rows_by_email(db, stroke_game)
+
+    for email in emails:
+        assert all(row['strokes'] is None for row in wolf_rows[email]), f"wolf points stored as strokes for {email}"
+        assert [float(row['points']) for row in wolf_rows[email]] == wolf['points'][email]
+        expected = next(p['scores'] for p in strokes['players'] if p['email'] == email)
+        assert [row['strokes'] for row in stroke_rows[email]] == expected
+    print(f"wolf game {wolf_game}: {sum(map(len, wolf_rows.values()))} rows, points only; "
+          f"sixsixsix game {stroke_game}: strokes from players[].scores")
+
+
+async def hole_rows(db, game_id: int) -> List[tuple]:
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            SELECT game_player_id, hole, strokes, par, points, xmin::text::bigint FROM hole_scores
+            WHERE game_id = %s ORDER BY game_player_id, hole
+        """, (game_id,))
+        return await cursor.fetchall()
+
+
+async def time_score_entry(pool, args: argparse.Namespace, targeted: bool) -> None:
+    rng = random.Random(args.seed)
+    emails = player_emails(args.players)
+    state = {"scores": {email: [0] * args.holes for email in emails}, "skins": [], "total_winnings": {},
+             "pars": [rng.choice((3, 4, 4, 5)) for _ in range(args.holes)]}
+    async with pool.connection() as db:
+        game_id = await new_game(db, 'skins', args.holes, emails, state)
+    elapsed, written = 0.0, 0
+    for hole in range(1, args.holes + 1):
+        for email in emails:
+            async with pool.connection() as db:
+                await db.execute("""
+                    UPDATE games SET state_json = jsonb_set(state_json, %s, %s) WHERE id = %s
+                """, (['scores', email, str(hole - 1)], Jsonb(rng.randint(2, 8)), game_id))
+                before = {row[:2]: row[5] for row in await hole_rows(db, game_id)}
+                started = time.perf_counter()
+                await hole_scores.sync_games(db, [game_id], [hole] if targeted else None)
+                elapsed += time.perf_counter() - started
+                written += sum(1 for row in await hole_rows(db, game_id) if before.get(row[:2]) != row[5])
+    async with pool.connection() as db:
+        synced = [row[:5] for row in await hole_rows(db, game_id)]
+        await db.execute("DELETE FROM hole_scores WHERE game_id = %s", (game_id,))
+        await hole_scores.sync_games(db, [game_id])
+        assert synced == [row[:5] for row in await hole_rows(db, game_id)], "incremental sync drifted from a full one"
+    writes = args.holes * len(emails)
+    print(f"{'touched hole' if targeted else 'every hole':>12} {elapsed / writes * 1000:>8.2f} {written / writes:>12.1f}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    pool = AsyncPool(args.dsn, min_size=1, max_size=2, acquire_timeout=30)
+    await pool.open()
+    try:
+        if args.init_schema:
+            async with pool.connection() as db:
+                await db.execute((BACKEND_DIR / "schema.sql").read_text())
+        await check_wolf_points(pool, args)
+        print(f"{'sync':>12} {'ms/write':>8} {'rows/write':>12}")
+        for targeted in (False, True):
+            await time_score_entry(pool, args, targeted)
+    finally:
+        await pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--holes", type=int, default=18)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Database to write the games to (default $BENCH_DATABASE_URL)")
+    parser.add_argument("--init-schema", action="store_true", help="Create the schema in an empty database first")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a database that is not on localhost")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("--dsn (or $BENCH_DATABASE_URL) is required")
+    if not _is_local(args.dsn) and not args.allow_remote:
+        parser.error("refusing to write to a non-local database without --allow-remote")
+    configure_psycopg()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+JSON serialization benchmark for large game states.
+
+Times the conversions one game-state round trip goes through, for the old
+and the current pipeline, on synthetic skins and wolf states:
+
+- ``write``: turning the state into the JSONB parameter
+  (``json.dumps`` vs. the orjson dumper ``Jsonb(...)`` now uses).
+- ``read``: decoding the JSONB text psycopg receives (``json.loads`` vs. orjson).
+- ``response``: rendering ``GET /games/{id}/state`` (``jsonable_encoder`` +
+  Starlette's ``JSONResponse`` vs. ``FastJSONResponse`` alone).
+
+No database or server is involved. Run from ``app/backend``:
+
+    python -m benchmarks.json_serialization --players 4 8 16 --holes 18 72 --repeat 200
+"""
+import argparse
+import json
+import random
+import time
+from decimal import Decimal
+from typing import Callable, Dict, List, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.concurrency import percentile
+import serialization
+
+
+def skins_state(players: int, holes: int) -> dict:
+    emails = [f"player{n}@example.com" for n in range(players)]
+    scores = {email: [random.randint(2, 8) for _ in range(holes)] for email in emails}
+    skins = []
+    for hole in range(holes):
+        winner = random.choice(emails + [None])
+        skins.append({"hole": hole + 1, "winner": winner, "carryover": winner is None, "value": random.randint(0, 5)})
+    return {
+        "scores": scores,
+        "skins": skins,
+        "total_winnings": {email: random.randint(0, 50) for email in emails},
+        "pars": [random.choice((3, 4, 4, 5)) for _ in range(holes)],
+    }
+
+
+def wolf_state(players: int, holes: int) -> dict:
+    emails = [f"player{n}@example.com" for n in range(players)]
+    return {
+        "points": {email: [random.randint(-2, 4) for _ in range(holes)] for email in emails},
+        "holes": [
+            {
+                "hole": hole + 1,
+                "wolf": emails[hole % players],
+                "partner": random.choice(emails + [None]),
+                "lone_wolf": random.random() < 0.2,
+                "strokes": {email: random.randint(2, 8) for email in emails},
+            }
+            for hole in range(holes)
+        ],
+        "rotation": emails,
+    }
+
+
+def _response_payload(state: dict) -> dict:
+    return {"current_hole": 18, "state_json": state, "game_type": "skins", "is_complete": False,
+            "num_holes": 18, "version": 42, "skin_value": Decimal("2.50")}
+
+
+def _old_response(payload: dict) -> bytes:
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def _new_response(payload: dict) -> bytes:
+    return serialization.FastJSONResponse(content=payload).body
+
+
+def _time(fn: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def run(game_type: str, players: int, holes: int, repeat: int) -> Tuple[int, Dict[str, Dict[str, float]]]:
+    """State size in bytes and median milliseconds per step for the old and new pipeline."""
+    state = skins_state(players, holes) if game_type == 'skins' else wolf_state(players, holes)
+    text = json.dumps(state)
+    payload = _response_payload(state)
+    cases = {
+        "write": (lambda: json.dumps(state), lambda: serialization.dumps(state)),
+        "read": (lambda: json.loads(text), lambda: serialization.loads(text)),
+        "response": (lambda: _old_response(payload), lambda: _new_response(payload)),
+    }
+    results = {}
+    for name, (old, new) in cases.items():
+        old_ms = sorted(_time(old, repeat))
+        new_ms = sorted(_time(new, repeat))
+        results[name] = {"old": percentile(old_ms, 50), "new": percentile(new_ms, 50)}
+    return len(text), results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--game-types", nargs="+", default=["skins", "wolf"], choices=["skins", "wolf"])
+    parser.add_argument("--players", nargs="+", type=int, default=[4, 8, 16])
+    parser.add_argument("--holes", nargs="+", type=int, default=[18, 72])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'game':<6} {'players':>7} {'holes':>5} {'KiB':>6}  "
+          f"{'step':<9} {'old p50 ms':>10} {'new p50 ms':>10} {'speedup':>7}")
+    for game_type in args.game_types:
+        for players in args.players:
+            for holes in args.holes:
+                size, results = run(game_type, players, holes, args.repeat)
+                size /= 1024
+                for step, timing in results.items():
+                    speedup = timing["old"] / timing["new"] if timing["new"] else float("inf")
+                    print(f"{game_type:<6} {players:>7} {holes:>5} {size:>6.1f}  "
+                          f"{step:<9} {timing['old']:>10.3f} {timing['new']:>10.3f} {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Synthetic league data for benchmarks.
+
+Everything is generated from a seed, so two runs with the same arguments
+produce the same users, games and scores. States have the shape the app
+writes:
+
+- skins: ``scores`` (strokes per hole), ``skins`` (winner or carry-over per
+  hole), ``total_winnings`` and ``pars``.
+- wolf: ``scores``, per-hole ``points`` and ``pars``.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+PAR_CHOICES = (3, 4, 4, 4, 5)
+
+
+@dataclass
+class LeaguePlayer:
+    name: str
+    email: str
+    auth0_id: Optional[str] = None
+
+
+@dataclass
+class LeagueGame:
+    """Shaped like ``GameImport`` in main.py, so ``game_import.import_games`` accepts it."""
+    game_type: str
+    players: List[LeaguePlayer]
+    num_holes: int = 18
+    skin_value: Optional[float] = None
+    state_json: dict = field(default_factory=dict)
+    is_complete: bool = True
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    current_hole: Optional[int] = None
+
+
+def make_users(count: int) -> List[LeaguePlayer]:
+    return [
+        LeaguePlayer(name=f"Player {n:04d}", email=f"player{n:04d}@league.test", auth0_id=f"bench|{n:04d}")
+        for n in range(1, count + 1)
+    ]
+
+
+def make_pars(rng: random.Random, holes: int) -> List[int]:
+    return [rng.choice(PAR_CHOICES) for _ in range(holes)]
+
+
+def make_strokes(rng: random.Random, pars: List[int], handicap: float) -> List[int]:
+    """Strokes per hole around par; better players (lower ``handicap``) make more birdies."""
+    strokes = []
+    for par in pars:
+        delta = round(rng.gauss(handicap / 18, 1.0))
+        strokes.append(max(1, par + delta))
+    return strokes
+
+
+def skins_state(emails: List[str], scores: Dict[str, List[int]], pars: List[int],
+                skin_value: float, holes_played: int) -> dict:
+    skins = []
+    winnings = {email: 0.0 for email in emails}
+    carryover = 0
+    for hole in range(holes_played):
+        hole_scores = {email: scores[email][hole] for email in emails}
+        best = min(hole_scores.values())
+        winners = [email for email, score in hole_scores.items() if score == best]
+        if len(winners) == 1:
+            value = skin_value * (carryover + 1)
+            skins.append({"hole": hole + 1, "winner": winners[0], "carryover": False, "value": value})
+            winnings[winners[0]] += value
+            carryover = 0
+        else:
+            skins.append({"hole": hole + 1, "winner": None, "carryover": True, "value": 0})
+            carryover += 1
+    return {
+        "scores": {email: scores[email][:holes_played] for email in emails},
+        "skins": skins,
+        "total_winnings": winnings,
+        "pars": pars,
+    }
+
+
+def wolf_state(emails: List[str], scores: Dict[str, List[int]], pars: List[int], holes_played: int) -> dict:
+    points = {email: [] for email in emails}
+    for hole in range(holes_played):
+        wolf = emails[hole % len(emails)]
+        best = min(scores[email][hole] for email in emails)
+        wolf_won = scores[wolf][hole] == best
+        for email in emails:
+            if email == wolf:
+                points[email].append(2 if wolf_won else 0)
+            else:
+                points[email].append(0 if wolf_won else 1)
+    return {
+        "scores": {email: scores[email][:holes_played] for email in emails},
+        "points": points,
+        "pars": pars,
+    }
+
+
+def make_game(rng: random.Random, users: List[LeaguePlayer], handicaps: Dict[str, float],
+              players_per_game: int, holes: int, played_at: datetime, complete: bool = True) -> LeagueGame:
+    game_type = rng.choice(('skins', 'wolf'))
+    players = rng.sample(users, min(players_per_game, len(users)))
+    emails = [p.email for p in players]
+    pars = make_pars(rng, holes)
+    scores = {p.email: make_strokes(rng, pars, handicaps[p.email]) for p in players}
+    holes_played = holes if complete else rng.randint(1, holes - 1)
+    skin_value = None
+    if game_type == 'skins':
+        skin_value = float(rng.choice((1, 2, 5)))
+        state = skins_state(emails, scores, pars, skin_value, holes_played)
+    else:
+        state = wolf_state(emails, scores, pars, holes_played)
+    return LeagueGame(
+        game_type=game_type,
+        players=players,
+        num_holes=holes,
+        skin_value=skin_value,
+        state_json=state,
+        is_complete=complete,
+        created_at=played_at,
+        completed_at=played_at + timedelta(hours=4) if complete else None,
+        current_hole=holes if complete else holes_played,
+    )
+
+
+def make_league(users: int, games: int, in_progress: int, players_per_game: int = 4,
+                holes: int = 18, days: int = 365, seed: int = 1) -> tuple:
+    """
+    ``(users, games)`` for a league of ``users`` players who played ``games``
+    completed games over the last ``days`` days, plus ``in_progress`` games
+    still being played today.
+    """
+    rng = random.Random(seed)
+    league_users = make_users(users)
+    handicaps = {u.email: rng.uniform(0, 24) for u in league_users}
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    played = sorted(start + timedelta(seconds=rng.uniform(0, days * 86400)) for _ in range(games))
+    league_games = [make_game(rng, league_users, handicaps, players_per_game, holes, at) for at in played]
+    league_games += [
+        make_game(rng, league_users, handicaps, players_per_game, holes, now - timedelta(hours=1), complete=False)
+        for _ in range(in_progress)
+    ]
+    return league_users, league_games
@@ -0,0 +1,142 @@
+"""
+Seed a local Postgres with a synthetic league for benchmarking.
+
+Creates users, completed wolf/skins games with realistic ``state_json``
+(through the same ``COPY`` path as ``POST /games/import``), some in-progress
+games for score-entry load, and then rebuilds leaderboards and achievement
+counters, unlocking achievements along the way. A manifest with the ids and
+emails the load generator needs is written to ``--manifest``.
+
+Use a throwaway database: ``--reset`` empties every app table first.
+
+    createdb golf_bench
+    python -m benchmarks.seed --dsn postgresql://localhost/golf_bench --init-schema \\
+        --users 200 --games 5000 --in-progress 50
+
+Run from ``app/backend``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import psycopg
+
+from benchmarks.league import make_league
+import achievements
+import game_import
+import leaderboards
+from serialization import configure_psycopg
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MANIFEST = Path(__file__).resolve().parent / "results" / "league.json"
+
+APP_TABLES = (
+    "user_achievements", "leaderboard_cache", "leaderboard_boards", "user_daily_stats", "user_stats", "user_partners",
+    "game_results", "game_standings", "hole_scores", "game_events", "game_snapshots", "game_players", "games", "users", "job_queue", "job_dead_letter", "ws_message_spill",
+)
+
+
+def _is_local(dsn: str) -> bool:
+    host = urlparse(dsn).hostname
+    return host in (None, "", "localhost", "127.0.0.1", "::1")
+
+
+async def seed(args: argparse.Namespace) -> dict:
+    users, games = make_league(
+        users=args.users, games=args.games, in_progress=args.in_progress,
+        players_per_game=args.players_per_game, holes=args.holes, days=args.days, seed=args.seed,
+    )
+    async with await psycopg.AsyncConnection.connect(args.dsn) as db:
+        if args.init_schema:
+            await db.execute((BACKEND_DIR / "schema.sql").read_text())
+            await db.execute((BACKEND_DIR / "achievements_data.sql").read_text())
+            await db.commit()
+        if args.reset:
+            await db.execute(f"TRUNCATE {', '.join(APP_TABLES)} RESTART IDENTITY CASCADE")
+            await db.commit()
+
+        started = time.perf_counter()
+        async with db.cursor() as cursor:
+            async with cursor.copy("COPY users (name, email, auth0_id) FROM STDIN") as copy:
+                for user in users:
+                    await copy.write_row((user.name, user.email, user.auth0_id))
+            await cursor.execute("SELECT id, email FROM users WHERE email = ANY(%s)", ([u.email for u in users],))
+            user_ids = {email: user_id for user_id, email in await cursor.fetchall()}
+        await db.commit()
+        print(f"Inserted {len(users)} users in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        game_ids = []
+        for offset in range(0, len(games), game_import.MAX_IMPORT_GAMES):
+            batch = games[offset:offset + game_import.MAX_IMPORT_GAMES]
+            game_ids += await game_import.import_games(db, batch)
+            await db.commit()
+        # We rebuild right below; the import's own rebuild job would only repeat it.
+        await db.execute("DELETE FROM job_queue WHERE kind = 'games.imported'")
+        await db.commit()
+        print(f"Imported {len(games)} games in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        await leaderboards.rebuild_all(db)
+        replayed = await achievements.rebuild_user_stats(db)
+        await db.commit()
+        print(f"Rebuilt leaderboards and achievements ({replayed} games) in {time.perf_counter() - started:.1f}s")
+
+    in_progress = [
+        {
+            "game_id": game_id,
+            "game_type": game.game_type,
+            "num_holes": game.num_holes,
+            "skin_value": game.skin_value,
+            "emails": [p.email for p in game.players],
+            "pars": game.state_json["pars"],
+        }
+        for game_id, game in zip(game_ids, games)
+        if not game.is_complete
+    ]
+    return {
+        "seed": args.seed,
+        "users": [{"user_id": user_ids[u.email], "email": u.email, "name": u.name, "auth0_id": u.auth0_id}
+                  for u in users],
+        "completed_game_ids": [game_id for game_id, game in zip(game_ids, games) if game.is_complete],
+        "in_progress_games": in_progress,
+        "holes": args.holes,
+        "players_per_game": args.players_per_game,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Database to fill (default $BENCH_DATABASE_URL)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--games", type=int, default=2000, help="Completed games")
+    parser.add_argument("--in-progress", type=int, default=50, help="Games still being played")
+    parser.add_argument("--players-per-game", type=int, default=4)
+    parser.add_argument("--holes", type=int, default=18)
+    parser.add_argument("--days", type=int, default=365, help="Spread completed games over this many days")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--init-schema", action="store_true", help="Create the schema in an empty database first")
+    parser.add_argument("--reset", action="store_true", help="Empty every app table first")
+    parser.add_argument("--allow-remote", action="store_true", help="Allow a database that is not on localhost")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("pass --dsn or set BENCH_DATABASE_URL")
+    if not _is_local(args.dsn) and not args.allow_remote:
+        parser.error("refusing to seed a non-local database without --allow-remote")
+
+    configure_psycopg()
+    manifest = asyncio.run(seed(args))
+    args.manifest.parent.mkdir(parents=True, exist_ok=True)
+    args.manifest.write_text(json.dumps(manifest, indent=1))
+    print(f"Manifest written to {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
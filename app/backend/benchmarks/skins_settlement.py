@@ -0,0 +1,92 @@
+"""
+Skins settlement benchmark.
+
+Settles the completed skins games of a synthetic league (benchmarks/league.py)
+three ways:
+
+- ``dict loop``: the algorithm ``GET /games/{id}/skins`` used before skins.py,
+  a dict of scores per hole and a ``defaultdict`` tally.
+- ``matrix``: ``skins.settle_state``, column-wise over a players x holes matrix.
+- ``cached``: ``skins.settle_game`` again for the same state versions, i.e. a
+  season report or skins request after nothing changed.
+
+No database or server is involved. Run from ``app/backend``:
+
+    python -m benchmarks.skins_settlement --games 5000 --players 4 8 --holes 18 --repeat 5
+"""
+import argparse
+import time
+from collections import defaultdict
+from typing import Callable, List
+
+from benchmarks.league import make_league
+import skins
+
+
+def dict_loop(state: dict, skin_value: float) -> dict:
+    scores = state.get('scores', {})
+    num_holes = len(next(iter(scores.values())))
+    emails = list(scores.keys())
+    results = []
+    carryover = 0
+    for h in range(num_holes):
+        hole_scores = {email: scores[email][h] for email in emails}
+        min_score = min(hole_scores.values())
+        winners = [email for email, score in hole_scores.items() if score == min_score]
+        if len(winners) == 1:
+            results.append({'hole': h + 1, 'winner': winners[0], 'value': skin_value * (carryover + 1)})
+            carryover = 0
+        else:
+            results.append({'hole': h + 1, 'winner': None, 'value': 0})
+            carryover += 1
+    player_totals = defaultdict(lambda: {'skins': 0, 'winnings': 0})
+    for skin in results:
+        if skin['winner']:
+            player_totals[skin['winner']]['skins'] += 1
+            player_totals[skin['winner']]['winnings'] += skin['value']
+    return {'skins': results, 'player_totals': player_totals}
+
+
+def best_of(repeat: int, run: Callable[[], None]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--players", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--holes", type=int, nargs="+", default=[18])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'players':>7} {'holes':>5} {'games':>6} {'dict loop ms':>12} {'matrix ms':>10} {'cached ms':>10} {'speedup':>8}")
+    for players in args.players:
+        for holes in args.holes:
+            _, games = make_league(users=max(players * 10, 50), games=args.games, in_progress=0,
+                                   players_per_game=players, holes=holes, seed=args.seed)
+            season: List[tuple] = [(game_id, g.state_json, g.skin_value) for game_id, g in enumerate(games)
+                                   if g.game_type == 'skins']
+            for _, state, skin_value in season:
+                expected = dict_loop(state, skin_value)
+                settled = skins.settle_state(state, skin_value)
+                assert settled.skins == expected['skins'] and settled.player_totals == dict(expected['player_totals'])
+
+            loop = best_of(args.repeat, lambda: [dict_loop(state, value) for _, state, value in season])
+            matrix = best_of(args.repeat, lambda: [skins.settle_state(state, value) for _, state, value in season])
+            skins.settlement_cache.clear()
+            for game_id, state, value in season:
+                skins.settle_game(game_id, 1, state, value)
+            cached = best_of(args.repeat, lambda: [skins.settle_game(game_id, 1, state, value)
+                                                    for game_id, state, value in season])
+            print(f"{players:>7} {holes:>5} {len(season):>6} {loop * 1000:>12.1f} {matrix * 1000:>10.1f} "
+                  f"{cached * 1000:>10.2f} {loop / matrix:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cross-worker websocket delivery latency through the Postgres backplane.
+
+Starts two backplanes in one process, each with its own ``ConnectionManager``,
+standing in for two uvicorn workers. Simulated sockets are connected to
+worker B only; messages are published on worker A and the script measures
+how long they take to reach B's sockets. Bursts show the effect of
+coalescing: notifications sent versus messages published.
+
+Needs a reachable Postgres with ``migrations/005_ws_message_spill.sql``
+applied (``DATABASE_URL`` from ``.env`` by default). Run from ``app/backend``:
+
+    python -m benchmarks.websocket_backplane --messages 500 --burst 1 8 32
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from benchmarks.concurrency import percentile
+from benchmarks.websocket_fanout import FakeSocket
+from database import pool_from_env
+from websocket_backplane import PostgresBackplane
+from websocket_manager import ConnectionManager
+
+GAME_ID = 1
+
+
+async def run(dsn: str, sockets: int, messages: int, burst: int, coalesce_ms: float, size: int) -> dict:
+    pool = pool_from_env(dsn)
+    await pool.open()
+    worker_a = PostgresBackplane(dsn, ConnectionManager(), pool, channel="bench_game_updates",
+                                 coalesce_window=coalesce_ms / 1000)
+    worker_b = PostgresBackplane(dsn, ConnectionManager(), pool, channel="bench_game_updates",
+                                 coalesce_window=coalesce_ms / 1000)
+    await worker_a.start()
+    await worker_b.start()
+    receivers: List[FakeSocket] = [FakeSocket(delay_ms=0, jitter_ms=0) for _ in range(sockets)]
+    for sock in receivers:
+        await worker_b.manager.connect(GAME_ID, sock)
+    # Give both listeners time to LISTEN before publishing.
+    await asyncio.sleep(0.5)
+
+    filler = "x" * size
+    sent_at: Dict[int, float] = {}
+    try:
+        for seq in range(messages):
+            sent_at[seq] = time.perf_counter()
+            await worker_a.publish(GAME_ID, {"seq": seq, "hole": seq % 18 + 1, "note": filler})
+            if (seq + 1) % burst == 0:
+                await asyncio.sleep(0.01)
+        await asyncio.sleep(1.0)
+    finally:
+        stats_a = worker_a.stats()
+        await worker_a.stop()
+        await worker_b.stop()
+        await worker_a.manager.close()
+        await worker_b.manager.close()
+        await pool.close()
+
+    latencies = []
+    lost = 0
+    for sock in receivers:
+        for seq, started in sent_at.items():
+            if seq in sock.received:
+                latencies.append(sock.received[seq] - started)
+            else:
+                lost += 1
+    latencies.sort()
+    return {
+        "notifications": stats_a["notifications_sent"],
+        "spilled": stats_a["messages_spilled"],
+        "lost": lost,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--sockets", type=int, default=50, help="Sockets connected to the receiving worker")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--burst", type=int, nargs="+", default=[1, 8, 32], help="Messages published back to back")
+    parser.add_argument("--coalesce-ms", type=float, default=5.0)
+    parser.add_argument("--size", type=int, default=200, help="Approximate message size in bytes")
+    args = parser.parse_args()
+
+    print(f"{'burst':>5} {'messages':>8} {'notifies':>8} {'spilled':>7} {'p50 ms':>8} {'p99 ms':>8} {'lost':>6}")
+    for burst in args.burst:
+        result = asyncio.run(run(args.dsn, args.sockets, args.messages, burst, args.coalesce_ms, args.size))
+        print(
+            f"{burst:>5} {args.messages:>8} {result['notifications']:>8} {result['spilled']:>7} "
+            f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['lost']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+WebSocket broadcast fan-out benchmark.
+
+Connects hundreds of simulated sockets to one game, a few of which are slow
+(a phone on bad course Wi-Fi) and a few of which are dead (sends raise), then
+broadcasts a stream of score updates and reports the broadcast-to-delivered
+latency seen by the healthy sockets.
+
+Two strategies are compared on the same socket population:
+- ``sequential``: the previous ``ConnectionManager.broadcast`` behaviour, one
+  ``await send`` after another (a dead socket aborts the broadcast).
+- ``queued``: the current manager, with per-connection queues and writers.
+
+Sockets are in-process fakes whose ``send_text`` sleeps for a simulated
+network delay, so the numbers isolate the fan-out strategy from uvicorn and
+the network. Run from ``app/backend``:
+
+    python -m benchmarks.websocket_fanout --sockets 100 300 500 --slow 3 --dead 2
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+from benchmarks.concurrency import percentile
+from websocket_manager import ConnectionManager
+
+
+class FakeSocket:
+    """Stands in for ``fastapi.WebSocket``; records when each message arrived."""
+
+    def __init__(self, delay_ms: float, jitter_ms: float, dead: bool = False) -> None:
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.dead = dead
+        self.healthy = True
+        self.received: Dict[int, float] = {}
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, text: str) -> None:
+        if self.dead:
+            raise ConnectionResetError("peer went away")
+        await asyncio.sleep(max(0.0, random.gauss(self.delay_ms, self.jitter_ms)) / 1000)
+        self.received[json.loads(text)["seq"]] = time.perf_counter()
+
+    async def send_json(self, message: dict) -> None:
+        await self.send_text(json.dumps(message))
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def make_sockets(count: int, slow: int, dead: int, slow_ms: float) -> List[FakeSocket]:
+    sockets = [FakeSocket(delay_ms=2, jitter_ms=1) for _ in range(count - slow - dead)]
+    for _ in range(slow):
+        sock = FakeSocket(delay_ms=slow_ms, jitter_ms=slow_ms / 10)
+        sock.healthy = False
+        sockets.append(sock)
+    for _ in range(dead):
+        sock = FakeSocket(delay_ms=0, jitter_ms=0, dead=True)
+        sock.healthy = False
+        sockets.append(sock)
+    random.shuffle(sockets)
+    return sockets
+
+
+async def sequential_broadcast(sockets: List[FakeSocket], message: dict) -> None:
+    for sock in sockets:
+        await sock.send_json(message)
+
+
+async def run(strategy: str, sockets: List[FakeSocket], messages: int, interval_ms: float) -> dict:
+    manager = ConnectionManager(queue_size=32, send_timeout=1.0)
+    if strategy == "queued":
+        for sock in sockets:
+            await manager.connect(1, sock)
+
+    sent_at: Dict[int, float] = {}
+    failed_broadcasts = 0
+    for seq in range(messages):
+        message = {"seq": seq, "hole": seq % 18 + 1, "scores": {"player@example.com": seq}}
+        sent_at[seq] = time.perf_counter()
+        try:
+            if strategy == "queued":
+                await manager.broadcast(1, message)
+            else:
+                await sequential_broadcast(sockets, message)
+        except Exception:
+            failed_broadcasts += 1
+        await asyncio.sleep(interval_ms / 1000)
+    # Let the writers drain before measuring.
+    await asyncio.sleep(0.5)
+
+    latencies = []
+    undelivered = 0
+    for sock in sockets:
+        if not sock.healthy:
+            continue
+        for seq, started in sent_at.items():
+            if seq in sock.received:
+                latencies.append(sock.received[seq] - started)
+            else:
+                undelivered += 1
+    latencies.sort()
+    stats = manager.stats()
+    await manager.close()
+    return {
+        "deliveries": len(latencies),
+        "undelivered": undelivered,
+        "failed_broadcasts": failed_broadcasts,
+        "evicted": stats["slow_consumer_evictions"] + stats["dead_socket_removals"],
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, nargs="+", default=[100, 300, 500], help="Sockets in the game")
+    parser.add_argument("--slow", type=int, default=3, help="Slow consumers among them")
+    parser.add_argument("--dead", type=int, default=2, help="Dead sockets among them")
+    parser.add_argument("--slow-ms", type=float, default=1500, help="Per-send delay of a slow consumer")
+    parser.add_argument("--messages", type=int, default=50, help="Broadcasts per run")
+    parser.add_argument("--interval-ms", type=float, default=20, help="Pause between broadcasts")
+    parser.add_argument("--strategy", choices=["sequential", "queued", "both"], default="both")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    strategies = ["sequential", "queued"] if args.strategy == "both" else [args.strategy]
+    print(f"{'strategy':<11} {'sockets':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+          f"{'undelivered':>11} {'failed':>6} {'evicted':>7}")
+    for count in args.sockets:
+        for strategy in strategies:
+            random.seed(args.seed)
+            sockets = make_sockets(count, args.slow, args.dead, args.slow_ms)
+            result = asyncio.run(run(strategy, sockets, args.messages, args.interval_ms))
+            print(
+                f"{strategy:<11} {count:>7} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                f"{result['max_ms']:>9.1f} {result['undelivered']:>11} {result['failed_broadcasts']:>6} "
+                f"{result['evicted']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Mixed-workload load test against a running backend seeded by ``benchmarks.seed``.
+
+Concurrent clients pick operations by weight for ``--duration`` seconds:
+
+    create_game     POST /games/ with 4 league players
+    update_state    PATCH /games/{id}/state, one more hole of an in-progress game
+    patch_state     PATCH /games/{id}/state/patch, one score
+    get_state       GET /games/{id}/state
+    games_won       GET /users/{email}/games-won
+    games_lost      GET /users/{email}/games-lost
+    history         GET /users/{id}/history
+    leaderboard     GET /leaderboards/{weekly|monthly|all_time}
+
+Meanwhile ``--ws-clients`` websockets join in-progress games, and one socket
+per game broadcasts ``--ws-rate`` messages a second; the other sockets
+report send-to-receive latency (``websocket``).
+
+For every operation it prints throughput and p50/p95/p99 latency, and saves
+the results with the git commit to ``--results-dir``. ``--compare`` checks
+against an earlier results file and exits non-zero if any p95 got worse by
+more than ``--threshold``:
+
+    python -m benchmarks.seed --dsn postgresql://localhost/golf_bench --init-schema
+    uvicorn main:app --port 8000            # with DATABASE_URL pointing at golf_bench
+    python -m benchmarks.workload --save-baseline
+    # ...change code, restart the server, reseed with the same --seed...
+    python -m benchmarks.workload --compare benchmarks/results/baseline.json
+
+Run from ``app/backend``. Requires ``pip install -r benchmarks/requirements.txt``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from benchmarks.concurrency import percentile
+from benchmarks.league import make_strokes, skins_state, wolf_state
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+DEFAULT_MIX = {
+    "create_game": 1,
+    "update_state": 6,
+    "patch_state": 6,
+    "get_state": 20,
+    "games_won": 4,
+    "games_lost": 4,
+    "history": 3,
+    "leaderboard": 6,
+}
+
+Request = Tuple[str, str, Optional[dict]]
+
+
+class League:
+    """The seeded league plus the client-side progress of every in-progress game."""
+
+    def __init__(self, manifest: dict, rng: random.Random) -> None:
+        self.rng = rng
+        self.users = manifest["users"]
+        self.games = manifest["in_progress_games"]
+        if not self.users or not self.games:
+            raise SystemExit("The manifest has no users or no in-progress games; reseed with --in-progress > 0.")
+        # Strokes and holes entered so far per game, and the state version we last saw.
+        self.scores: Dict[int, Dict[str, List[int]]] = {}
+        self.holes: Dict[int, int] = {}
+        self.versions: Dict[int, int] = {}
+
+    def user(self) -> dict:
+        return self.rng.choice(self.users)
+
+    def game(self) -> dict:
+        return self.rng.choice(self.games)
+
+    def next_state(self, game: dict) -> Tuple[int, dict]:
+        """The game's state with one more hole scored (starting over after the last hole)."""
+        game_id = game["game_id"]
+        if game_id not in self.scores:
+            self.scores[game_id] = {email: make_strokes(self.rng, game["pars"], self.rng.uniform(0, 24))
+                                    for email in game["emails"]}
+        hole = self.holes.get(game_id, 0) % game["num_holes"] + 1
+        self.holes[game_id] = hole
+        scores = self.scores[game_id]
+        if game["game_type"] == "skins":
+            state = skins_state(game["emails"], scores, game["pars"], game["skin_value"] or 1, hole)
+        else:
+            state = wolf_state(game["emails"], scores, game["pars"], hole)
+        return hole, state
+
+
+def build_request(op: str, league: League) -> Request:
+    if op == "create_game":
+        players = league.rng.sample(league.users, min(4, len(league.users)))
+        return "POST", "/games/", {
+            "game_type": league.rng.choice(("wolf", "skins")),
+            "players": [{"name": p["name"], "email": p["email"], "auth0_id": p["auth0_id"]} for p in players],
+            "skin_value": 2,
+        }
+    if op == "update_state":
+        game = league.game()
+        hole, state = league.next_state(game)
+        return "PATCH", f"/games/{game['game_id']}/state", {"current_hole": hole, "state_json": state}
+    if op == "patch_state":
+        game = league.game()
+        version = league.versions.get(game["game_id"])
+        if version is None:
+            # Learn the version first; get_state stores it.
+            return "GET", f"/games/{game['game_id']}/state", None
+        email = league.rng.choice(game["emails"])
+        return "PATCH", f"/games/{game['game_id']}/state/patch", {
+            "version": version,
+            "ops": [{"op": "replace", "path": f"/scores/{email}/0", "value": league.rng.randint(2, 8)}],
+        }
+    if op == "get_state":
+        return "GET", f"/games/{league.game()['game_id']}/state", None
+    if op == "games_won":
+        return "GET", f"/users/{league.user()['email']}/games-won", None
+    if op == "games_lost":
+        return "GET", f"/users/{league.user()['email']}/games-lost", None
+    if op == "history":
+        return "GET", f"/users/{league.user()['user_id']}/history", None
+    if op == "leaderboard":
+        return "GET", f"/leaderboards/{league.rng.choice(('weekly', 'monthly', 'all_time'))}", None
+    raise ValueError(f"Unknown operation {op!r}")
+
+
+def _remember_version(league: League, path: str, response: httpx.Response) -> None:
+    if response.status_code == 200 and path.startswith("/games/") and path.count("/") == 3:
+        body = response.json()
+        if "version" in body:
+            league.versions[int(path.split("/")[2])] = body["version"]
+
+
+async def http_load(base_url: str, league: League, mix: Dict[str, int], concurrency: int,
+                    duration: float) -> Dict[str, dict]:
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    conflicts: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        while time.perf_counter() < deadline:
+            op = league.rng.choices(ops, weights)[0]
+            method, path, body = build_request(op, league)
+            if method == "GET" and op == "patch_state":
+                op = "get_state"
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+            except httpx.HTTPError:
+                errors[op] += 1
+                continue
+            latencies[op].append(time.perf_counter() - started)
+            if response.status_code == 409:
+                # Another client moved the game on first; expected under concurrent score entry.
+                conflicts[op] += 1
+                league.versions.pop(int(path.split("/")[2]), None)
+            elif response.status_code >= 400:
+                errors[op] += 1
+            else:
+                _remember_version(league, path, response)
+                if op == "patch_state":
+                    league.versions[int(path.split("/")[2])] = response.json()["version"]
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {op: summarize(latencies[op], elapsed, errors[op], conflicts[op]) for op in ops if latencies[op] or errors[op]}
+
+
+async def websocket_load(base_url: str, league: League, clients: int, games: int, rate: float,
+                         duration: float) -> Optional[dict]:
+    if clients <= 0:
+        return None
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://")
+    game_ids = [g["game_id"] for g in league.games[:max(1, games)]]
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def listener(game_id: int, publisher: bool) -> None:
+        nonlocal errors
+        try:
+            async with websockets.connect(f"{ws_url}/ws/games/{game_id}") as socket:
+                sender = asyncio.create_task(_publish(socket, game_id)) if publisher else None
+                try:
+                    while time.monotonic() < deadline:
+                        try:
+                            raw = await asyncio.wait_for(socket.recv(), timeout=max(0.1, deadline - time.monotonic()))
+                        except asyncio.TimeoutError:
+                            break
+                        message = json.loads(raw)
+                        if message.get("type") == "bench":
+                            latencies.append(time.time() - message["sent_at"])
+                finally:
+                    if sender is not None:
+                        sender.cancel()
+        except (OSError, websockets.WebSocketException):
+            errors += 1
+
+    async def _publish(socket, game_id: int) -> None:
+        while time.monotonic() < deadline:
+            await socket.send(json.dumps({"type": "bench", "game_id": game_id, "sent_at": time.time()}))
+            await asyncio.sleep(1.0 / rate)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        listener(game_ids[n % len(game_ids)], publisher=n < len(game_ids)) for n in range(clients)
+    ))
+    return summarize(sorted(latencies), time.perf_counter() - started, errors, 0)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int, conflicts: int) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "conflicts": conflicts,
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Operations whose p95 grew by more than ``threshold`` (0.15 = 15%) over the baseline."""
+    regressions = []
+    for op, stats in current["operations"].items():
+        before = baseline["operations"].get(op)
+        if not before or not before["p95_ms"] or not stats["count"]:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"  {op:<14} p95 {before['p95_ms']:>9.1f} -> {stats['p95_ms']:>9.1f} ms ({change:+.0%}) {marker}")
+        if change > threshold:
+            regressions.append(op)
+    return regressions
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, int]:
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in spec.split(","):
+        op, _, weight = item.partition("=")
+        if op.strip() not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown operation {op!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[op.strip()] = int(weight or 1)
+    return mix
+
+
+async def run(args: argparse.Namespace) -> dict:
+    league = League(json.loads(args.manifest.read_text()), random.Random(args.seed))
+    http, ws = await asyncio.gather(
+        http_load(args.base_url, league, parse_mix(args.mix), args.concurrency, args.duration),
+        websocket_load(args.base_url, league, args.ws_clients, args.ws_games, args.ws_rate, args.duration),
+    )
+    operations = dict(http)
+    if ws is not None:
+        operations["websocket"] = ws
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "label": args.label,
+        "settings": {
+            "base_url": args.base_url, "concurrency": args.concurrency, "duration": args.duration,
+            "mix": parse_mix(args.mix), "ws_clients": args.ws_clients, "ws_games": args.ws_games,
+            "ws_rate": args.ws_rate, "seed": args.seed,
+        },
+        "operations": operations,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--manifest", type=Path, default=RESULTS_DIR / "league.json")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", help="Weights, e.g. get_state=20,update_state=5 (default: a league-night mix)")
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--ws-games", type=int, default=10)
+    parser.add_argument("--ws-rate", type=float, default=5.0, help="Broadcasts per second per game")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--results-dir", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--save-baseline", action="store_true", help="Also save the results as baseline.json")
+    parser.add_argument("--compare", type=Path, help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed p95 growth before failing")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    print(f"{'operation':<14} {'count':>7} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'409s':>5}")
+    for op, stats in result["operations"].items():
+        print(f"{op:<14} {stats['count']:>7} {stats['throughput_per_s']:>8.1f} {stats['p50_ms']:>8.1f} "
+              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>6} {stats['conflicts']:>5}")
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{result['timestamp'].replace(':', '')}-{result['commit'] or 'nogit'}-{args.label}.json"
+    (args.results_dir / name).write_text(json.dumps(result, indent=1))
+    if args.save_baseline:
+        (args.results_dir / "baseline.json").write_text(json.dumps(result, indent=1))
+    print(f"Results saved to {args.results_dir / name}")
+
+    if args.compare:
+        print(f"Compared with {args.compare}:")
+        regressions = compare(json.loads(args.compare.read_text()), result, args.threshold)
+        if regressions:
+            print(f"p95 regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
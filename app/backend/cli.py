@@ -0,0 +1,125 @@
+"""
+Maintenance commands for the Golf App backend.
+
+Run from ``app/backend`` with the same ``.env`` / ``DATABASE_URL`` as the API:
+
+    python cli.py backfill-results            # results for completed games that have none yet
+    python cli.py backfill-results --all      # recompute results for every completed game
+    python cli.py backfill-hole-scores        # per-hole rows for every game with a state
+    python cli.py rebuild-leaderboards        # recompute every materialized leaderboard
+    python cli.py rebuild-achievement-stats   # recompute achievement counters and unlock what they earn
+    python cli.py compact-game-log            # snapshot long game logs, prune old snapshots and events
+    python cli.py worker --concurrency 4      # process background jobs until interrupted
+"""
+import argparse
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from dotenv import load_dotenv
+
+from database import AsyncPool, pool_from_env
+import achievements
+import game_log
+import game_results
+import hole_scores
+import jobs
+import leaderboards
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def open_pool() -> AsyncIterator[AsyncPool]:
+    """Open a connection pool for the duration of one command."""
+    pool = pool_from_env(os.getenv('DATABASE_URL'))
+    await pool.open()
+    try:
+        yield pool
+    finally:
+        await pool.close()
+
+
+async def backfill_results(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        count = await game_results.backfill_game_results(
+            pool, batch_size=args.batch_size, only_missing=not args.all
+        )
+    logger.info(f"Done: results written for {count} games.")
+
+
+async def backfill_hole_scores(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        count = await hole_scores.backfill(pool, batch_size=args.batch_size)
+    logger.info(f"Done: hole scores synced for {count} games.")
+
+
+async def rebuild_leaderboards(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        async with pool.connection() as db:
+            counts = await leaderboards.rebuild_all(db)
+    logger.info(f"Done: rebuilt {len(counts)} leaderboards ({sum(counts.values())} entries).")
+
+
+async def rebuild_achievement_stats(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        async with pool.connection() as db:
+            count = await achievements.rebuild_user_stats(db)
+    logger.info(f"Done: replayed {count} games into user_stats.")
+
+
+async def compact_game_log(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        async with pool.connection() as db:
+            counts = await game_log.compact(db)
+    logger.info(f"Done: {counts['snapshots']} snapshots written, {counts['pruned_snapshots']} snapshots "
+                f"and {counts['pruned_events']} events pruned.")
+
+
+async def run_worker(args: argparse.Namespace) -> None:
+    async with open_pool() as pool:
+        worker = jobs.JobWorker(pool, concurrency=args.concurrency, poll_interval=args.poll_interval)
+        await worker.run_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Golf App backend maintenance commands")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subcommands.add_parser("backfill-results", help="Fill game_results for completed games")
+    backfill.add_argument("--all", action="store_true", help="Recompute games that already have results")
+    backfill.add_argument("--batch-size", type=int, default=200, help="Games per transaction")
+    backfill.set_defaults(handler=backfill_results)
+
+    holes = subcommands.add_parser("backfill-hole-scores", help="Fill hole_scores from every game's state")
+    holes.add_argument("--batch-size", type=int, default=500, help="Games per transaction")
+    holes.set_defaults(handler=backfill_hole_scores)
+
+    rebuild = subcommands.add_parser("rebuild-leaderboards", help="Recompute every leaderboard_cache board")
+    rebuild.set_defaults(handler=rebuild_leaderboards)
+
+    stats = subcommands.add_parser("rebuild-achievement-stats", help="Recompute user_stats and unlock achievements")
+    stats.set_defaults(handler=rebuild_achievement_stats)
+
+    compact = subcommands.add_parser("compact-game-log", help="Snapshot and prune the game event log")
+    compact.set_defaults(handler=compact_game_log)
+
+    worker = subcommands.add_parser("worker", help="Process background jobs until interrupted")
+    worker.add_argument("--concurrency", type=int, default=4, help="Jobs processed at the same time")
+    worker.add_argument("--poll-interval", type=float, default=0.5, help="Seconds to wait when the queue is empty")
+    worker.set_defaults(handler=run_worker)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Database connection pooling for the Golf App backend.
+
+Opening a brand-new PostgreSQL connection for every request means paying a
+TCP + authentication handshake each time, and under league-night load it can
+also exhaust the server's ``max_connections``. This module keeps a bounded set
+of connections open and lends them out to requests instead.
+
+The request path is fully async: connections come from psycopg 3's
+``AsyncConnectionPool``, so waiting on the database never blocks the event
+loop that also serves the ``/ws/games/{game_id}`` websocket.
+
+Features:
+- Configurable minimum/maximum pool size (``DB_POOL_MIN_SIZE`` / ``DB_POOL_MAX_SIZE``).
+- Acquire timeout (``DB_POOL_ACQUIRE_TIMEOUT``): callers wait at most this long
+  for a free connection and then get a clear ``PoolTimeout`` error.
+- Health check on checkout: connections that sat idle longer than
+  ``DB_POOL_HEALTH_CHECK_AFTER`` seconds are pinged with ``SELECT 1`` and
+  transparently replaced if the server dropped them.
+- Idle recycling: connections above the minimum size that stay unused longer
+  than ``DB_POOL_MAX_IDLE`` seconds are closed.
+- Stats (in-use, idle, waiting, acquire-latency histogram) via ``stats()`` so
+  the pool can be sized from real numbers.
+- Per-request accounting: pooled connections use ``TimedCursor``, which adds
+  query time and rows returned to the current request's ``RequestStats`` (see
+  metrics.py), together with the time spent waiting for the connection.
+"""
+import logging
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from metrics import LatencyHistogram, current_request
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["AsyncPool", "PoolTimeout", "pool_from_env"]
+
+
+class TimedCursor(psycopg.AsyncCursor):
+    """Cursor that charges its query time and result rows to the current HTTP request, if any."""
+
+    async def execute(self, query, params=None, **kwargs):
+        stats = current_request.get()
+        if stats is None:
+            return await super().execute(query, params, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            stats.db_seconds += time.perf_counter() - started
+            stats.queries += 1
+            if self.description is not None and self.rowcount > 0:
+                stats.rows += self.rowcount
+
+    async def executemany(self, query, params_seq, **kwargs):
+        stats = current_request.get()
+        if stats is None:
+            return await super().executemany(query, params_seq, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            stats.db_seconds += time.perf_counter() - started
+            stats.queries += 1
+
+
+class AsyncPool:
+    """
+    An instrumented wrapper around psycopg's ``AsyncConnectionPool``.
+
+    psycopg_pool already handles sizing, waiting with a timeout and idle
+    recycling. This class adds the pieces we care about on top:
+    - a cheap health check that only pings connections which have been idle
+      for a while (instead of a round trip on every checkout), and
+    - an acquire-latency histogram plus a stable ``stats()`` shape.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        min_size: int = 2,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        max_idle: float = 300.0,
+        health_check_after: float = 30.0,
+    ) -> None:
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.acquire_latency = LatencyHistogram()
+        self._health_check_failures = 0
+        # When each connection was last handed back, so the checkout check
+        # can skip the ping for connections that were just in use.
+        self._returned_at: "weakref.WeakKeyDictionary[psycopg.AsyncConnection, float]" = weakref.WeakKeyDictionary()
+        self._pool = AsyncConnectionPool(
+            dsn or "",
+            min_size=min_size,
+            max_size=max_size,
+            timeout=acquire_timeout,
+            max_idle=max_idle,
+            check=self._check,
+            reset=self._mark_returned,
+            kwargs={"cursor_factory": TimedCursor},
+            open=False,
+        )
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def open(self) -> None:
+        """Open the pool and wait for ``min_size`` connections so the first requests don't pay for them."""
+        await self._pool.open(wait=True)
+        logger.info(f"Database pool opened (min_size={self.min_size}, max_size={self.max_size})")
+
+    async def close(self) -> None:
+        """Close every connection and refuse new checkouts."""
+        await self._pool.close()
+        logger.info("Database pool closed")
+
+    # -- checkout ----------------------------------------------------------
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None) -> AsyncIterator[psycopg.AsyncConnection]:
+        """
+        Borrow a connection for the duration of an ``async with`` block.
+
+        The transaction is committed if the block succeeds and rolled back if
+        it raises; the connection then goes back to the pool. Raises
+        ``PoolTimeout`` if no connection frees up within the acquire timeout.
+        """
+        started = time.monotonic()
+        conn = await self._pool.getconn(timeout=timeout)
+        waited = time.monotonic() - started
+        self.acquire_latency.observe(waited)
+        stats = current_request.get()
+        if stats is not None:
+            stats.pool_wait_seconds += waited
+        try:
+            async with conn:
+                yield conn
+        finally:
+            await self._pool.putconn(conn)
+
+    # -- stats -------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        """Current pool occupancy, lifetime counters and acquire latency histogram."""
+        raw = self._pool.get_stats()
+        size = raw.get("pool_size", 0)
+        idle = raw.get("pool_available", 0)
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": size - idle,
+            "idle": idle,
+            "size": size,
+            "waiting": raw.get("requests_waiting", 0),
+            "connections_opened": raw.get("connections_num", 0),
+            "connections_lost": raw.get("connections_lost", 0),
+            "health_check_failures": self._health_check_failures,
+            "acquire_timeouts": raw.get("requests_errors", 0),
+            "acquire_latency_ms": self.acquire_latency.snapshot(),
+        }
+
+    # -- internals ---------------------------------------------------------
+
+    async def _check(self, conn: psycopg.AsyncConnection) -> None:
+        """Checkout health check; raising makes the pool discard and replace ``conn``."""
+        returned_at = self._returned_at.get(conn)
+        if returned_at is not None and time.monotonic() - returned_at < self.health_check_after:
+            return
+        try:
+            await conn.execute("SELECT 1")
+            await conn.rollback()
+        except psycopg.Error:
+            self._health_check_failures += 1
+            logger.warning("Discarding broken pooled connection and reconnecting")
+            raise
+
+    async def _mark_returned(self, conn: psycopg.AsyncConnection) -> None:
+        self._returned_at[conn] = time.monotonic()
+
+
+def pool_from_env(dsn: Optional[str]) -> AsyncPool:
+    """Build an ``AsyncPool`` using the ``DB_POOL_*`` environment variables."""
+    return AsyncPool(
+        dsn,
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5")),
+        max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30")),
+    )
@@ -0,0 +1,140 @@
+"""
+Streaming export of league data.
+
+One row per player per game (game, player, and the stored result once the
+game is complete), for one user's games, a date range, or the whole league.
+Rows are read through a named (server-side) cursor ``EXPORT_FETCH_SIZE``
+rows at a time and each batch is encoded and sent before the next is
+fetched, so memory stays flat however many rows the export has.
+
+Formats: ``ndjson`` (one JSON object per line) or ``csv`` with a header row,
+either optionally gzip-compressed as it streams.
+
+The connection is taken from the pool before the response starts (so a
+busy pool still answers 503) and held until the last row is sent.
+"""
+import csv
+import io
+import os
+import zlib
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+import serialization
+
+FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+COLUMNS = (
+    "game_id", "game_type", "created_at", "completed_at", "is_complete", "num_holes", "skin_value",
+    "game_player_id", "user_id", "name", "email", "final_score", "placement", "outcome",
+)
+
+_SELECT = """
+    SELECT g.id AS game_id, g.game_type::text, g.created_at, g.completed_at, g.is_complete, g.num_holes,
+           g.skin_value, gp.id AS game_player_id, gp.user_id, gp.name, gp.email,
+           gr.final_score, gr.placement, gr.outcome
+    FROM games g
+    JOIN game_players gp ON gp.game_id = g.id
+    LEFT JOIN game_results gr ON gr.game_player_id = gp.id
+    WHERE {where}
+    ORDER BY g.id, gp.id
+"""
+
+
+@dataclass
+class ExportFilter:
+    user_id: Optional[int] = None  # only games this user played in (every player's row)
+    start: Optional[date] = None  # inclusive, on completed_at (created_at for games in progress)
+    end: Optional[date] = None
+    completed_only: bool = False
+
+
+def build_query(filters: ExportFilter) -> Tuple[str, dict]:
+    """The export ``SELECT`` and its parameters. Raises ValueError for an inverted date range."""
+    if filters.start and filters.end and filters.end < filters.start:
+        raise ValueError("end must not be before start.")
+    where: List[str] = ["TRUE"]
+    params: dict = {}
+    if filters.user_id is not None:
+        where.append("g.id IN (SELECT game_id FROM game_players WHERE user_id = %(user_id)s)")
+        params["user_id"] = filters.user_id
+    if filters.start is not None:
+        where.append("COALESCE(g.completed_at, g.created_at) >= %(start)s")
+        params["start"] = filters.start
+    if filters.end is not None:
+        where.append("COALESCE(g.completed_at, g.created_at) < %(end)s")
+        params["end"] = filters.end + timedelta(days=1)
+    if filters.completed_only:
+        where.append("g.is_complete = TRUE")
+    return _SELECT.format(where=" AND ".join(where)), params
+
+
+def encode_ndjson(rows: Sequence[tuple], header: bool) -> bytes:
+    return b"".join(serialization.dumps(dict(zip(COLUMNS, row))) + b"\n" for row in rows)
+
+
+def encode_csv(rows: Sequence[tuple], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(
+        ["" if value is None else value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv}
+
+
+def filename(fmt: str, compress: bool) -> str:
+    return f"golf-export.{FORMATS[fmt][1]}" + (".gz" if compress else "")
+
+
+async def open_export(pool, filters: ExportFilter, fmt: str, compress: bool = False,
+                      fetch_size: int = FETCH_SIZE) -> AsyncIterator[bytes]:
+    """
+    Borrow a connection and return an async iterator over the encoded export.
+    Raises ValueError for an unknown format or bad filters, and ``PoolTimeout``
+    if no connection is free, before anything has been sent.
+    """
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown export format {fmt!r} (use {' or '.join(FORMATS)}).")
+    query, params = build_query(filters)
+    stack = AsyncExitStack()
+    db = await stack.enter_async_context(pool.connection())
+    return _stream(stack, db, query, params, ENCODERS[fmt], compress, fetch_size)
+
+
+async def _stream(stack: AsyncExitStack, db, query: str, params: dict, encode, compress: bool,
+                  fetch_size: int) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip container
+    try:
+        async with db.cursor(name="export") as cursor:
+            cursor.itersize = fetch_size
+            await cursor.execute(query, params)
+            header = True
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows and not header:
+                    break
+                chunk = encode(rows, header)
+                header = False
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+                if not rows:
+                    break
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        await stack.aclose()
@@ -0,0 +1,143 @@
+"""
+Paginated game history for a user.
+
+One query returns a page of the user's games with their outcome, a short
+summary and every player embedded, so the history screen no longer needs a
+games-won call, a games-lost call and one players call per game.
+
+Ordering and pagination:
+- In-progress games come first (they are the most relevant), newest first,
+  at most ``MAX_IN_PROGRESS`` of them, and only on the first page.
+- Completed games follow, newest first, paginated with a keyset on
+  ``(completed_at, game_id)`` over the user's ``game_results`` rows, which
+  ``idx_game_results_user_completed`` serves in order. Every completed game
+  gets those rows from its ``game.completed`` job; games nothing ranks
+  (sixsixsix, or no scores entered) have no outcome.
+- ``next_cursor`` is an opaque token; pass it back as ``cursor`` to get the next page.
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from psycopg.rows import dict_row
+
+OUTCOME_IN_PROGRESS = 'in_progress'
+
+MAX_PAGE_SIZE = 100
+MAX_IN_PROGRESS = 20
+
+
+def encode_cursor(completed_at: datetime, game_id: int) -> str:
+    raw = f"{completed_at.isoformat()}|{game_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of ``encode_cursor``. Raises ``ValueError`` for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        completed_at, game_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(completed_at), int(game_id)
+    except Exception as e:
+        raise ValueError("Invalid history cursor.") from e
+
+
+async def fetch_user_history(db, user_id: int, limit: int = 20, cursor: Optional[str] = None) -> dict:
+    """
+    Return ``{"games": [...], "next_cursor": str | None}`` for ``user_id``.
+
+    Each game has ``id``, ``game_type``, ``created_at``, ``completed_at``,
+    ``is_complete``, ``outcome`` (won/tied/lost/in_progress, or ``None`` for a
+    completed game without results), ``summary`` and
+    ``players`` (name, email, user_id, final score, placement, outcome and
+    per-hole Wolf points when available).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    params = {"user_id": user_id, "fetch": limit + 1, "in_progress": MAX_IN_PROGRESS}
+
+    completed_filter = ""
+    if cursor:
+        params["cursor_completed_at"], params["cursor_game_id"] = decode_cursor(cursor)
+        completed_filter = "AND (gr.completed_at, gr.game_id) < (%(cursor_completed_at)s, %(cursor_game_id)s)"
+        in_progress_page = ""
+    else:
+        in_progress_page = f"""
+            (SELECT g.id AS game_id, NULL::timestamp AS sort_at,
+                    '{OUTCOME_IN_PROGRESS}'::varchar AS outcome, NULL::numeric AS final_score, NULL::int AS placement
+             FROM games g
+             JOIN game_players gp ON gp.game_id = g.id
+             WHERE gp.user_id = %(user_id)s AND g.is_complete = FALSE
+             ORDER BY g.created_at DESC, g.id DESC
+             LIMIT %(in_progress)s)
+            UNION ALL
+        """
+
+    query = f"""
+        WITH page AS (
+            {in_progress_page}
+            (SELECT gr.game_id, gr.completed_at AS sort_at, gr.outcome::varchar, gr.final_score, gr.placement
+             FROM game_results gr
+             WHERE gr.user_id = %(user_id)s {completed_filter}
+             ORDER BY gr.completed_at DESC, gr.game_id DESC
+             LIMIT %(fetch)s)
+        )
+        SELECT g.id, g.game_type, g.created_at, g.completed_at, g.is_complete,
+               g.current_hole, g.num_holes, g.skin_value,
+               page.sort_at, page.outcome, page.final_score, page.placement,
+               roster.players
+        FROM page
+        JOIN games g ON g.id = page.game_id
+        CROSS JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'name', p.name,
+                       'email', p.email,
+                       'user_id', p.user_id,
+                       'final_score', r.final_score,
+                       'placement', r.placement,
+                       'outcome', r.outcome,
+                       'points', g.state_json -> 'points' -> p.email
+                   ) ORDER BY r.placement NULLS LAST, p.id) AS players
+            FROM game_players p
+            LEFT JOIN game_results r ON r.game_player_id = p.id
+            WHERE p.game_id = g.id
+        ) roster
+        ORDER BY page.sort_at DESC NULLS FIRST, g.id DESC
+    """
+
+    async with db.cursor(row_factory=dict_row) as cur:
+        await cur.execute(query, params)
+        rows = await cur.fetchall()
+
+    completed = [row for row in rows if row['is_complete']]
+    next_cursor = None
+    if len(completed) > limit:
+        # We fetched one extra completed game only to know whether another page exists.
+        extra = completed[limit]
+        rows = [row for row in rows if row is not extra]
+        last = completed[limit - 1]
+        next_cursor = encode_cursor(last['sort_at'], last['id'])
+
+    return {"games": [_shape_game(row) for row in rows], "next_cursor": next_cursor}
+
+
+def _shape_game(row: dict) -> dict:
+    players: List[dict] = row['players'] or []
+    winners = [p['name'] for p in players if p.get('placement') == 1]
+    return {
+        "id": row['id'],
+        "game_type": row['game_type'],
+        "created_at": row['created_at'],
+        "completed_at": row['completed_at'],
+        "is_complete": row['is_complete'],
+        "outcome": row['outcome'],
+        "summary": {
+            "final_score": row['final_score'],
+            "placement": row['placement'],
+            "num_players": len(players),
+            "num_holes": row['num_holes'],
+            "holes_played": row['current_hole'],
+            "skin_value": row['skin_value'],
+            "winners": winners,
+        },
+        "players": players,
+    }
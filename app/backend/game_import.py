@@ -0,0 +1,142 @@
+"""
+Creating games and their players in bulk.
+
+- ``insert_players`` writes every player of a game with one multi-row
+  ``INSERT`` (used by ``POST /games/``).
+- ``import_games`` loads hundreds of historical games at once, e.g. from a
+  league spreadsheet export (``POST /games/import``). All games, players and
+  final results are streamed into the database with ``COPY`` in the caller's
+  transaction, so an import either lands completely or not at all.
+
+Ids for the imported rows are reserved up front from the tables' sequences,
+so ``COPY`` can write games, players and results that reference each other
+without reading anything back. Leaderboards and achievement counters are then
+rebuilt by a ``games.imported`` background job (see jobs.py), because
+historical games change streaks and windows that incremental updates assume
+are in order.
+"""
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from psycopg.types.json import Jsonb
+
+import game_results
+import hole_scores
+import jobs
+import users
+import wolf
+
+VALID_GAME_TYPES = ('wolf', 'skins', 'sixsixsix')
+
+MAX_IMPORT_GAMES = 2000
+
+
+async def insert_players(db, game_id: int, players: Sequence, user_ids: Sequence[Optional[int]]) -> None:
+    """Insert all ``players`` of ``game_id`` with one statement, keeping their order."""
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            INSERT INTO game_players (game_id, user_id, auth0_id, name, email)
+            SELECT %s, p.user_id, p.auth0_id, p.name, p.email
+            FROM unnest(%s::int[], %s::text[], %s::text[], %s::text[]) WITH ORDINALITY
+                AS p(user_id, auth0_id, name, email, position)
+            ORDER BY p.position
+        """, (
+            game_id,
+            list(user_ids),
+            [getattr(p, 'auth0_id', None) for p in players],
+            [p.name for p in players],
+            [p.email for p in players],
+        ))
+
+
+async def _reserve_ids(cursor, table: str, count: int) -> List[int]:
+    if count == 0:
+        return []
+    await cursor.execute(
+        f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) FROM generate_series(1, %s)",
+        (count,)
+    )
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def import_games(db, games: Sequence) -> List[int]:
+    """
+    Import ``games`` (objects shaped like ``GameImport`` in main.py) and return
+    their new ids in input order. Raises ``ValueError`` for invalid input.
+    The caller commits.
+    """
+    if not games:
+        raise ValueError("Nothing to import.")
+    if len(games) > MAX_IMPORT_GAMES:
+        raise ValueError(f"At most {MAX_IMPORT_GAMES} games per import.")
+    for index, game in enumerate(games):
+        if game.game_type not in VALID_GAME_TYPES:
+            raise ValueError(f"Game {index}: invalid game type {game.game_type!r}.")
+        if not game.players:
+            raise ValueError(f"Game {index}: a game needs at least one player.")
+
+    all_players = [player for game in games for player in game.players]
+    user_ids = await users.resolve_user_ids(db, all_players)
+    now = datetime.now()
+    completed_at = [
+        (game.completed_at or game.created_at or now) if game.is_complete else None for game in games
+    ]
+
+    async with db.cursor() as cursor:
+        game_ids = await _reserve_ids(cursor, 'games', len(games))
+        player_ids = await _reserve_ids(cursor, 'game_players', len(all_players))
+
+        async with cursor.copy(
+            "COPY games (id, game_type, created_at, current_hole, num_holes, state_json, "
+            "is_complete, completed_at, skin_value) FROM STDIN"
+        ) as copy:
+            for index, game in enumerate(games):
+                current_hole = game.current_hole
+                if current_hole is None:
+                    current_hole = game.num_holes if game.is_complete else 0
+                await copy.write_row((
+                    game_ids[index], game.game_type, game.created_at or completed_at[index] or now,
+                    current_hole, game.num_holes, Jsonb(game.state_json), game.is_complete,
+                    completed_at[index], game.skin_value,
+                ))
+
+        results = []
+        async with cursor.copy(
+            "COPY game_players (id, game_id, user_id, auth0_id, name, email) FROM STDIN"
+        ) as copy:
+            position = 0
+            for index, game in enumerate(games):
+                roster = []
+                for player in game.players:
+                    roster.append({
+                        "game_player_id": player_ids[position],
+                        "user_id": user_ids[position],
+                        "email": player.email,
+                    })
+                    await copy.write_row((
+                        player_ids[position], game_ids[index], user_ids[position],
+                        getattr(player, 'auth0_id', None), player.name, player.email,
+                    ))
+                    position += 1
+                if not game.is_complete:
+                    continue
+                scores = game_results.final_scores(game.game_type, game.state_json)
+                ranked = game_results.rank_players(roster, scores) if scores else game_results.unranked(roster)
+                for result in ranked:
+                    results.append((game_ids[index], game.game_type, completed_at[index], result))
+
+        async with cursor.copy(
+            "COPY game_results (game_id, game_player_id, user_id, email, game_type, "
+            "final_score, placement, outcome, completed_at) FROM STDIN"
+        ) as copy:
+            for game_id, game_type, finished_at, r in results:
+                await copy.write_row((
+                    game_id, r.game_player_id, r.user_id, r.email, game_type,
+                    r.final_score, r.placement, r.outcome, finished_at,
+                ))
+
+    await hole_scores.sync_games(db, game_ids)
+    await wolf.sync_from_state(db, [game_id for game_id, game in zip(game_ids, games) if game.game_type == 'wolf'])
+    if results:
+        await jobs.enqueue(db, 'games.imported', {"game_ids": game_ids})
+    return game_ids
@@ -0,0 +1,462 @@
+"""
+Event-sourced history of a game's state.
+
+Every change to ``games.state_json`` is appended to ``game_events``
+(``(game_id, seq)``, ``seq`` counting from 1 per game in ``games.event_seq``):
+
+- ``score`` ``{email, hole, strokes}``: strokes entered for one player on one hole
+- ``partner`` ``{hole, wolf, partner, lone_wolf}``: the wolf's pick for a hole
+- ``advance`` ``{hole}``: play moved to ``hole``
+- ``wolf_hole``: a hole scored by wolf.py, with the points it awarded
+- ``patch`` ``{ops, current_hole}``: a write through ``/state/patch`` (its JSON
+  Patch operations) or ``PATCH /state`` (the operations that turn the old
+  state into the new one, ``diff_ops``)
+- ``undo`` ``{seq}``: the event ``seq`` no longer counts
+
+Clients can send the first three with ``append_events``, which applies them to
+the stored state (``apply_event``) and writes only the small event rows plus
+the new state. Every event records what changed, never a copy of the whole
+state; ``games.state_json`` stays the current state every reader uses.
+
+The state as of any ``seq`` is rebuilt from the latest snapshot in
+``game_snapshots`` at or before it plus the events after it. A snapshot is
+written every ``GAME_LOG_SNAPSHOT_EVERY`` events (default 20), so a rebuild
+replays at most that many events however long the game is. ``undo_last``
+marks the last event undone, drops snapshots that included it and rebuilds.
+
+``compact`` (run after each game completes, and by ``python cli.py
+compact-game-log``) snapshots games with a long tail, keeps the baseline plus
+the newest ``GAME_LOG_KEEP_SNAPSHOTS`` (default 3) snapshots per game and, with
+``GAME_LOG_RETENTION_DAYS`` set, drops the events of games completed longer
+ago than that, keeping their final snapshot.
+"""
+import copy
+import logging
+import os
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from state_patch import StateConflict
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_EVERY = int(os.getenv("GAME_LOG_SNAPSHOT_EVERY", "20"))
+KEEP_SNAPSHOTS = int(os.getenv("GAME_LOG_KEEP_SNAPSHOTS", "3"))
+RETENTION_DAYS = int(os.getenv("GAME_LOG_RETENTION_DAYS", "0"))
+
+# Kinds clients may append; the others are written by the server.
+CLIENT_KINDS = ('score', 'partner', 'advance')
+MAX_EVENTS_PER_REQUEST = 100
+
+
+class HistoryCompacted(ValueError):
+    """The events needed to rebuild that point in the game were compacted away."""
+
+
+# -- pure state transitions --------------------------------------------------------
+
+def _hole(payload: dict, num_holes: int) -> int:
+    hole = payload.get('hole')
+    if not isinstance(hole, int) or isinstance(hole, bool) or not 1 <= hole <= num_holes:
+        raise ValueError(f"hole must be an integer between 1 and {num_holes}.")
+    return hole
+
+
+def _player(event: dict, field: str, emails: Collection[str]) -> str:
+    email = event.get(field)
+    if not isinstance(email, str) or not email:
+        raise ValueError(f"A {event['kind']} event needs {field}.")
+    if email not in emails:
+        raise ValueError(f"{email} is not playing in this game.")
+    return email
+
+
+def validate_event(event: dict, num_holes: int, emails: Collection[str]) -> Tuple[str, dict]:
+    """``(kind, payload)`` for a client event in a game between ``emails``, or ValueError."""
+    kind = event.get('kind')
+    if kind not in CLIENT_KINDS:
+        raise ValueError(f"Unsupported event kind {kind!r} (use one of {', '.join(CLIENT_KINDS)}).")
+    hole = _hole(event, num_holes)
+    if kind == 'score':
+        email = _player(event, 'email', emails)
+        strokes = event.get('strokes')
+        if not isinstance(strokes, int) or isinstance(strokes, bool) or not 1 <= strokes <= 99:
+            raise ValueError("strokes must be an integer between 1 and 99.")
+        return kind, {"email": email, "hole": hole, "strokes": strokes}
+    if kind == 'partner':
+        wolf = _player(event, 'wolf', emails)
+        lone_wolf = bool(event.get('lone_wolf'))
+        partner = None
+        if not lone_wolf:
+            if event.get('partner') is None:
+                raise ValueError("Pick a partner or play lone wolf.")
+            partner = _player(event, 'partner', emails)
+            if partner == wolf:
+                raise ValueError("The wolf cannot partner themselves.")
+        return kind, {"hole": hole, "wolf": wolf, "partner": partner, "lone_wolf": lone_wolf}
+    return kind, {"hole": hole}
+
+
+def _set_hole(values, hole: int, value, fill) -> list:
+    values = list(values) if isinstance(values, list) else []
+    if len(values) < hole:
+        values.extend([fill] * (hole - len(values)))
+    values[hole - 1] = value
+    return values
+
+
+def apply_event(state: dict, current_hole: int, kind: str, payload: dict) -> Tuple[dict, int]:
+    """
+    The state and current hole after one event. ``state`` is modified in
+    place (pass a copy to keep the original).
+    """
+    if kind == 'patch':
+        state = apply_ops(state, payload['ops'])
+        if payload.get('current_hole') is not None:
+            current_hole = payload['current_hole']
+    elif kind == 'score':
+        scores = state.get('scores') if isinstance(state.get('scores'), dict) else {}
+        scores[payload['email']] = _set_hole(scores.get(payload['email']), payload['hole'], payload['strokes'], 0)
+        state['scores'] = scores
+    elif kind in ('partner', 'wolf_hole'):
+        holes = state.get('holes')
+        entry = dict(holes[payload['hole'] - 1] or {}) if isinstance(holes, list) and len(holes) >= payload['hole'] else {}
+        entry.update({key: value for key, value in payload.items() if key != 'points'})
+        state['holes'] = _set_hole(holes, payload['hole'], entry, None)
+        if kind == 'wolf_hole':
+            points = state.get('points') if isinstance(state.get('points'), dict) else {}
+            for email, value in (payload.get('points') or {}).items():
+                points[email] = _set_hole(points.get(email), payload['hole'], value, 0)
+            state['points'] = points
+            current_hole = max(current_hole or 0, payload['hole'])
+    elif kind == 'advance':
+        current_hole = payload['hole']
+    return state, current_hole
+
+
+def apply_ops(state: dict, ops: List[dict]) -> dict:
+    """
+    Apply compiled JSON Patch ``ops`` (paths split into segments, as
+    ``state_patch.compile_ops`` returns them) the way ``jsonb_apply_patch``
+    did when they were written. An operation whose path no longer exists
+    (an earlier event was undone) is skipped. ``state`` is modified in place.
+    """
+    for op in ops:
+        if op['op'] == 'test':
+            continue
+        *parents, key = op['path']
+        try:
+            parent = state
+            for segment in parents:
+                parent = parent[int(segment)] if isinstance(parent, list) else parent[segment]
+            if isinstance(parent, list):
+                if op['op'] == 'add':
+                    parent.insert(len(parent) if key == '-' else int(key), copy.deepcopy(op['value']))
+                elif op['op'] == 'replace':
+                    parent[int(key)] = copy.deepcopy(op['value'])
+                else:
+                    del parent[int(key)]
+            elif op['op'] == 'remove':
+                del parent[key]
+            else:
+                parent[key] = copy.deepcopy(op['value'])
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+    return state
+
+
+def diff_ops(old, new, path: Optional[List[str]] = None) -> List[dict]:
+    """
+    JSON Patch operations (segment paths) that turn state ``old`` into state
+    ``new`` (both dicts):
+    objects key by key, arrays element by element with additions or removals
+    at the end, anything else replaced whole.
+    """
+    path = path or []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": path + [key]} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff_ops(old[key], value, path + [key]))
+            else:
+                ops.append({"op": "add", "path": path + [key], "value": value})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        for index, (before, after) in enumerate(zip(old, new)):
+            ops.extend(diff_ops(before, after, path + [str(index)]))
+        ops.extend({"op": "add", "path": path + ['-'], "value": value} for value in new[len(old):])
+        ops.extend({"op": "remove", "path": path + [str(index)]} for index in range(len(old) - 1, len(new) - 1, -1))
+        return ops
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def replay(state: dict, current_hole: int, events: Iterable[dict], undone: Iterable[int] = ()) -> Tuple[dict, int]:
+    """Apply ``events`` (rows with ``seq``, ``kind``, ``payload``) in order, skipping undo markers and ``undone``."""
+    undone = set(undone)
+    state = copy.deepcopy(state)
+    for event in events:
+        if event['kind'] == 'undo' or event['seq'] in undone:
+            continue
+        state, current_hole = apply_event(state, current_hole, event['kind'], event['payload'])
+    return state, current_hole
+
+
+# -- writes --------------------------------------------------------------------------
+
+async def ensure_baseline(db, game_id: int) -> None:
+    """
+    Snapshot the state as ``seq`` 0 before the first logged change of a game
+    that already has a state (imported, or written before the log existed).
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            INSERT INTO game_snapshots (game_id, seq, current_hole, state)
+            SELECT id, 0, COALESCE(current_hole, 0), COALESCE(state_json, '{}'::jsonb)
+            FROM games WHERE id = %s AND event_seq = 0
+            ON CONFLICT (game_id, seq) DO NOTHING
+        """, (game_id,))
+
+
+async def record_patch(db, game_id: int, ops: List[dict], current_hole: Optional[int] = None) -> Optional[int]:
+    """Log a whole-state or JSON Patch write the caller has already made. Returns its ``seq`` (none if nothing changed)."""
+    if not ops and current_hole is None:
+        return None
+    return await record_applied(db, game_id, 'patch', {"ops": ops, "current_hole": current_hole})
+
+
+async def record_applied(db, game_id: int, kind: str, payload: dict) -> int:
+    """
+    Log an event whose effect the caller has already written to
+    ``state_json``, snapshotting that state (inside Postgres) when the event
+    is a multiple of ``SNAPSHOT_EVERY``.
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            WITH g AS (
+                UPDATE games SET event_seq = event_seq + 1 WHERE id = %(game_id)s
+                RETURNING id, event_seq, current_hole, state_json
+            ), snapshot AS (
+                INSERT INTO game_snapshots (game_id, seq, current_hole, state)
+                SELECT id, event_seq, COALESCE(current_hole, 0), COALESCE(state_json, '{}'::jsonb) FROM g
+                WHERE event_seq %% %(every)s = 0
+                ON CONFLICT (game_id, seq) DO NOTHING
+            )
+            INSERT INTO game_events (game_id, seq, kind, payload)
+            SELECT id, event_seq, %(kind)s, %(payload)s FROM g
+            RETURNING seq
+        """, {"game_id": game_id, "every": SNAPSHOT_EVERY, "kind": kind, "payload": Jsonb(payload)})
+        return (await cursor.fetchone())[0]
+
+
+async def _lock_game(cursor, game_id: int) -> Optional[dict]:
+    await cursor.execute("""
+        SELECT is_complete, num_holes, current_hole, state_json, state_version, event_seq
+        FROM games WHERE id = %s FOR UPDATE
+    """, (game_id,))
+    return await cursor.fetchone()
+
+
+async def _write_state(cursor, game_id: int, state: dict, current_hole: int, event_seq: int) -> int:
+    await cursor.execute("""
+        UPDATE games SET state_json = %s, current_hole = %s, event_seq = %s,
+                         state_version = state_version + 1, state_updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        RETURNING state_version
+    """, (Jsonb(state), current_hole, event_seq, game_id))
+    return (await cursor.fetchone())['state_version']
+
+
+async def append_events(db, game_id: int, events: List[dict], version: Optional[int] = None) -> Optional[dict]:
+    """
+    Validate and apply client ``events`` to an in-progress game, in order, in
+    the caller's transaction. With ``version``, fails if
+    the state moved on since the client read it (``StateConflict``). Returns ``None`` if the game
+    does not exist, else ``{"seq", "version", "current_hole"}``.
+    """
+    if not events:
+        raise ValueError("No events given.")
+    if len(events) > MAX_EVENTS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_EVENTS_PER_REQUEST} events per request.")
+    async with db.cursor(row_factory=dict_row) as cursor:
+        game = await _lock_game(cursor, game_id)
+        if game is None:
+            return None
+        if game['is_complete']:
+            raise ValueError("Cannot update a completed game.")
+        if version is not None and version != game['state_version']:
+            raise StateConflict(f"Game state changed (now version {game['state_version']}); reload and retry.",
+                                game['state_version'])
+        await cursor.execute("SELECT email FROM game_players WHERE game_id = %s", (game_id,))
+        emails = {row['email'] for row in await cursor.fetchall()}
+        num_holes = game['num_holes'] or 18
+        parsed = [validate_event(event, num_holes, emails) for event in events]
+
+        state = game['state_json'] or {}
+        current_hole = game['current_hole'] or 0
+        for kind, payload in parsed:
+            state, current_hole = apply_event(state, current_hole, kind, payload)
+        first = game['event_seq'] + 1
+        last = game['event_seq'] + len(parsed)
+        if game['event_seq'] == 0 and game['state_json']:
+            await ensure_baseline(db, game_id)
+        await cursor.executemany(
+            "INSERT INTO game_events (game_id, seq, kind, payload) VALUES (%s, %s, %s, %s)",
+            [(game_id, seq, kind, Jsonb(payload)) for seq, (kind, payload) in enumerate(parsed, start=first)],
+        )
+        new_version = await _write_state(cursor, game_id, state, current_hole, last)
+        if last // SNAPSHOT_EVERY > (first - 1) // SNAPSHOT_EVERY:
+            await _snapshot(cursor, game_id, last, current_hole, state)
+    return {"seq": last, "version": new_version, "current_hole": current_hole}
+
+
+async def _snapshot(cursor, game_id: int, seq: int, current_hole: int, state: dict) -> None:
+    await cursor.execute("""
+        INSERT INTO game_snapshots (game_id, seq, current_hole, state) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (game_id, seq) DO NOTHING
+    """, (game_id, seq, current_hole, Jsonb(state)))
+
+
+async def undo_last(db, game_id: int) -> Optional[dict]:
+    """
+    Undo the game's most recent event that is not already undone (an undo
+    itself cannot be undone), and write the rebuilt state. Returns ``None`` if
+    the game does not exist, raises ValueError if there is nothing to undo.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        game = await _lock_game(cursor, game_id)
+        if game is None:
+            return None
+        if game['is_complete']:
+            raise ValueError("Cannot update a completed game.")
+        await cursor.execute("""
+            SELECT seq, kind FROM game_events e
+            WHERE e.game_id = %(game_id)s AND e.kind <> 'undo'
+              AND NOT EXISTS (SELECT 1 FROM game_events u
+                              WHERE u.game_id = %(game_id)s AND u.kind = 'undo'
+                                AND (u.payload->>'seq')::int = e.seq)
+            ORDER BY seq DESC LIMIT 1
+        """, {"game_id": game_id})
+        target = await cursor.fetchone()
+        if target is None:
+            raise ValueError("Nothing to undo.")
+        seq = game['event_seq'] + 1
+        await cursor.execute(
+            "INSERT INTO game_events (game_id, seq, kind, payload) VALUES (%s, %s, 'undo', %s)",
+            (game_id, seq, Jsonb({"seq": target['seq']})),
+        )
+        # Snapshots taken since the undone event include it.
+        await cursor.execute("DELETE FROM game_snapshots WHERE game_id = %s AND seq >= %s", (game_id, target['seq']))
+        state, current_hole = await _rebuild(cursor, game_id, seq)
+        new_version = await _write_state(cursor, game_id, state, current_hole, seq)
+    return {"undone_seq": target['seq'], "undone_kind": target['kind'], "seq": seq, "version": new_version,
+            "current_hole": current_hole}
+
+
+# -- reads -------------------------------------------------------------------------------
+
+async def _rebuild(cursor, game_id: int, upto: int) -> Tuple[dict, int]:
+    await cursor.execute("""
+        SELECT seq, current_hole, state FROM game_snapshots
+        WHERE game_id = %s AND seq <= %s ORDER BY seq DESC LIMIT 1
+    """, (game_id, upto))
+    snapshot = await cursor.fetchone()
+    start = snapshot['seq'] if snapshot else 0
+    await cursor.execute("""
+        SELECT seq, kind, payload FROM game_events
+        WHERE game_id = %s AND seq > %s AND seq <= %s ORDER BY seq
+    """, (game_id, start, upto))
+    events = await cursor.fetchall()
+    if upto > start and (not events or events[0]['seq'] != start + 1):
+        raise HistoryCompacted(f"History before event {events[0]['seq'] if events else upto} has been compacted.")
+    undone = {e['payload']['seq'] for e in events if e['kind'] == 'undo'}
+    if snapshot:
+        return replay(snapshot['state'], snapshot['current_hole'], events, undone)
+    return replay({}, 0, events, undone)
+
+
+async def state_at(db, game_id: int, seq: Optional[int] = None) -> Optional[dict]:
+    """
+    The game's state as of event ``seq`` (default: the latest), rebuilt from
+    the log. Returns ``None`` if the game does not exist.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("SELECT event_seq FROM games WHERE id = %s", (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
+            return None
+        upto = game['event_seq'] if seq is None else seq
+        if not 0 <= upto <= game['event_seq']:
+            raise ValueError(f"seq must be between 0 and {game['event_seq']}.")
+        state, current_hole = await _rebuild(cursor, game_id, upto)
+    return {"game_id": game_id, "seq": upto, "current_hole": current_hole, "state_json": state}
+
+
+async def list_events(db, game_id: int, after: int = 0, limit: int = 200) -> List[dict]:
+    limit = max(1, min(limit, 1000))
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT seq, kind, payload, created_at FROM game_events
+            WHERE game_id = %s AND seq > %s ORDER BY seq LIMIT %s
+        """, (game_id, after, limit))
+        return await cursor.fetchall()
+
+
+# -- compaction ------------------------------------------------------------------------------
+
+async def compact(db, game_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """
+    Snapshot games with ``SNAPSHOT_EVERY`` or more events since their last
+    snapshot (all of ``game_ids`` if given), prune old snapshots and apply
+    event retention. Runs in the caller's transaction. Returns counts.
+    """
+    counts = {"snapshots": 0, "pruned_snapshots": 0, "pruned_events": 0}
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT g.id, g.event_seq FROM games g
+            WHERE g.event_seq > 0 AND (%(ids)s::int[] IS NULL OR g.id = ANY(%(ids)s))
+              AND g.event_seq - COALESCE((SELECT MAX(s.seq) FROM game_snapshots s WHERE s.game_id = g.id), 0)
+                  >= CASE WHEN %(ids)s::int[] IS NULL THEN %(every)s ELSE 1 END
+        """, {"ids": game_ids, "every": SNAPSHOT_EVERY})
+        for game in await cursor.fetchall():
+            try:
+                state, current_hole = await _rebuild(cursor, game['id'], game['event_seq'])
+            except HistoryCompacted:
+                logger.warning(f"Cannot snapshot game {game['id']}: its history was compacted")
+                continue
+            await _snapshot(cursor, game['id'], game['event_seq'], current_hole, state)
+            counts["snapshots"] += 1
+
+        # Keep each game's oldest snapshot (the baseline replays start from) and its newest few.
+        await cursor.execute("""
+            DELETE FROM game_snapshots s USING (
+                SELECT game_id, seq,
+                       ROW_NUMBER() OVER (PARTITION BY game_id ORDER BY seq DESC) AS newest,
+                       ROW_NUMBER() OVER (PARTITION BY game_id ORDER BY seq) AS oldest
+                FROM game_snapshots
+                WHERE %(ids)s::int[] IS NULL OR game_id = ANY(%(ids)s)
+            ) ranked
+            WHERE s.game_id = ranked.game_id AND s.seq = ranked.seq
+              AND ranked.newest > %(keep)s AND ranked.oldest > 1
+        """, {"ids": game_ids, "keep": KEEP_SNAPSHOTS})
+        counts["pruned_snapshots"] = cursor.rowcount
+
+        if RETENTION_DAYS > 0:
+            # Old completed games keep only their final snapshot (taken above when missing).
+            await cursor.execute("""
+                WITH old AS (
+                    SELECT g.id, g.event_seq FROM games g
+                    WHERE g.is_complete AND g.completed_at < CURRENT_TIMESTAMP - make_interval(days => %(days)s)
+                      AND EXISTS (SELECT 1 FROM game_snapshots s WHERE s.game_id = g.id AND s.seq = g.event_seq)
+                      AND (%(ids)s::int[] IS NULL OR g.id = ANY(%(ids)s))
+                ), gone AS (
+                    DELETE FROM game_snapshots s USING old WHERE s.game_id = old.id AND s.seq < old.event_seq
+                )
+                DELETE FROM game_events e USING old WHERE e.game_id = old.id AND e.seq <= old.event_seq
+            """, {"ids": game_ids, "days": RETENTION_DAYS})
+            counts["pruned_events"] = cursor.rowcount
+    return counts
@@ -0,0 +1,208 @@
+"""
+Final per-player results for completed games.
+
+Working out who won a game means parsing ``games.state_json`` (summing Wolf
+``points`` lists or reading Skins ``total_winnings``). Doing that on every
+games-won/games-lost request makes those endpoints slower the more a player
+has played, so instead the result is computed once, by the job that runs after
+the game is marked complete (see jobs.py), and stored in the ``game_results`` table:
+
+    game_results (game_id, game_player_id, user_id, email, game_type,
+                  final_score, placement, outcome, completed_at)
+
+``outcome`` is ``'won'`` for the sole leader, ``'tied'`` when several players
+share first place and ``'lost'`` for everyone else. ``placement`` uses
+competition ranking (1, 2, 2, 4). Completed games nothing ranks (six-six-six,
+or no scores entered) still get a row per player, with no score, placement or
+outcome, so every completed game is in the table the history endpoint pages.
+
+Games completed before this table existed can be filled in with
+``python cli.py backfill-results``.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from psycopg.rows import dict_row
+
+import wolf
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_WON = 'won'
+OUTCOME_TIED = 'tied'
+OUTCOME_LOST = 'lost'
+
+
+@dataclass
+class PlayerResult:
+    game_player_id: int
+    user_id: Optional[int]
+    email: str
+    final_score: Optional[float]
+    placement: Optional[int]
+    outcome: Optional[str]
+
+
+# Game types ``final_scores`` can rank; games of other types get unranked results.
+SCORED_GAME_TYPES = ('wolf', 'skins')
+
+
+def load_state(state_json) -> dict:
+    """Return ``state_json`` (already decoded by psycopg) as a dict, ``{}`` for NULL."""
+    return state_json or {}
+
+
+def final_scores(game_type: str, state: dict) -> Dict[str, float]:
+    """
+    Final score per player email, higher is better.
+    - Wolf: sum of the per-hole ``points`` list.
+    - Skins: ``total_winnings``.
+    Unknown game types (or games with no scoring data yet) return ``{}``.
+    """
+    if game_type == 'wolf':
+        points = state.get('points') or {}
+        return {email: float(sum(pts or [])) for email, pts in points.items()}
+    if game_type == 'skins':
+        winnings = state.get('total_winnings') or {}
+        return {email: float(amount or 0) for email, amount in winnings.items()}
+    return {}
+
+
+def rank_players(players: Sequence[dict], scores: Dict[str, float]) -> List[PlayerResult]:
+    """
+    Rank ``players`` (dicts with ``game_player_id``, ``user_id`` and ``email``)
+    by ``scores``. Players without a score are ranked with 0.
+    """
+    scored = [(p, scores.get(p['email'], 0.0)) for p in players]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    top_score = scored[0][1] if scored else None
+    leaders = sum(1 for _, score in scored if score == top_score)
+
+    results = []
+    placement = 0
+    previous = None
+    for position, (player, score) in enumerate(scored, start=1):
+        if score != previous:
+            placement = position
+            previous = score
+        if placement == 1:
+            outcome = OUTCOME_WON if leaders == 1 else OUTCOME_TIED
+        else:
+            outcome = OUTCOME_LOST
+        results.append(PlayerResult(
+            game_player_id=player['game_player_id'],
+            user_id=player['user_id'],
+            email=player['email'],
+            final_score=score,
+            placement=placement,
+            outcome=outcome,
+        ))
+    return results
+
+
+def unranked(players: Sequence[dict]) -> List[PlayerResult]:
+    """A result without score, placement or outcome for each of ``players``, for a game nothing ranks."""
+    return [
+        PlayerResult(game_player_id=p['game_player_id'], user_id=p['user_id'], email=p['email'],
+                     final_score=None, placement=None, outcome=None)
+        for p in players
+    ]
+
+
+async def record_game_results(db, game_id: int) -> List[PlayerResult]:
+    """
+    Compute and upsert the ``game_results`` rows for one game.
+
+    Runs inside the caller's transaction (the caller commits). Returns the
+    stored results, which are ``unranked`` if the game has no scoring data.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT g.game_type, g.state_json, COALESCE(g.completed_at, g.created_at) AS completed_at,
+                   gp.id AS game_player_id, gp.user_id, gp.email
+            FROM games g
+            JOIN game_players gp ON gp.game_id = g.id
+            WHERE g.id = %s
+            ORDER BY gp.id
+        """, (game_id,))
+        rows = await cursor.fetchall()
+        if not rows:
+            return []
+        game_type = rows[0]['game_type']
+        # Wolf games rank by the running totals in game_standings (wolf.py), falling back to the state.
+        scores = await wolf.final_points(db, game_id) if game_type == 'wolf' else {}
+        if not scores:
+            scores = final_scores(game_type, load_state(rows[0]['state_json']))
+        if scores:
+            results = rank_players(rows, scores)
+        else:
+            logger.info(f"No scoring data for game {game_id}; recording it unranked")
+            results = unranked(rows)
+        await cursor.executemany("""
+            INSERT INTO game_results
+                (game_id, game_player_id, user_id, email, game_type, final_score, placement, outcome, completed_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (game_player_id) DO UPDATE SET
+                user_id = EXCLUDED.user_id,
+                email = EXCLUDED.email,
+                final_score = EXCLUDED.final_score,
+                placement = EXCLUDED.placement,
+                outcome = EXCLUDED.outcome,
+                completed_at = EXCLUDED.completed_at
+        """, [
+            (game_id, r.game_player_id, r.user_id, r.email, game_type,
+             r.final_score, r.placement, r.outcome, rows[0]['completed_at'])
+            for r in results
+        ])
+    return results
+
+
+async def fetch_games_by_outcome(db, user_id, outcomes: Iterable[str]) -> List[dict]:
+    """
+    Completed games for ``user_id`` whose stored outcome is one of ``outcomes``,
+    newest first. A single indexed query on ``game_results``.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT g.id, g.game_type, g.current_hole, g.is_complete, g.state_json, g.completed_at, g.created_at,
+                   gp.name AS player_name, gp.email AS player_email,
+                   gr.final_score, gr.placement, gr.outcome
+            FROM game_results gr
+            JOIN games g ON g.id = gr.game_id
+            JOIN game_players gp ON gp.id = gr.game_player_id
+            WHERE gr.user_id = %s AND gr.outcome = ANY(%s)
+            ORDER BY gr.completed_at DESC NULLS LAST, g.created_at DESC
+        """, (user_id, list(outcomes)))
+        return await cursor.fetchall()
+
+
+async def backfill_game_results(pool, batch_size: int = 200, only_missing: bool = True) -> int:
+    """
+    Compute results for already-completed games, ``batch_size`` games per transaction.
+    With ``only_missing`` (default) games that already have results are skipped.
+    Returns the number of games processed.
+    """
+    processed = 0
+    last_id = 0
+    missing_clause = (
+        "AND NOT EXISTS (SELECT 1 FROM game_results gr WHERE gr.game_id = g.id)" if only_missing else ""
+    )
+    while True:
+        async with pool.connection() as db:
+            async with db.cursor() as cursor:
+                await cursor.execute(f"""
+                    SELECT g.id FROM games g
+                    WHERE g.is_complete = TRUE AND g.id > %s {missing_clause}
+                    ORDER BY g.id
+                    LIMIT %s
+                """, (last_id, batch_size))
+                game_ids = [row[0] for row in await cursor.fetchall()]
+            if not game_ids:
+                break
+            for game_id in game_ids:
+                await record_game_results(db, game_id)
+            last_id = game_ids[-1]
+            processed += len(game_ids)
+        logger.info(f"Backfilled results for {processed} games (last game id {last_id})")
+    return processed
@@ -0,0 +1,170 @@
+"""
+Per-hole scores as rows.
+
+``games.state_json`` keeps strokes, pars and wolf points as nested JSON
+(``scores: {email: [...]}``, ``pars``, ``points``), which only Python could
+read. Every state write now also refreshes the game's rows in
+
+    hole_scores (game_id, game_player_id, hole, strokes, par, points)
+
+with the SQL function ``hole_score_rows`` (schema.sql), so the state never
+leaves the database. Writes pass the holes they touched (``touched_holes``
+for patches), so a score entry upserts one hole's rows rather than
+rewriting the whole card. Stroke statistics and the per-game facts achievements
+need (aces, birdies, variance, ...) are then plain aggregates over an indexed
+table.
+
+Games written before the table existed are filled in with
+``python cli.py backfill-hole-scores``.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from psycopg.rows import dict_row
+
+logger = logging.getLogger(__name__)
+
+
+# Where the hole index sits in a JSON Patch path into each per-hole part of the state.
+_HOLE_SEGMENT = {'scores': 2, 'points': 2, 'pars': 1, 'players': 3}
+
+
+def touched_holes(ops: Iterable[dict]) -> Optional[Set[int]]:
+    """
+    The holes (1-based) whose rows compiled JSON Patch ``ops`` (segment
+    paths, as ``state_patch.compile_ops`` and ``game_log.diff_ops`` return
+    them) can change, or ``None`` if any hole may have: a whole card, a
+    player or ``pars`` written at once, or an element inserted or removed
+    (which shifts the holes after it).
+    """
+    holes: Set[int] = set()
+    for op in ops:
+        path = op['path']
+        if op['op'] == 'test' or not path or path[0] not in _HOLE_SEGMENT:
+            continue
+        if path[0] == 'players' and len(path) > 2 and path[2] not in ('scores', 'email'):
+            continue
+        index = _HOLE_SEGMENT[path[0]]
+        if len(path) != index + 1 or op['op'] != 'replace' or not path[index].isdigit():
+            return None
+        holes.add(int(path[index]) + 1)
+    return holes
+
+
+async def sync_games(db, game_ids: List[int], holes: Optional[Iterable[int]] = None) -> None:
+    """
+    Bring the ``hole_scores`` rows of ``game_ids`` in line with what their
+    states hold now: only ``holes`` (1-based) if given, else every hole.
+    Changed rows are updated in place, unchanged ones are left alone and rows
+    for holes the state no longer scores are deleted.
+    """
+    holes = None if holes is None else sorted(set(holes))
+    if not game_ids or holes == []:
+        return
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            WITH fresh AS (
+                SELECT gp.game_id, gp.id AS game_player_id, r.hole, r.strokes, r.par, r.points
+                FROM games g
+                JOIN game_players gp ON gp.game_id = g.id
+                CROSS JOIN LATERAL hole_score_rows(g.state_json, gp.email, g.game_type::text) r
+                WHERE g.id = ANY(%(game_ids)s) AND g.state_json IS NOT NULL
+                  AND (%(holes)s::int[] IS NULL OR r.hole = ANY(%(holes)s::int[]))
+            ),
+            cleared AS (
+                DELETE FROM hole_scores hs
+                WHERE hs.game_id = ANY(%(game_ids)s)
+                  AND (%(holes)s::int[] IS NULL OR hs.hole = ANY(%(holes)s::int[]))
+                  AND NOT EXISTS (SELECT 1 FROM fresh f WHERE f.game_player_id = hs.game_player_id AND f.hole = hs.hole)
+            )
+            INSERT INTO hole_scores AS hs (game_id, game_player_id, hole, strokes, par, points)
+            SELECT game_id, game_player_id, hole, strokes, par, points FROM fresh
+            ON CONFLICT (game_player_id, hole) DO UPDATE
+            SET strokes = EXCLUDED.strokes, par = EXCLUDED.par, points = EXCLUDED.points
+            WHERE (hs.strokes, hs.par, hs.points) IS DISTINCT FROM (EXCLUDED.strokes, EXCLUDED.par, EXCLUDED.points)
+        """, {"game_ids": game_ids, "holes": holes})
+
+
+async def game_aggregates(db, game_id: int) -> Dict[str, dict]:
+    """
+    Stroke aggregates per player email for one game:
+
+    - ``played``: holes with strokes; ``total``: their sum; ``variance``: population variance
+    - ``aces``, ``eagles`` (2+ under par), ``birdies`` (1 under)
+    - ``rated``: holes with both strokes and par; ``to_par``: their strokes minus par
+    - ``last_hole``: highest hole with strokes; ``pars``: length of the game's ``pars``
+    - ``hole_7``: strokes on hole 7; ``front_nine``: strokes on holes 1-9 if all were played
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT gp.email,
+                   COUNT(hs.strokes) AS played,
+                   COALESCE(SUM(hs.strokes), 0) AS total,
+                   VAR_POP(hs.strokes) AS variance,
+                   COUNT(*) FILTER (WHERE hs.strokes = 1) AS aces,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par <= -2) AS eagles,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par = -1) AS birdies,
+                   COUNT(hs.strokes - hs.par) AS rated,
+                   COALESCE(SUM(hs.strokes - hs.par), 0) AS to_par,
+                   MAX(hs.hole) FILTER (WHERE hs.strokes IS NOT NULL) AS last_hole,
+                   MAX(hs.strokes) FILTER (WHERE hs.hole = 7) AS hole_7,
+                   CASE WHEN COUNT(hs.strokes) FILTER (WHERE hs.hole <= 9) = 9
+                        THEN SUM(hs.strokes) FILTER (WHERE hs.hole <= 9) END AS front_nine,
+                   CASE WHEN jsonb_typeof(g.state_json->'pars') = 'array'
+                        THEN jsonb_array_length(g.state_json->'pars') ELSE 0 END AS pars
+            FROM game_players gp
+            JOIN games g ON g.id = gp.game_id
+            LEFT JOIN hole_scores hs ON hs.game_player_id = gp.id
+            WHERE gp.game_id = %s
+            GROUP BY gp.id, g.id
+            ORDER BY gp.id
+        """, (game_id,))
+        return {row['email']: row for row in await cursor.fetchall()}
+
+
+async def user_scoring_stats(db, user_id: int, game_type: Optional[str] = None) -> dict:
+    """Stroke statistics over a user's completed games, optionally of one game type."""
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT COUNT(DISTINCT hs.game_id) AS games,
+                   COUNT(hs.strokes) AS holes,
+                   ROUND(AVG(hs.strokes), 2) AS avg_strokes,
+                   ROUND(AVG(hs.strokes - hs.par), 2) AS avg_to_par,
+                   ROUND(VAR_POP(hs.strokes)::numeric, 2) AS variance,
+                   COUNT(*) FILTER (WHERE hs.strokes = 1) AS aces,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par <= -2) AS eagles,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par = -1) AS birdies,
+                   COUNT(*) FILTER (WHERE hs.strokes = hs.par) AS pars,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par = 1) AS bogeys,
+                   COUNT(*) FILTER (WHERE hs.strokes - hs.par >= 2) AS double_bogeys_or_worse,
+                   COALESCE(SUM(hs.points), 0) AS wolf_points
+            FROM game_players gp
+            JOIN games g ON g.id = gp.game_id
+            JOIN hole_scores hs ON hs.game_player_id = gp.id
+            WHERE gp.user_id = %s AND g.is_complete = TRUE AND (%s::text IS NULL OR g.game_type::text = %s)
+        """, (user_id, game_type, game_type))
+        stats = await cursor.fetchone()
+    return {"user_id": user_id, "game_type": game_type, **stats}
+
+
+async def backfill(pool, batch_size: int = 500) -> int:
+    """
+    Sync ``hole_scores`` for every game with a state, ``batch_size`` games per
+    transaction. Safe to re-run. Returns the number of games processed.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        async with pool.connection() as db:
+            async with db.cursor() as cursor:
+                await cursor.execute("""
+                    SELECT id FROM games WHERE id > %s AND state_json IS NOT NULL ORDER BY id LIMIT %s
+                """, (last_id, batch_size))
+                game_ids = [row[0] for row in await cursor.fetchall()]
+            if not game_ids:
+                break
+            await sync_games(db, game_ids)
+            last_id = game_ids[-1]
+            processed += len(game_ids)
+        logger.info(f"Backfilled hole scores for {processed} games (last game id {last_id})")
+    return processed
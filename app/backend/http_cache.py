@@ -0,0 +1,106 @@
+"""
+HTTP conditional requests (ETag / Last-Modified -> 304 Not Modified).
+
+Clients poll game state, players and the achievements catalog. Each response
+carries a validator; when the client sends it back in ``If-None-Match`` (or
+``If-Modified-Since``) and nothing changed, the endpoint answers ``304`` with
+no body instead of re-reading and re-serializing the payload. Browsers do this
+on their own for responses marked ``Cache-Control: no-cache``.
+
+- Game state: the ETag is ``games.state_version``, so an unchanged game is
+  recognised without reading ``state_json`` (see ``state_version_from_etag``).
+- Players and the achievements catalog: the ETag is a hash of the content.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from serialization import FastJSONResponse, dumps
+
+# Live data: always revalidate (cheap thanks to the ETag).
+NO_CACHE = "private, no-cache"
+# A completed game no longer changes.
+COMPLETED_GAME = "private, max-age=300"
+# Shared by all users and changed only by deploys.
+CATALOG = "public, max-age=300, stale-while-revalidate=3600"
+
+
+def content_etag(payload: Any) -> str:
+    """Strong ETag derived from the JSON form of ``payload``."""
+    return '"' + hashlib.sha256(dumps(payload, sort_keys=True)).hexdigest()[:32] + '"'
+
+
+def state_etag(game_id: int, version: int) -> str:
+    return f'"game-{game_id}-v{version}"'
+
+
+def state_version_from_etag(request: Request, game_id: int) -> Optional[int]:
+    """The state version the client already has, taken from ``If-None-Match``, if any."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    prefix = f'"game-{game_id}-v'
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag.startswith(prefix) and tag.endswith('"'):
+            try:
+                return int(tag[len(prefix):-1])
+            except ValueError:
+                continue
+    return None
+
+
+def http_date(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    True if the client's copy is current. ``If-None-Match`` takes precedence;
+    ``If-Modified-Since`` is only consulted without it (RFC 9110 13.2.2).
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison: W/"x" matches "x".
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag.removeprefix('W/') in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        # HTTP dates have whole-second precision.
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def _headers(etag: str, cache_control: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, cache_control: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=_headers(etag, cache_control, last_modified))
+
+
+def conditional_json(request: Request, content: Any, etag: str, cache_control: str,
+                     last_modified: Optional[datetime] = None) -> Response:
+    """``content`` as JSON with validators, or ``304`` if the client already has it."""
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, cache_control, last_modified)
+    return FastJSONResponse(content=content, headers=_headers(etag, cache_control, last_modified))
@@ -0,0 +1,130 @@
+"""
+Per-route HTTP metrics.
+
+``MetricsMiddleware`` wraps every HTTP request (websockets are left alone)
+and records, per method and route template (``/games/{game_id}/state``, not
+the concrete URL):
+
+- request count by status code,
+- total latency, split into time spent in database queries and the rest
+  (handler code, serialization),
+- pool wait: time spent waiting for a pooled connection,
+- queries run and rows returned,
+- response body size.
+
+Database numbers come from the ``RequestStats`` that ``TimedCursor`` and
+``AsyncPool.connection`` fill in (see database.py and metrics.py). The cost per
+request is a few clock reads and dictionary updates, so it stays on in
+production; ``GET /metrics`` renders everything for Prometheus.
+"""
+import threading
+import time
+from typing import Dict, Tuple
+
+from metrics import Histogram, LatencyHistogram, PrometheusWriter, RequestStats, current_request
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000)
+
+# Requests that matched no route share one label instead of one per URL.
+UNMATCHED_ROUTE = "unmatched"
+
+
+class _RouteStats:
+    __slots__ = ("duration", "db", "handler", "pool_wait", "rows", "response_size", "queries", "statuses")
+
+    def __init__(self) -> None:
+        self.duration = LatencyHistogram(LATENCY_BUCKETS_MS)
+        self.db = LatencyHistogram(LATENCY_BUCKETS_MS)
+        self.handler = LatencyHistogram(LATENCY_BUCKETS_MS)
+        self.pool_wait = LatencyHistogram(LATENCY_BUCKETS_MS)
+        self.rows = Histogram(ROWS_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS_BYTES)
+        self.queries = 0
+        self.statuses: Dict[int, int] = {}
+
+
+class RouteMetrics:
+    """Metrics per (method, route template)."""
+
+    def __init__(self) -> None:
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float,
+                request: RequestStats, response_bytes: int) -> None:
+        key = (method, route)
+        stats = self._routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._routes.setdefault(key, _RouteStats())
+        stats.duration.observe(seconds)
+        stats.db.observe(request.db_seconds)
+        stats.handler.observe(max(0.0, seconds - request.db_seconds - request.pool_wait_seconds))
+        stats.pool_wait.observe(request.pool_wait_seconds)
+        stats.rows.observe(request.rows)
+        stats.response_size.observe(response_bytes)
+        with self._lock:
+            stats.queries += request.queries
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def write(self, out: PrometheusWriter) -> None:
+        routes = sorted(self._routes.items())
+        for (method, route), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                out.counter("http_requests_total", "HTTP requests by route and status.", count,
+                            {"method": method, "route": route, "status": status})
+        histograms = (
+            ("http_request_duration_seconds", "Total request latency.", "duration", 0.001),
+            ("http_request_db_seconds", "Time spent in database queries per request.", "db", 0.001),
+            ("http_request_handler_seconds", "Request latency outside database queries and pool waits.",
+             "handler", 0.001),
+            ("http_request_pool_wait_seconds", "Time spent waiting for a pooled connection per request.",
+             "pool_wait", 0.001),
+            ("http_request_db_rows", "Rows returned by database queries per request.", "rows", 1.0),
+            ("http_response_size_bytes", "Response body size.", "response_size", 1.0),
+        )
+        for name, help_text, attribute, scale in histograms:
+            for (method, route), stats in routes:
+                out.histogram(name, help_text, getattr(stats, attribute).snapshot(),
+                              {"method": method, "route": route}, scale=scale)
+        for (method, route), stats in routes:
+            out.counter("http_request_db_queries_total", "Database queries run by requests.", stats.queries,
+                        {"method": method, "route": route})
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no extra task or buffering per request) feeding ``RouteMetrics``."""
+
+    def __init__(self, app, route_metrics: RouteMetrics) -> None:
+        self.app = app
+        self.route_metrics = route_metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestStats()
+        token = current_request.set(request)
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            # The router stores the matched route in the scope it was given.
+            route = scope.get("route")
+            path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            self.route_metrics.observe(scope["method"], path, status, elapsed, request, response_bytes)
@@ -0,0 +1,244 @@
+"""
+Durable background jobs stored in Postgres.
+
+Work that follows a request but doesn't need to finish before the response
+(game results, leaderboards, achievements, notifications after a game
+completes) is enqueued as a row in ``job_queue`` in the same transaction as
+the request's own write. Either both are committed or neither is, and the
+request returns as soon as its transaction commits.
+
+Workers drain the queue concurrently:
+- A worker claims one ready job with ``SELECT ... FOR UPDATE SKIP LOCKED``, so
+  workers never block on or double-process each other's jobs.
+- The handler runs inside a savepoint of that same transaction. On success
+  the job row is deleted and everything commits together; if the worker dies
+  mid-job the transaction rolls back and the job is simply picked up again.
+- A failing job is retried with exponential backoff (``run_at`` moves
+  forward). After ``max_attempts`` it is moved to ``job_dead_letter`` with
+  its last error for a human to look at.
+
+Workers run inside the API process (``JOB_WORKERS``, default 1) and/or as
+separate processes with ``python cli.py worker``. ``queue_stats`` reports
+depth, lag and dead letters per job kind.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from metrics import LatencyHistogram
+import achievements
+import game_log
+import game_results
+import leaderboards
+import websocket_backplane
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Retry delay is 2^attempts seconds, capped here.
+MAX_BACKOFF_SECONDS = 300
+
+Handler = Callable[..., Awaitable[None]]
+HANDLERS: Dict[str, Handler] = {}
+
+
+def job_handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register ``async def handler(db, payload)`` for jobs of ``kind``."""
+    def register(handler: Handler) -> Handler:
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+async def enqueue(db, kind: str, payload: dict, delay_seconds: float = 0,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+    """Add a job inside the caller's transaction (it only becomes visible when the caller commits)."""
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            INSERT INTO job_queue (kind, payload, max_attempts, run_at)
+            VALUES (%s, %s::jsonb, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            RETURNING id
+        """, (kind, Jsonb(payload), max_attempts, delay_seconds))
+        return (await cursor.fetchone())[0]
+
+
+async def queue_stats(db) -> Dict:
+    """Depth, lag (age of the oldest ready job) and dead letters per job kind."""
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT kind,
+                   COUNT(*) AS queued,
+                   COUNT(*) FILTER (WHERE run_at <= CURRENT_TIMESTAMP) AS ready,
+                   COUNT(*) FILTER (WHERE attempts > 0) AS retrying,
+                   COALESCE(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP
+                       - MIN(run_at) FILTER (WHERE run_at <= CURRENT_TIMESTAMP)), 0)::float AS lag_seconds
+            FROM job_queue
+            GROUP BY kind
+        """)
+        kinds = {row.pop('kind'): {**row, "dead": 0} for row in await cursor.fetchall()}
+        await cursor.execute("SELECT kind, COUNT(*) AS dead FROM job_dead_letter GROUP BY kind")
+        for row in await cursor.fetchall():
+            kinds.setdefault(row['kind'], {"queued": 0, "ready": 0, "retrying": 0, "lag_seconds": 0.0})
+            kinds[row['kind']]["dead"] = row['dead']
+    return {
+        "kinds": kinds,
+        "queued": sum(k["queued"] for k in kinds.values()),
+        "lag_seconds": max((k["lag_seconds"] for k in kinds.values()), default=0.0),
+        "dead": sum(k["dead"] for k in kinds.values()),
+    }
+
+
+class JobWorker:
+    """Runs ``concurrency`` loops that each claim and process one job at a time."""
+
+    def __init__(self, pool, concurrency: int = 1, poll_interval: float = 0.5,
+                 handlers: Optional[Dict[str, Handler]] = None) -> None:
+        self.pool = pool
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.handlers = handlers if handlers is not None else HANDLERS
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.job_latency = LatencyHistogram(buckets_ms=(10, 50, 100, 500, 1000, 5000, 30000, 60000, 300000))
+        self._tasks: List[asyncio.Task] = []
+        self._processed = 0
+        self._retried = 0
+        self._dead_lettered = 0
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._loop(n)) for n in range(self.concurrency)]
+        logger.info(f"Job worker {self.name} started with {self.concurrency} loops")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_forever(self) -> None:
+        await self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    def stats(self) -> Dict:
+        return {
+            "worker": self.name,
+            "concurrency": self.concurrency,
+            "processed": self._processed,
+            "retried": self._retried,
+            "dead_lettered": self._dead_lettered,
+            "enqueue_to_done_ms": self.job_latency.snapshot(),
+        }
+
+    async def _loop(self, n: int) -> None:
+        while True:
+            try:
+                worked = await self.run_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Database unavailable or similar; back off and try again.
+                logger.error(f"Job worker loop {n} error: {e}", exc_info=True)
+                worked = False
+            if not worked:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_one(self) -> bool:
+        """Claim and process one ready job. Returns False if none was ready."""
+        async with self.pool.connection() as db:
+            async with db.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute("""
+                    SELECT id, kind, payload, attempts, max_attempts
+                    FROM job_queue
+                    WHERE run_at <= CURRENT_TIMESTAMP
+                    ORDER BY run_at, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """)
+                job = await cursor.fetchone()
+                if job is None:
+                    return False
+                started = time.monotonic()
+                try:
+                    handler = self.handlers.get(job['kind'])
+                    if handler is None:
+                        raise LookupError(f"No handler registered for job kind {job['kind']!r}")
+                    # Savepoint: a failing handler's writes are undone but the job row stays locked by us.
+                    async with db.transaction():
+                        await handler(db, job['payload'])
+                except Exception as e:
+                    await self._record_failure(cursor, job, e)
+                    return True
+                await cursor.execute(
+                    "DELETE FROM job_queue WHERE id = %s "
+                    "RETURNING EXTRACT(EPOCH FROM clock_timestamp()::timestamp - created_at)::float AS age",
+                    (job['id'],)
+                )
+                age = (await cursor.fetchone())['age']
+        self._processed += 1
+        self.job_latency.observe(max(0.0, age))
+        logger.info(f"Job {job['id']} ({job['kind']}) done in {time.monotonic() - started:.3f}s")
+        return True
+
+    async def _record_failure(self, cursor, job: dict, error: Exception) -> None:
+        attempts = job['attempts'] + 1
+        message = f"{type(error).__name__}: {error}"
+        if attempts >= job['max_attempts']:
+            await cursor.execute("""
+                WITH moved AS (DELETE FROM job_queue WHERE id = %s RETURNING *)
+                INSERT INTO job_dead_letter (id, kind, payload, attempts, last_error, created_at)
+                SELECT id, kind, payload, %s, %s, created_at FROM moved
+            """, (job['id'], attempts, message))
+            self._dead_lettered += 1
+            logger.error(f"Job {job['id']} ({job['kind']}) failed {attempts} times, moved to dead letters: {message}",
+                         exc_info=error)
+        else:
+            delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+            await cursor.execute("""
+                UPDATE job_queue
+                SET attempts = %s, last_error = %s, run_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                WHERE id = %s
+            """, (attempts, message, delay, job['id']))
+            self._retried += 1
+            logger.warning(f"Job {job['id']} ({job['kind']}) failed (attempt {attempts}), retrying in {delay}s: {message}")
+
+
+# -- handlers ----------------------------------------------------------------------
+
+@job_handler('game.completed')
+async def handle_game_completed(db, payload: dict) -> None:
+    """Everything that follows a game being marked complete, in dependency order."""
+    game_id = payload['game_id']
+    results = await game_results.record_game_results(db, game_id)
+    await leaderboards.on_game_completed(db, game_id)
+    unlocked = await achievements.on_game_completed(db, game_id)
+    await game_log.compact(db, [game_id])
+    await websocket_backplane.notify_game(db, game_id, {
+        "type": "game_completed",
+        "game_id": game_id,
+        "results": [{"email": r.email, "placement": r.placement, "outcome": r.outcome} for r in results],
+        "unlocked_achievements": unlocked,
+    })
+
+
+@job_handler('game.deleted')
+async def handle_game_deleted(db, payload: dict) -> None:
+    """Streaks and partners cannot be subtracted, so replay every counter without the deleted game."""
+    replayed = await achievements.rebuild_user_stats(db)
+    logger.info(f"Replayed {replayed} games into user_stats after deleting game {payload['game_id']}")
+
+
+@job_handler('games.imported')
+async def handle_games_imported(db, payload: dict) -> None:
+    """Historical games landed out of order, so rebuild boards and counters instead of updating them."""
+    counts = await leaderboards.rebuild_all(db)
+    replayed = await achievements.rebuild_user_stats(db)
+    logger.info(f"Rebuilt {len(counts)} leaderboards and replayed {replayed} games "
+                f"after importing {len(payload['game_ids'])} games")
@@ -0,0 +1,512 @@
+"""
+Materialized leaderboards backed by the ``leaderboard_cache`` table.
+
+Instead of aggregating users, games and achievements on every
+``/leaderboards/{type}`` request, each board is stored as ranked rows in
+``leaderboard_cache`` and kept up to date incrementally:
+
+- When a game completes (``on_game_completed``) only the rows of the players in
+  that game are recomputed, on the boards that game can affect: weekly,
+  monthly and all_time, both overall and for the game's type.
+- When achievements unlock (``on_achievements_unlocked``) the user's
+  achievement points are refreshed on every board they appear on.
+- When a completed game is deleted (``on_game_deleted``) its results are
+  subtracted from the daily buckets and the boards it affected are rebuilt on
+  their next read.
+- After rows change, ranks on the touched boards are recomputed with a window
+  function, and only rows whose rank actually moved are written.
+
+Weekly and monthly boards are rolling windows at day granularity: a board
+built today covers ``period_start`` (today minus 7 or 30 days) through
+``period_end`` (today). Each build is recorded in ``leaderboard_boards``
+(window and build time per board, whether or not the board has entries), and
+reading a board that was never built or whose ``period_end`` is before today
+rebuilds it first, so ``last_updated`` always reflects when the data was
+really computed. ``rebuild_all`` (``POST /leaderboards/rebuild`` or
+``python cli.py rebuild-leaderboards``) recomputes every board from scratch.
+
+Boards are summed from ``user_daily_stats``: per-user, per-game-type, per-day
+buckets of games played, games won and points, bumped once per completed game
+(``record_daily_stats``). A weekly board is a sum over 7 buckets per user and a
+monthly board over 30, never a scan of the games table; arbitrary windows such
+as a league season (``get_custom_board``) are answered from the same buckets.
+Wins come from ``game_results`` (a shared first place counts as a win, the same
+as ``/users/{user_key}/games-won``).
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+logger = logging.getLogger(__name__)
+
+# Rolling window length in days; None means all time.
+LEADERBOARD_WINDOWS: Dict[str, Optional[int]] = {
+    'weekly': 7,
+    'monthly': 30,
+    'all_time': None,
+}
+
+# Mirrors game_type_enum in schema.sql.
+GAME_TYPES: Tuple[str, ...] = ('wolf', 'skins', 'sixsixsix')
+
+Board = Tuple[str, Optional[str]]  # (leaderboard_type, game_type or None for all games)
+
+ALL_BOARDS: Tuple[Board, ...] = tuple(
+    (leaderboard_type, game_type)
+    for leaderboard_type in LEADERBOARD_WINDOWS
+    for game_type in (None,) + GAME_TYPES
+)
+
+RANK_ORDER = """
+    (score_data->>'games_won')::int DESC,
+    (score_data->>'win_rate')::numeric DESC,
+    (score_data->>'total_achievement_points')::int DESC,
+    user_id
+"""
+
+
+def window_bounds(leaderboard_type: str, today: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    """``(period_start, period_end)`` for a board; ``(None, None)`` for all_time."""
+    if leaderboard_type not in LEADERBOARD_WINDOWS:
+        raise ValueError("Invalid leaderboard type")
+    days = LEADERBOARD_WINDOWS[leaderboard_type]
+    if days is None:
+        return None, None
+    today = today or date.today()
+    # Inclusive on both ends: a 7-day window is today plus the 6 days before it.
+    return today - timedelta(days=days - 1), today
+
+
+def boards_for_game(game_type: str) -> List[Tuple[str, Optional[str]]]:
+    """Every ``(leaderboard_type, game_type)`` board a completed game of ``game_type`` affects."""
+    return [(board, gt) for board in LEADERBOARD_WINDOWS for gt in (None, game_type)]
+
+
+async def record_daily_stats(cursor, game_id: int) -> None:
+    """Add one completed game's results to its players' daily buckets."""
+    await cursor.execute("""
+        INSERT INTO user_daily_stats (user_id, game_type, day, games_played, games_won, points)
+        SELECT user_id, game_type, completed_at::date,
+               COUNT(*), COUNT(*) FILTER (WHERE outcome IN ('won', 'tied')), SUM(final_score)
+        FROM game_results
+        WHERE game_id = %s AND user_id IS NOT NULL AND outcome IS NOT NULL AND completed_at IS NOT NULL
+        GROUP BY user_id, game_type, completed_at::date
+        ON CONFLICT (user_id, game_type, day) DO UPDATE SET
+            games_played = user_daily_stats.games_played + EXCLUDED.games_played,
+            games_won = user_daily_stats.games_won + EXCLUDED.games_won,
+            points = user_daily_stats.points + EXCLUDED.points
+    """, (game_id,))
+
+
+async def rebuild_daily_stats(cursor) -> None:
+    """Recompute every daily bucket from ``game_results``."""
+    await cursor.execute("DELETE FROM user_daily_stats")
+    await cursor.execute("""
+        INSERT INTO user_daily_stats (user_id, game_type, day, games_played, games_won, points)
+        SELECT user_id, game_type, completed_at::date,
+               COUNT(*), COUNT(*) FILTER (WHERE outcome IN ('won', 'tied')), SUM(final_score)
+        FROM game_results
+        WHERE user_id IS NOT NULL AND outcome IS NOT NULL AND completed_at IS NOT NULL
+        GROUP BY user_id, game_type, completed_at::date
+    """)
+
+
+async def _compute_stats(cursor, period_start: Optional[date], period_end: Optional[date],
+                         game_type: Optional[str], user_ids: Optional[Sequence[int]] = None) -> List[dict]:
+    """
+    Sum the daily buckets in ``[period_start, period_end]`` per user (either bound
+    may be None for open-ended), optionally for one game type and only ``user_ids``.
+    """
+    filters = []
+    params: List = []
+    if period_start is not None:
+        filters.append("s.day >= %s")
+        params.append(period_start)
+    if period_end is not None:
+        filters.append("s.day <= %s")
+        params.append(period_end)
+    if game_type:
+        filters.append("s.game_type = %s")
+        params.append(game_type)
+    if user_ids is not None:
+        filters.append("s.user_id = ANY(%s)")
+        params.append(list(user_ids))
+    where = ("WHERE " + " AND ".join(filters)) if filters else ""
+    await cursor.execute(f"""
+        SELECT u.id AS user_id,
+               u.name AS user_name,
+               SUM(s.games_won) AS games_won,
+               SUM(s.games_played) AS total_games,
+               SUM(s.points) AS total_points,
+               COALESCE(ua_points.points, 0) AS total_achievement_points
+        FROM user_daily_stats s
+        JOIN users u ON u.id = s.user_id
+        LEFT JOIN (
+            SELECT ua.user_id, SUM(a.points) AS points
+            FROM user_achievements ua
+            JOIN achievements a ON ua.achievement_id = a.id
+            GROUP BY ua.user_id
+        ) ua_points ON ua_points.user_id = u.id
+        {where}
+        GROUP BY u.id, u.name, ua_points.points
+        HAVING SUM(s.games_played) > 0
+    """, params)
+    return await cursor.fetchall()
+
+
+def _score_data(row: dict) -> dict:
+    games_won = int(row['games_won'])
+    total_games = int(row['total_games'])
+    return {
+        "games_won": games_won,
+        "total_games": total_games,
+        "win_rate": round(games_won / total_games * 100, 1) if total_games else 0.0,
+        "total_points": float(row['total_points'] or 0),
+        "total_achievement_points": int(row['total_achievement_points']),
+    }
+
+
+def _rank_key(score_data: dict, user_id: int) -> tuple:
+    """Python equivalent of ``RANK_ORDER``."""
+    return (-score_data['games_won'], -score_data['win_rate'], -score_data['total_achievement_points'], user_id)
+
+
+async def _upsert_rows(cursor, leaderboard_type: str, game_type: Optional[str], rows: Iterable[dict]) -> None:
+    period_start, period_end = window_bounds(leaderboard_type)
+    # New rows get a provisional rank; _rerank fixes it right after.
+    await cursor.executemany("""
+        INSERT INTO leaderboard_cache
+            (leaderboard_type, game_type, period_start, period_end, user_id, user_name, rank, score_data, last_updated)
+        VALUES (%s, %s, %s, %s, %s, %s, 0, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (leaderboard_type, (COALESCE(game_type, '')), user_id) DO UPDATE SET
+            period_start = EXCLUDED.period_start,
+            period_end = EXCLUDED.period_end,
+            user_name = EXCLUDED.user_name,
+            score_data = EXCLUDED.score_data,
+            last_updated = EXCLUDED.last_updated
+    """, [
+        (leaderboard_type, game_type, period_start, period_end, row['user_id'], row['user_name'],
+         Jsonb(_score_data(row)))
+        for row in rows
+    ])
+
+
+async def _rerank(cursor, leaderboard_type: str, game_type: Optional[str]) -> None:
+    """Recompute ranks on one board, writing only rows whose rank changed."""
+    await cursor.execute(f"""
+        UPDATE leaderboard_cache lc
+        SET rank = ranked.new_rank
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY {RANK_ORDER}) AS new_rank
+            FROM leaderboard_cache
+            WHERE leaderboard_type = %s AND game_type IS NOT DISTINCT FROM %s
+        ) ranked
+        WHERE lc.id = ranked.id AND lc.rank <> ranked.new_rank
+    """, (leaderboard_type, game_type))
+
+
+async def _compute_all_boards(cursor, today: Optional[date] = None) -> Dict[Board, List[dict]]:
+    """
+    Aggregate every board in a single pass over ``user_daily_stats``.
+
+    ``GROUPING SETS`` produces per-game-type and all-games rows together, and
+    one ``FILTER``ed sum per rolling window yields weekly, monthly and all_time
+    totals from the same scan.
+    """
+    today = today or date.today()
+    params: Dict = {"today": today}
+    window_columns = []
+    for leaderboard_type in LEADERBOARD_WINDOWS:
+        period_start, _ = window_bounds(leaderboard_type, today)
+        if period_start is None:
+            condition = ""
+        else:
+            params[f"{leaderboard_type}_start"] = period_start
+            condition = f" FILTER (WHERE s.day BETWEEN %({leaderboard_type}_start)s AND %(today)s)"
+        window_columns.append(
+            f"SUM(s.games_played){condition} AS {leaderboard_type}_games, "
+            f"SUM(s.games_won){condition} AS {leaderboard_type}_won, "
+            f"SUM(s.points){condition} AS {leaderboard_type}_points"
+        )
+    await cursor.execute(f"""
+        SELECT s.user_id,
+               u.name AS user_name,
+               CASE WHEN GROUPING(s.game_type) = 1 THEN NULL ELSE s.game_type::text END AS game_type,
+               COALESCE(ua_points.points, 0) AS total_achievement_points,
+               {", ".join(window_columns)}
+        FROM user_daily_stats s
+        JOIN users u ON u.id = s.user_id
+        LEFT JOIN (
+            SELECT ua.user_id, SUM(a.points) AS points
+            FROM user_achievements ua
+            JOIN achievements a ON ua.achievement_id = a.id
+            GROUP BY ua.user_id
+        ) ua_points ON ua_points.user_id = u.id
+        GROUP BY GROUPING SETS (
+            (s.user_id, u.name, ua_points.points, s.game_type),
+            (s.user_id, u.name, ua_points.points)
+        )
+    """, params)
+
+    boards: Dict[Board, List[dict]] = {board: [] for board in ALL_BOARDS}
+    for row in await cursor.fetchall():
+        for leaderboard_type in LEADERBOARD_WINDOWS:
+            games = row[f"{leaderboard_type}_games"]
+            if not games:
+                continue
+            boards.setdefault((leaderboard_type, row['game_type']), []).append({
+                "user_id": row['user_id'],
+                "user_name": row['user_name'],
+                "games_won": row[f"{leaderboard_type}_won"],
+                "total_games": games,
+                "total_points": row[f"{leaderboard_type}_points"],
+                "total_achievement_points": row['total_achievement_points'],
+            })
+    return boards
+
+
+async def rebuild_boards(db, boards: Iterable[Board]) -> Dict[str, int]:
+    """
+    Replace the given boards with freshly aggregated rows, computed in one pass.
+    Returns entry counts keyed by ``type/game_type``.
+    """
+    boards = list(boards)
+    counts = {}
+    async with db.cursor(row_factory=dict_row) as cursor:
+        computed = await _compute_all_boards(cursor)
+        for leaderboard_type, game_type in boards:
+            rows = computed.get((leaderboard_type, game_type), [])
+            await cursor.execute(
+                "DELETE FROM leaderboard_cache WHERE leaderboard_type = %s AND game_type IS NOT DISTINCT FROM %s",
+                (leaderboard_type, game_type)
+            )
+            await _upsert_rows(cursor, leaderboard_type, game_type, rows)
+            await _rerank(cursor, leaderboard_type, game_type)
+            counts[f"{leaderboard_type}/{game_type or 'all'}"] = len(rows)
+        await _record_builds(cursor, list(boards))
+    logger.info(f"Rebuilt leaderboards {sorted(counts)}")
+    return counts
+
+
+async def _record_builds(cursor, boards: Sequence[Board]) -> None:
+    """Note in ``leaderboard_boards`` that ``boards`` were just built, even the ones with no entries."""
+    bounds = [window_bounds(leaderboard_type) for leaderboard_type, _ in boards]
+    await cursor.execute("""
+        INSERT INTO leaderboard_boards (leaderboard_type, game_type, period_start, period_end, last_updated)
+        SELECT b.leaderboard_type, b.game_type, b.period_start, b.period_end, CURRENT_TIMESTAMP
+        FROM unnest(%s::varchar[], %s::varchar[], %s::date[], %s::date[])
+             AS b(leaderboard_type, game_type, period_start, period_end)
+        ON CONFLICT (leaderboard_type, game_type) DO UPDATE SET
+            period_start = EXCLUDED.period_start,
+            period_end = EXCLUDED.period_end,
+            last_updated = EXCLUDED.last_updated
+    """, ([b[0] for b in boards], [b[1] or '' for b in boards],
+          [start for start, _ in bounds], [end for _, end in bounds]))
+
+
+async def rebuild_all(db) -> Dict[str, int]:
+    """Rebuild the daily buckets and then every board. Returns entry counts keyed by ``type/game_type``."""
+    async with db.cursor() as cursor:
+        await rebuild_daily_stats(cursor)
+    return await rebuild_boards(db, ALL_BOARDS)
+
+
+async def on_game_completed(db, game_id: int) -> None:
+    """Incrementally refresh the boards affected by a just-completed game (caller commits)."""
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await record_daily_stats(cursor, game_id)
+        await cursor.execute(
+            "SELECT game_type, array_agg(user_id) AS user_ids FROM game_results "
+            "WHERE game_id = %s AND user_id IS NOT NULL AND outcome IS NOT NULL GROUP BY game_type",
+            (game_id,)
+        )
+        game = await cursor.fetchone()
+        if not game:
+            return
+        for leaderboard_type, game_type in boards_for_game(game['game_type']):
+            period_start, period_end = window_bounds(leaderboard_type)
+            rows = await _compute_stats(cursor, period_start, period_end, game_type, game['user_ids'])
+            await _upsert_rows(cursor, leaderboard_type, game_type, rows)
+            await _rerank(cursor, leaderboard_type, game_type)
+
+
+async def on_game_deleted(db, game_id: int) -> None:
+    """
+    Take a completed game's results back out of its players' daily buckets and
+    mark the boards it affected stale, so their next read rebuilds them. Call
+    before the game's ``game_results`` rows are deleted (caller commits).
+    """
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            UPDATE user_daily_stats d SET
+                games_played = d.games_played - gone.games_played,
+                games_won = d.games_won - gone.games_won,
+                points = d.points - gone.points
+            FROM (
+                SELECT user_id, game_type, completed_at::date AS day,
+                       COUNT(*) AS games_played, COUNT(*) FILTER (WHERE outcome IN ('won', 'tied')) AS games_won,
+                       SUM(final_score) AS points
+                FROM game_results
+                WHERE game_id = %s AND user_id IS NOT NULL AND outcome IS NOT NULL AND completed_at IS NOT NULL
+                GROUP BY user_id, game_type, completed_at::date
+            ) gone
+            WHERE d.user_id = gone.user_id AND d.game_type = gone.game_type AND d.day = gone.day
+            RETURNING d.game_type::text
+        """, (game_id,))
+        game_types = {row[0] for row in await cursor.fetchall()}
+        boards = [board for game_type in game_types for board in boards_for_game(game_type)]
+        if boards:
+            await cursor.execute("""
+                DELETE FROM leaderboard_boards lb
+                USING unnest(%s::varchar[], %s::varchar[]) AS b(leaderboard_type, game_type)
+                WHERE lb.leaderboard_type = b.leaderboard_type AND lb.game_type = b.game_type
+            """, ([b[0] for b in boards], [b[1] or '' for b in boards]))
+
+
+async def on_achievements_unlocked(db, user_ids: Iterable[int]) -> None:
+    """Refresh the achievement points of ``user_ids`` on every board they are on, in one pass (caller commits)."""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            UPDATE leaderboard_cache
+            SET score_data = jsonb_set(score_data, '{total_achievement_points}', to_jsonb(pts.points)),
+                last_updated = CURRENT_TIMESTAMP
+            FROM (
+                SELECT u.user_id, COALESCE(SUM(a.points), 0)::int AS points
+                FROM unnest(%s::int[]) AS u(user_id)
+                LEFT JOIN user_achievements ua ON ua.user_id = u.user_id
+                LEFT JOIN achievements a ON a.id = ua.achievement_id
+                GROUP BY u.user_id
+            ) pts
+            WHERE leaderboard_cache.user_id = pts.user_id
+            RETURNING leaderboard_type, game_type
+        """, (user_ids,))
+        boards = {(row['leaderboard_type'], row['game_type']) for row in await cursor.fetchall()}
+        for leaderboard_type, game_type in boards:
+            await _rerank(cursor, leaderboard_type, game_type)
+
+
+def validate_board(leaderboard_type: str, game_type: Optional[str]) -> Board:
+    """Raise ``ValueError`` for unknown board or game types."""
+    window_bounds(leaderboard_type)
+    if game_type is not None and game_type not in GAME_TYPES:
+        raise ValueError("Invalid game type")
+    return leaderboard_type, game_type
+
+
+async def _built_boards(db, boards: Sequence[Board]) -> Dict[Board, dict]:
+    """``leaderboard_boards`` rows (``period_end``, ``last_updated``) of the requested boards that were built."""
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT lb.leaderboard_type, NULLIF(lb.game_type, '') AS game_type, lb.period_end, lb.last_updated
+            FROM leaderboard_boards lb
+            JOIN unnest(%s::varchar[], %s::varchar[]) AS req(leaderboard_type, game_type)
+              ON lb.leaderboard_type = req.leaderboard_type AND lb.game_type = req.game_type
+        """, ([b[0] for b in boards], [b[1] or '' for b in boards]))
+        return {(row['leaderboard_type'], row['game_type']): row for row in await cursor.fetchall()}
+
+
+async def _refresh_stale_boards(db, boards: Sequence[Board]) -> Dict[Board, datetime]:
+    """
+    Rebuild (in one pass) any requested board that was never built or whose
+    rolling window moved on. Returns when each board was last built.
+    """
+    built = await _built_boards(db, boards)
+    stale = []
+    for board in boards:
+        _, period_end = window_bounds(board[0])
+        if board not in built or (period_end is not None and built[board]['period_end'] < period_end):
+            stale.append(board)
+    if stale:
+        await rebuild_boards(db, stale)
+        built = await _built_boards(db, boards)
+    return {board: row['last_updated'] for board, row in built.items()}
+
+
+async def get_boards(db, boards: Sequence[Board], limit: int, user_id: Optional[int] = None) -> List[dict]:
+    """
+    Serve several boards from the cache in one round trip.
+
+    Each board gets its top ``limit`` entries plus ``my_entry``, the row for
+    ``user_id`` (even when it is ranked below ``limit``) or None.
+    """
+    boards = [validate_board(*board) for board in boards]
+    built = await _refresh_stale_boards(db, boards)
+
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT * FROM (
+                SELECT lc.leaderboard_type, lc.game_type, lc.user_id, lc.user_name, lc.rank, lc.score_data,
+                       MAX(lc.last_updated) OVER (PARTITION BY lc.leaderboard_type, lc.game_type) AS board_updated
+                FROM leaderboard_cache lc
+                JOIN unnest(%s::varchar[], %s::varchar[]) AS req(leaderboard_type, game_type)
+                  ON lc.leaderboard_type = req.leaderboard_type AND COALESCE(lc.game_type, '') = req.game_type
+            ) board
+            WHERE board.rank <= %s OR board.user_id = %s
+            ORDER BY board.leaderboard_type, board.game_type, board.rank
+        """, ([b[0] for b in boards], [b[1] or '' for b in boards], limit, user_id))
+        rows = await cursor.fetchall()
+
+    results = {
+        board: {"leaderboard_type": board[0], "game_type": board[1], "entries": [], "my_entry": None,
+                "last_updated": built[board].isoformat() if board in built else None}
+        for board in boards
+    }
+    for row in rows:
+        result = results[(row['leaderboard_type'], row['game_type'])]
+        entry = _entry(row)
+        if row['rank'] <= limit:
+            result['entries'].append(entry)
+        if user_id is not None and row['user_id'] == user_id:
+            result['my_entry'] = entry
+        result['last_updated'] = row['board_updated'].isoformat()
+    return [results[board] for board in boards]
+
+
+async def get_board(db, leaderboard_type: str, game_type: Optional[str], limit: int) -> dict:
+    """Serve a single board from the cache (see ``get_boards``)."""
+    board = (await get_boards(db, [(leaderboard_type, game_type)], limit))[0]
+    del board['my_entry']
+    return board
+
+
+def _entry(row: dict) -> dict:
+    return {
+        "user_id": row['user_id'],
+        "user_name": row['user_name'],
+        "rank": row['rank'],
+        **row['score_data'],
+    }
+
+
+async def get_custom_board(db, period_start: date, period_end: date, game_type: Optional[str], limit: int) -> dict:
+    """
+    Rank players over an arbitrary inclusive date range (e.g. a league season),
+    summed from the daily buckets. Custom boards are computed on request, not cached.
+    """
+    if period_end < period_start:
+        raise ValueError("end must not be before start")
+    if game_type is not None and game_type not in GAME_TYPES:
+        raise ValueError("Invalid game type")
+    async with db.cursor(row_factory=dict_row) as cursor:
+        rows = await _compute_stats(cursor, period_start, period_end, game_type)
+    entries = [
+        {"user_id": row['user_id'], "user_name": row['user_name'], **_score_data(row)}
+        for row in rows
+    ]
+    entries.sort(key=lambda e: _rank_key(e, e['user_id']))
+    for rank, entry in enumerate(entries, start=1):
+        entry['rank'] = rank
+    return {
+        "leaderboard_type": "custom",
+        "game_type": game_type,
+        "period_start": period_start.isoformat(),
+        "period_end": period_end.isoformat(),
+        "entries": entries[:limit],
+        "last_updated": datetime.now().isoformat(),
+    }
@@ -1,18 +1,61 @@
-from fastapi import FastAPI, HTTPException, Body, Path
+from fastapi import FastAPI, HTTPException, Body, Path, Depends, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
-import psycopg2
-import psycopg2.extras
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 import os
 import logging
 from dotenv import load_dotenv
-import json
 from fastapi.middleware.cors import CORSMiddleware
-from collections import defaultdict
-from datetime import datetime, timedelta
-from datetime import datetime, timedelta
-
-app = FastAPI()
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from database import pool_from_env, PoolTimeout
+from serialization import FastJSONResponse, configure_psycopg
+from http_metrics import MetricsMiddleware, RouteMetrics
+from metrics import PrometheusWriter
+from structured_logging import configure_logging, dropped_records, log_event
+import metrics_export
+from websocket_manager import ConnectionManager
+from websocket_backplane import PostgresBackplane
+import game_results
+import export
+import game_history
+import hole_scores
+import leaderboards
+import skins
+import state_patch
+import wolf
+import achievements
+import jobs
+import http_cache
+import users
+import game_import
+import game_log
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the pool at startup; on shutdown close websockets, then release every connection.
+    await pool.open()
+    if backplane is not None:
+        await backplane.start()
+    if job_worker is not None:
+        await job_worker.start()
+    if user_cache_sync is not None:
+        await user_cache_sync.start()
+    yield
+    if user_cache_sync is not None:
+        await user_cache_sync.stop()
+    if job_worker is not None:
+        await job_worker.stop()
+    if backplane is not None:
+        await backplane.stop()
+    await manager.close()
+    await pool.close()
+
+# JSONB in and out of psycopg and every response body go through orjson (see serialization.py).
+configure_psycopg()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Middleware for CORS
 app.add_middleware(
@@ -27,27 +70,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, DB time, rows and payload size for GET /metrics (see http_metrics.py).
+route_metrics = RouteMetrics()
+app.add_middleware(MetricsMiddleware, route_metrics=route_metrics)
+
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-)
+# Configure logging: non-blocking queue, LOG_FORMAT=text|json, sampling for hot events (see structured_logging.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Database connection utility
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-def get_db():
-    return psycopg2.connect(DATABASE_URL)
+# Shared connection pool (sized via DB_POOL_* env vars, see database.py)
+pool = pool_from_env(DATABASE_URL)
+
+async def get_db():
+    """
+    FastAPI dependency that lends a pooled async connection for one request.
+    The connection is rolled back if the handler fails and always returned to the pool.
+    """
+    async with pool.connection() as db:
+        yield db
+
+# In-process background job loops; set JOB_WORKERS=0 when running `python cli.py worker` separately.
+job_worker = None
+if int(os.getenv("JOB_WORKERS", "1")) > 0:
+    job_worker = jobs.JobWorker(pool, concurrency=int(os.getenv("JOB_WORKERS", "1")))
+
+# Drop cached user lookups on every worker when a users row changes; USER_CACHE_SYNC=off relies on the TTL alone.
+user_cache_sync = None
+if os.getenv("USER_CACHE_SYNC", "postgres") != "off":
+    user_cache_sync = users.UserCacheSync(DATABASE_URL)
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    logger.error(f"Database pool exhausted: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, please try again in a moment."})
 
 # Pydantic models
 class PlayerIn(BaseModel):
     name: str
     email: EmailStr
     user_id: Optional[int] = None
+    auth0_id: Optional[str] = None
 
 class GameCreate(BaseModel):
     game_type: str
@@ -55,9 +123,40 @@ class GameCreate(BaseModel):
     num_holes: Optional[int] = 18  # Default to 18 holes
     skin_value: Optional[float] = None
 
+class GameImport(BaseModel):
+    game_type: str
+    players: List[PlayerIn]
+    num_holes: int = 18
+    skin_value: Optional[float] = None
+    state_json: dict = {}
+    is_complete: bool = True
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    current_hole: Optional[int] = None  # Defaults to num_holes for completed games, 0 otherwise
+
+class GameImportRequest(BaseModel):
+    games: List[GameImport]
+
 class GameStateUpdate(BaseModel):
     current_hole: int
     state_json: dict
+    version: Optional[int] = None  # state_version the client loaded; omit to overwrite unconditionally
+
+class GameStatePatch(BaseModel):
+    version: int  # state_version the patch is based on
+    ops: List[dict]  # RFC 6902 operations: add, remove, replace, test
+    current_hole: Optional[int] = None
+
+class WolfHole(BaseModel):
+    hole: int
+    wolf: EmailStr
+    partner: Optional[EmailStr] = None
+    lone_wolf: bool = False
+    winner: Optional[EmailStr] = None  # any player on the winning side; omit for a halved hole
+
+class GameEvents(BaseModel):
+    events: List[dict]  # {"kind": "score" | "partner" | "advance", "hole": int, ...}
+    version: Optional[int] = None  # state_version the client loaded; omit to append unconditionally
 
 class SkinsGameState(BaseModel):
     scores: dict  # {email: [score, ...]}
@@ -79,6 +178,16 @@ class UserAchievement(BaseModel):
     unlocked_at: str
     progress_data: Optional[dict] = None
 
+class AchievementUnlock(BaseModel):
+    user_id: int
+    achievement_id: int
+    game_id: Optional[int] = None
+
+class BulkUnlockRequest(BaseModel):
+    unlocks: List[AchievementUnlock]
+
+MAX_BULK_UNLOCKS = 1000
+
 class LeaderboardEntry(BaseModel):
     user_id: int
     user_name: str
@@ -89,86 +198,84 @@ class LeaderboardEntry(BaseModel):
     total_points: int
 
 @app.get("/users/by-auth0/{auth0_id}")
-def get_user_by_auth0_id(auth0_id: str):
+async def get_user_by_auth0_id(auth0_id: str):
     """
     Returns the internal user record for a given Auth0 user_id.
+    Served from the user lookup cache when possible (see users.py).
     """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        cursor.execute("SELECT id, name, email, auth0_id FROM users WHERE auth0_id = %s", (auth0_id,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found for given Auth0 ID.")
-        return user
-    finally:
-        cursor.close()
-        db.close()
+        user = await users.get_user_by_auth0(pool, auth0_id)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"Error looking up user by Auth0 ID: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to look up user.")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found for given Auth0 ID.")
+    return user
+
+@app.get("/users/cache/stats")
+async def get_user_cache_stats():
+    """Hit/miss counters, size and evictions of this worker's user lookup cache."""
+    return {**users.user_cache.stats(), "sync": user_cache_sync.stats() if user_cache_sync is not None else None}
 
 @app.post("/games/")
-def create_game(game: GameCreate):
-    logger.info(f"[POST /games/] Received request to create game: {game}")
-    db = get_db()
+async def create_game(game: GameCreate, db=Depends(get_db)):
     cursor = db.cursor()
     try:
-        logger.info("Inserting new game into games table")
-        # If skins, allow skin_value
-        skin_value = getattr(game, 'skin_value', None)
-        num_holes = getattr(game, 'num_holes', 18)  # Default to 18 holes
-        cursor.execute(
+        await cursor.execute(
             "INSERT INTO games (game_type, is_complete, state_json, skin_value, num_holes) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (game.game_type, False, json.dumps({}), skin_value, num_holes)
+            (game.game_type, False, Jsonb({}), game.skin_value, game.num_holes or 18)
         )
-        game_id = cursor.fetchone()[0]
-        logger.info(f"Inserted game with ID: {game_id}")
-        # Insert players
-        for player in game.players:
-            logger.info(f"Processing player: {player}")
-            user_id = None
-            if hasattr(player, 'auth0_id') and player.auth0_id:
-                cursor.execute(
-                    "SELECT id FROM users WHERE auth0_id = %s",
-                    (player.auth0_id,)
-                )
-                user_row = cursor.fetchone()
-                user_id = user_row[0] if user_row else None
-            elif player.email:
-                cursor.execute(
-                    "SELECT id FROM users WHERE email = %s",
-                    (player.email,)
-                )
-                user_row = cursor.fetchone()
-                user_id = user_row[0] if user_row else None
-            logger.info(f"Resolved user_id: {user_id} for player: {player}")
-            cursor.execute(
-                "INSERT INTO game_players (game_id, user_id, auth0_id, name, email) VALUES (%s, %s, %s, %s, %s)",
-                (game_id, user_id, getattr(player, 'auth0_id', None), player.name, player.email)
-            )
-            logger.info(f"Inserted player {player.name} (email: {player.email}) into game_players")
-        db.commit()
-        logger.info(f"Committed all changes for game ID: {game_id}")
+        game_id = (await cursor.fetchone())[0]
+        # One lookup and one insert for all players, however many there are.
+        user_ids = await users.resolve_user_ids(db, game.players)
+        await game_import.insert_players(db, game_id, game.players, user_ids)
+        await db.commit()
+        log_event(logger, "game.created", game_id=game_id, game_type=game.game_type, players=len(game.players),
+                  registered=sum(1 for u in user_ids if u is not None))
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating game: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to create game.")
     finally:
-        cursor.close()
-        db.close()
-        logger.info(f"Closed DB connection for game ID: {game_id}")
+        await cursor.close()
     return {"game_id": game_id, "message": "Game created successfully"}
 
+@app.post("/games/import")
+async def import_games(request: GameImportRequest, db=Depends(get_db)):
+    """
+    Load many historical games (players, state and final results) in one
+    transaction. Leaderboards and achievements are rebuilt afterwards by a
+    background job.
+    """
+    try:
+        game_ids = await game_import.import_games(db, request.games)
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error importing {len(request.games)} games: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to import games.")
+    logger.info(f"[POST /games/import] Imported {len(game_ids)} games")
+    return {"game_ids": game_ids, "imported": len(game_ids)}
+
 @app.patch("/games/{game_id}/state")
-def update_game_state(game_id: int, state: GameStateUpdate):
-    logger.info(f"[PATCH /games/{game_id}/state] Updating state for game_id={game_id}, state={state}")
-    db = get_db()
+async def update_game_state(game_id: int, state: GameStateUpdate, db=Depends(get_db)):
     cursor = db.cursor()
     try:
         # For skins, validate state_json structure
-        cursor.execute("SELECT game_type FROM games WHERE id = %s", (game_id,))
-        row = cursor.fetchone()
+        # Locked so the logged diff is against the state this write replaces.
+        await cursor.execute("SELECT game_type, state_json, current_hole FROM games WHERE id = %s FOR UPDATE",
+                             (game_id,))
+        row = await cursor.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Game not found.")
-        game_type = row[0]
+        game_type, old_state, old_hole = row
         if game_type == 'skins':
             # Validate state_json for skins
             try:
@@ -176,327 +283,506 @@ def update_game_state(game_id: int, state: GameStateUpdate):
             except Exception as e:
                 logger.error(f"Invalid skins state_json: {e}")
                 raise HTTPException(status_code=400, detail="Invalid skins state_json")
-        cursor.execute(
-            "UPDATE games SET current_hole = %s, state_json = %s WHERE id = %s AND is_complete = FALSE",
-            (state.current_hole, json.dumps(state.state_json), game_id)
+        await game_log.ensure_baseline(db, game_id)
+        await cursor.execute(
+            """
+            UPDATE games SET current_hole = %s, state_json = %s, state_version = state_version + 1,
+                             state_updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND is_complete = FALSE AND (%s::int IS NULL OR state_version = %s)
+            RETURNING state_version
+            """,
+            (state.current_hole, Jsonb(state.state_json), game_id, state.version, state.version)
         )
-        db.commit()
-        if cursor.rowcount == 0:
+        updated = await cursor.fetchone()
+        if updated is None:
+            await cursor.execute("SELECT is_complete, state_version FROM games WHERE id = %s", (game_id,))
+            current = await cursor.fetchone()
+            await db.rollback()
+            if current and not current[0]:
+                logger.warning(f"Stale state version {state.version} for game_id={game_id} (now {current[1]})")
+                raise HTTPException(status_code=409, detail=f"Game state changed (now version {current[1]}); reload and retry.")
             logger.warning(f"No rows updated for game_id={game_id}. Game may be complete.")
             raise HTTPException(status_code=400, detail="Cannot update a completed game.")
-        logger.info(f"Updated state for game {game_id}")
-        return {"message": "Game state updated"}
+        ops = game_log.diff_ops(old_state or {}, state.state_json)
+        await game_log.record_patch(db, game_id, ops, state.current_hole if state.current_hole != old_hole else None)
+        if game_type == 'wolf' and 'points' in state.state_json:
+            await wolf.sync_from_state(db, [game_id])
+        await hole_scores.sync_games(db, [game_id], hole_scores.touched_holes(ops))
+        await db.commit()
+        log_event(logger, "state.updated", game_id=game_id, version=updated[0], current_hole=state.current_hole)
+        return {"message": "Game state updated", "version": updated[0]}
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating game state: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to update game state.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
+
+@app.patch("/games/{game_id}/state/patch")
+async def patch_game_state(game_id: int, patch: GameStatePatch, db=Depends(get_db)):
+    """
+    Apply a JSON Patch (RFC 6902) to the game state instead of resending all of it.
+    Only the written values are validated; the patch is applied in Postgres.
+    Returns 409 if the state moved past `version` or a `test` operation failed.
+    """
+    try:
+        await game_log.ensure_baseline(db, game_id)
+        result = await state_patch.apply_patch(db, game_id, patch.version, patch.ops, patch.current_hole)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        ops = result.pop('ops')
+        await game_log.record_patch(db, game_id, ops, patch.current_hole)
+        if any(str(op.get('path', '')).startswith('/points') for op in patch.ops):
+            await wolf.sync_from_state(db, [game_id])
+        await hole_scores.sync_games(db, [game_id], hole_scores.touched_holes(ops))
+        await db.commit()
+        log_event(logger, "state.patched", game_id=game_id, version=result['version'], ops=len(patch.ops))
+        return {"message": "Game state updated", **result}
+    except HTTPException:
+        raise
+    except state_patch.StateConflict as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.current_version})
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error patching game state: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to update game state.")
+
+@app.post("/games/{game_id}/wolf/holes")
+async def record_wolf_hole(game_id: int, hole: WolfHole, db=Depends(get_db)):
+    """
+    Score one hole of a wolf game on the server (or correct an earlier one):
+    the points go into state_json and the running standings move by the
+    difference. Returns the hole's points and the new state version.
+    """
+    try:
+        result = await wolf.record_hole(db, game_id, wolf.HoleEvent(**hole.model_dump()))
+        if result is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        await db.commit()
+        log_event(logger, "wolf.hole_recorded", game_id=game_id, hole=hole.hole, version=result['version'])
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error recording wolf hole: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to record hole.")
+
+@app.get("/games/{game_id}/standings")
+async def get_game_standings(game_id: int, db=Depends(get_db)):
+    """
+    Current standings, best first: running wolf points (game_standings) or
+    skins winnings, with placements (ties share a placement).
+    """
+    try:
+        standings = await wolf.fetch_standings(db, game_id)
+        if standings is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        return FastJSONResponse(standings)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching standings: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch standings.")
+
+@app.post("/games/{game_id}/events")
+async def append_game_events(game_id: int, body: GameEvents, db=Depends(get_db)):
+    """
+    Append events to the game log and apply them to the state, in order:
+    `score` {email, hole, strokes}, `partner` {hole, wolf, partner | lone_wolf}
+    or `advance` {hole}. Returns the last event's seq and the new state version.
+    """
+    try:
+        result = await game_log.append_events(db, game_id, body.events, body.version)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        await hole_scores.sync_games(db, [game_id],
+                                     {event['hole'] for event in body.events if event.get('kind') == 'score'})
+        await db.commit()
+        log_event(logger, "game_log.appended", game_id=game_id, seq=result['seq'], events=len(body.events),
+                  version=result['version'])
+        return result
+    except HTTPException:
+        raise
+    except state_patch.StateConflict as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.current_version})
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error appending game events: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to append events.")
+
+@app.post("/games/{game_id}/events/undo")
+async def undo_game_event(game_id: int, db=Depends(get_db)):
+    """Undo the most recent event that still counts and rebuild the state without it."""
+    try:
+        result = await game_log.undo_last(db, game_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        await wolf.sync_from_state(db, [game_id])
+        await hole_scores.sync_games(db, [game_id])
+        await db.commit()
+        log_event(logger, "game_log.undone", game_id=game_id, undone_seq=result['undone_seq'],
+                  version=result['version'])
+        return result
+    except HTTPException:
+        raise
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error undoing game event: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to undo event.")
+
+@app.get("/games/{game_id}/events")
+async def get_game_events(game_id: int, after: int = Query(0, ge=0), limit: int = Query(200, ge=1, le=1000),
+                          db=Depends(get_db)):
+    """The game log after event `after`, oldest first (undone events are followed by an `undo`)."""
+    try:
+        return FastJSONResponse(await game_log.list_events(db, game_id, after, limit))
+    except Exception as e:
+        logger.error(f"Error fetching game events: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch events.")
+
+@app.get("/games/{game_id}/replay")
+async def replay_game(game_id: int, seq: Optional[int] = Query(None, ge=0), db=Depends(get_db)):
+    """The state as of event `seq` (default: latest), rebuilt from the nearest snapshot and the events after it."""
+    try:
+        replayed = await game_log.state_at(db, game_id, seq)
+        if replayed is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+        return FastJSONResponse(replayed)
+    except HTTPException:
+        raise
+    except game_log.HistoryCompacted as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error replaying game: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to replay game.")
 
 @app.get("/games/{game_id}/state")
-def get_game_state(game_id: int):
-    logger.info(f"[GET /games/{game_id}/state] Fetching state for game_id={game_id}")
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        cursor.execute("SELECT current_hole, state_json, game_type, is_complete, num_holes FROM games WHERE id = %s", (game_id,))
-        row = cursor.fetchone()
-        logger.info(f"Fetched row: {row}")
+async def get_game_state(game_id: int, request: Request, db=Depends(get_db)):
+    # If the client already holds the current version, state_json is never read (the CASE skips it).
+    known_version = http_cache.state_version_from_etag(request, game_id)
+    cursor = db.cursor(row_factory=dict_row)
+    try:
+        await cursor.execute("""
+            SELECT current_hole, game_type, is_complete, num_holes, state_version, state_updated_at,
+                   CASE WHEN state_version = %s THEN NULL ELSE state_json END AS state_json
+            FROM games WHERE id = %s
+        """, (known_version, game_id))
+        row = await cursor.fetchone()
         if not row:
             logger.warning(f"Game not found for game_id={game_id}")
             raise HTTPException(status_code=404, detail="Game not found.")
-        state_json = row['state_json']
-        if state_json and isinstance(state_json, str):
-            state_json = json.loads(state_json)
-        return {
-            "current_hole": row['current_hole'],
-            "state_json": state_json,
-            "game_type": row['game_type'],
-            "is_complete": row['is_complete'],
-            "num_holes": row['num_holes']
-        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching game state: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch game state.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
+    etag = http_cache.state_etag(game_id, row['state_version'])
+    cache_control = http_cache.COMPLETED_GAME if row['is_complete'] else http_cache.NO_CACHE
+    if row['state_version'] == known_version:
+        return http_cache.not_modified(etag, cache_control, row['state_updated_at'])
+    return http_cache.conditional_json(request, {
+        "current_hole": row['current_hole'],
+        "state_json": row['state_json'],
+        "game_type": row['game_type'],
+        "is_complete": row['is_complete'],
+        "num_holes": row['num_holes'],
+        "version": row['state_version']
+    }, etag, cache_control, row['state_updated_at'])
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Hello from FastAPI backend!"}
 
+@app.get("/db/pool-stats")
+async def get_pool_stats():
+    """
+    Connection pool statistics (in-use, idle, waiting, acquire-latency histogram).
+    Use these numbers to size DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE.
+    """
+    return pool.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus scrape endpoint: per-route HTTP histograms plus pool, websocket,
+    backplane, job worker and cache metrics of this process. Reads memory only.
+    """
+    out = PrometheusWriter()
+    route_metrics.write(out)
+    metrics_export.write_pool(out, pool.stats())
+    metrics_export.write_websockets(out, manager.stats(), manager.connections_per_game())
+    metrics_export.write_backplane(out, backplane.stats() if backplane is not None else None)
+    metrics_export.write_job_worker(out, job_worker.stats() if job_worker is not None else None)
+    metrics_export.write_cache(out, "users", users.user_cache.stats())
+    metrics_export.write_cache(out, "skins", skins.settlement_cache.stats())
+    out.counter("logging_dropped_records_total", "Log records dropped because the log queue was full.",
+                dropped_records())
+    return PlainTextResponse(out.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/stats")
+async def get_job_stats(db=Depends(get_db)):
+    """
+    Background job queue depth, lag (seconds the oldest ready job has waited)
+    and dead letters per job kind, plus this process's worker counters.
+    """
+    try:
+        stats = await jobs.queue_stats(db)
+        stats["worker"] = job_worker.stats() if job_worker is not None else None
+        return stats
+    except Exception as e:
+        logger.error(f"Error fetching job stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch job stats.")
+
 @app.get("/users/{user_key}/games-won")
-def get_games_won(user_key: str):
-    logger.info(f"[GET /users/{user_key}/games-won] Fetching games won for user_key={user_key}")
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        cursor.execute('''
-            SELECT g.id, g.game_type, g.current_hole, g.is_complete, g.state_json, g.completed_at, g.created_at,
-                   gp.name AS player_name, gp.email AS player_email
-            FROM games g
-            JOIN game_players gp ON g.id = gp.game_id
-            WHERE gp.user_id = %s
-            ORDER BY g.completed_at DESC NULLS LAST, g.created_at DESC
-        ''', (user_key,))
-        games = cursor.fetchall()
-        logger.info(f"Fetched {len(games)} games for user_key={user_key}")
-        won_games = []
-        for game in games:
-            logger.debug(f"Processing game: {game['id']}")
-            if game['game_type'] == 'wolf' and game['state_json']:
-                try:
-                    state = game['state_json'] if isinstance(game['state_json'], dict) else json.loads(game['state_json'])
-                    points = state.get('points', {})
-                    logger.debug(f"Game {game['id']} points: {points}")
-                    user_points = sum(points.get(game['player_email'], []))
-                    all_scores = [(email, sum(pts)) for email, pts in points.items()]
-                    all_scores.sort(key=lambda x: x[1], reverse=True)
-                    logger.debug(f"Game {game['id']} all_scores: {all_scores}")
-                    if all_scores and all_scores[0][0] == game['player_email']:
-                        logger.info(f"User {game['player_email']} won game {game['id']}")
-                        won_games.append(game)
-                except Exception as e:
-                    logger.warning(f"Error parsing state_json for game {game['id']}: {e}", exc_info=True)
-            elif game['game_type'] == 'skins' and game['state_json']:
-                try:
-                    state = game['state_json'] if isinstance(game['state_json'], dict) else json.loads(game['state_json'])
-                    winnings = state.get('total_winnings', {})
-                    max_won = max(winnings.values()) if winnings else None
-                    if winnings and winnings.get(game['player_email'], 0) == max_won:
-                        logger.info(f"User {game['player_email']} won skins game {game['id']}")
-                        won_games.append(game)
-                except Exception as e:
-                    logger.warning(f"Error parsing skins state_json for game {game['id']}: {e}", exc_info=True)
-        return {"games": won_games}
+async def get_games_won(user_key: str, db=Depends(get_db)):
+    """
+    Completed games the user won or tied for first, newest first.
+    Reads the precomputed game_results table (see game_results.py).
+    """
+    try:
+        won_games = await game_results.fetch_games_by_outcome(
+            db, user_key, [game_results.OUTCOME_WON, game_results.OUTCOME_TIED]
+        )
+        log_event(logger, "games_won.fetched", user_key=user_key, games=len(won_games))
+        return FastJSONResponse({"games": won_games})
     except Exception as e:
         logger.error(f"Error fetching games won: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch games won.")
-    finally:
-        cursor.close()
-        db.close()
 
 @app.get("/users/{user_key}/games-lost")
-def get_games_lost(user_key: str):
-    logger.info(f"[GET /users/{user_key}/games-lost] Fetching games lost for user_key={user_key}")
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        cursor.execute('''
-            SELECT g.id, g.game_type, g.current_hole, g.is_complete, g.state_json, g.completed_at, g.created_at,
-                   gp.name AS player_name, gp.email AS player_email
-            FROM games g
-            JOIN game_players gp ON g.id = gp.game_id
-            WHERE gp.user_id = %s
-            ORDER BY g.completed_at DESC NULLS LAST, g.created_at DESC
-        ''', (user_key,))
-        games = cursor.fetchall()
-        logger.info(f"Fetched {len(games)} games for user_key={user_key}")
-        lost_games = []
-        for game in games:
-            logger.debug(f"Processing game: {game['id']}")
-            if game['game_type'] == 'wolf' and game['state_json']:
-                try:
-                    state = game['state_json'] if isinstance(game['state_json'], dict) else json.loads(game['state_json'])
-                    points = state.get('points', {})
-                    logger.debug(f"Game {game['id']} points: {points}")
-                    user_points = sum(points.get(game['player_email'], []))
-                    all_scores = [(email, sum(pts)) for email, pts in points.items()]
-                    all_scores.sort(key=lambda x: x[1])  # Ascending
-                    logger.debug(f"Game {game['id']} all_scores: {all_scores}")
-                    if all_scores and all_scores[0][0] == game['player_email']:
-                        logger.info(f"User {game['player_email']} lost game {game['id']}")
-                        lost_games.append(game)
-                except Exception as e:
-                    logger.warning(f"Error parsing state_json for game {game['id']}: {e}", exc_info=True)
-            elif game['game_type'] == 'skins' and game['state_json']:
-                try:
-                    state = game['state_json'] if isinstance(game['state_json'], dict) else json.loads(game['state_json'])
-                    winnings = state.get('total_winnings', {})
-                    max_won = max(winnings.values()) if winnings else None
-                    if winnings and winnings.get(game['player_email'], 0) < max_won:
-                        logger.info(f"User {game['player_email']} lost skins game {game['id']}")
-                        lost_games.append(game)
-                except Exception as e:
-                    logger.warning(f"Error parsing skins state_json for game {game['id']}: {e}", exc_info=True)
-        return {"games": lost_games}
+async def get_games_lost(user_key: str, db=Depends(get_db)):
+    """
+    Completed games the user did not finish first in, newest first.
+    Reads the precomputed game_results table (see game_results.py).
+    """
+    try:
+        lost_games = await game_results.fetch_games_by_outcome(db, user_key, [game_results.OUTCOME_LOST])
+        log_event(logger, "games_lost.fetched", user_key=user_key, games=len(lost_games))
+        return FastJSONResponse({"games": lost_games})
     except Exception as e:
         logger.error(f"Error fetching games lost: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch games lost.")
-    finally:
-        cursor.close()
-        db.close()
+
+@app.get("/export/games")
+async def export_games(
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    completed_only: bool = False,
+):
+    """
+    Download one row per player per game as NDJSON or CSV (optionally gzipped),
+    streamed from a server-side cursor: the whole league, the games of one
+    user_id, and/or an inclusive start/end date range, e.g.
+    /export/games?format=csv&gzip=true&start=2025-04-01&end=2025-09-30
+    """
+    filters = export.ExportFilter(user_id=user_id, start=start, end=end, completed_only=completed_only)
+    try:
+        chunks = await export.open_export(pool, filters, format, compress=gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = "application/gzip" if gzip else export.FORMATS[format][0]
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{export.filename(format, gzip)}"',
+    })
+
+@app.get("/users/{user_id}/scoring-stats")
+async def get_user_scoring_stats(user_id: int, game_type: Optional[str] = None, db=Depends(get_db)):
+    """
+    Stroke statistics over the user's completed games (average strokes and to par,
+    variance, aces, eagles, birdies, pars, bogeys, wolf points), aggregated from hole_scores.
+    """
+    try:
+        return FastJSONResponse(await hole_scores.user_scoring_stats(db, user_id, game_type))
+    except Exception as e:
+        logger.error(f"Error fetching scoring stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch scoring stats.")
+
+@app.get("/users/{user_id}/history")
+async def get_user_history(user_id: int, limit: int = 20, cursor: Optional[str] = None, db=Depends(get_db)):
+    """
+    One page of the user's game history: in-progress games first, then completed
+    games newest first, each with outcome, summary and players embedded.
+    Pass the returned next_cursor back as ?cursor= to load the next page.
+    """
+    try:
+        return FastJSONResponse(await game_history.fetch_user_history(db, user_id, limit=limit, cursor=cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching game history: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch game history.")
 
 @app.patch("/games/{game_id}/complete")
-def mark_game_complete(game_id: int):
+async def mark_game_complete(game_id: int, db=Depends(get_db)):
     logger.info(f"[PATCH /games/{game_id}/complete] Marking game {game_id} as complete")
-    db = get_db()
     cursor = db.cursor()
     try:
-        cursor.execute(
-            "UPDATE games SET is_complete = TRUE, completed_at = CURRENT_TIMESTAMP WHERE id = %s AND is_complete = FALSE",
+        await cursor.execute(
+            "UPDATE games SET is_complete = TRUE, completed_at = CURRENT_TIMESTAMP, "
+            "state_version = state_version + 1, state_updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = %s AND is_complete = FALSE",
             (game_id,)
         )
-        db.commit()
         if cursor.rowcount == 0:
             logger.warning(f"Game {game_id} not found or already complete.")
             raise HTTPException(status_code=404, detail="Game not found or already complete.")
-        logger.info(f"Game {game_id} marked as complete.")
-        return {"message": f"Game {game_id} marked as complete."}
+        # Results, leaderboards, achievements and notifications run in a background job
+        # (see jobs.py); enqueueing in this transaction means the job exists iff the game is complete.
+        job_id = await jobs.enqueue(db, 'game.completed', {"game_id": game_id})
+        await db.commit()
+        logger.info(f"Game {game_id} marked as complete (job {job_id} queued).")
+        return {"message": f"Game {game_id} marked as complete.", "job_id": job_id}
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error marking game complete: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to mark game as complete.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
 
 @app.get("/games/{game_id}/players")
-def get_game_players(game_id: int):
-    logger.info(f"[GET /games/{game_id}/players] Fetching players for game_id={game_id}")
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+async def get_game_players(game_id: int, request: Request, db=Depends(get_db)):
+    cursor = db.cursor(row_factory=dict_row)
     try:
-        cursor.execute(
-            "SELECT name, email, user_id FROM game_players WHERE game_id = %s",
+        await cursor.execute(
+            "SELECT name, email, user_id FROM game_players WHERE game_id = %s ORDER BY id",
             (game_id,)
         )
-        players = cursor.fetchall()
-        logger.info(f"Fetched {len(players)} players for game_id={game_id}")
-        return players
+        players = await cursor.fetchall()
     except Exception as e:
         logger.error(f"Error fetching players for game {game_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch players.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
+    return http_cache.conditional_json(request, players, http_cache.content_etag(players), http_cache.NO_CACHE)
 
 @app.get("/games/{game_id}/skins")
-def get_skins_results(game_id: int):
+async def get_skins_results(game_id: int, request: Request, db=Depends(get_db)):
     """
     Calculate and return Skins results for a given game.
+    Settled once per state version (see skins.py); the ETag follows the version too.
     """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        # Fetch game info
-        cursor.execute("SELECT skin_value, state_json FROM games WHERE id = %s", (game_id,))
-        game_row = cursor.fetchone()
-        if not game_row:
+        settled = await skins.fetch_settlement(db, game_id)
+        if settled is None:
             raise HTTPException(status_code=404, detail="Game not found.")
-        skin_value = game_row['skin_value'] or 0
-        state_json = game_row['state_json']
-        if state_json and isinstance(state_json, str):
-            state_json = json.loads(state_json)
-        # Expecting state_json to have 'scores': {email: [hole1, hole2, ...]}
-        scores = state_json.get('scores', {})
-        if not scores:
-            raise HTTPException(status_code=400, detail="No scores found for this game.")
-        num_holes = len(next(iter(scores.values())))
-        emails = list(scores.keys())
-        skins = []
-        carryover = 0
-        for h in range(num_holes):
-            hole_scores = {email: scores[email][h] for email in emails}
-            min_score = min(hole_scores.values())
-            winners = [email for email, score in hole_scores.items() if score == min_score]
-            if len(winners) == 1:
-                skins.append({
-                    'hole': h+1,
-                    'winner': winners[0],
-                    'value': skin_value * (carryover + 1)
-                })
-                carryover = 0
-            else:
-                skins.append({
-                    'hole': h+1,
-                    'winner': None,
-                    'value': 0
-                })
-                carryover += 1
-        # Tally total skins and winnings per player
-        player_totals = defaultdict(lambda: {'skins': 0, 'winnings': 0})
-        for skin in skins:
-            if skin['winner']:
-                player_totals[skin['winner']]['skins'] += 1
-                player_totals[skin['winner']]['winnings'] += skin['value']
-        return {
-            'skins': skins,
-            'player_totals': player_totals
-        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error calculating skins: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to calculate skins.")
-    finally:
-        cursor.close()
-        db.close()
+    settlement, version = settled
+    return http_cache.conditional_json(request, settlement.as_dict(), http_cache.state_etag(game_id, version),
+                                       http_cache.NO_CACHE)
+
+@app.get("/skins/season")
+async def get_skins_season(start: date, end: date, user_id: Optional[int] = None, db=Depends(get_db)):
+    """
+    Skins payouts summed over every skins game completed in an inclusive date
+    range, e.g. /skins/season?start=2025-04-01&end=2025-09-30. With user_id,
+    only games that user played in.
+    """
+    try:
+        return FastJSONResponse(await skins.settle_season(db, start, end, user_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error settling skins season: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to settle skins season.")
 
 @app.delete("/games/{game_id}")
-def delete_game(game_id: int):
-    db = get_db()
+async def delete_game(game_id: int, db=Depends(get_db)):
     cursor = db.cursor()
     try:
-        cursor.execute("SELECT 1 FROM games WHERE id = %s", (game_id,))
-        if cursor.fetchone() is None:
+        await cursor.execute("SELECT is_complete FROM games WHERE id = %s", (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
             logger.warning(f"Attempted to delete non-existent game {game_id}.")
             raise HTTPException(status_code=404, detail=f"Game {game_id} not found.")
-        cursor.execute("DELETE FROM game_players WHERE game_id = %s", (game_id,))
-        cursor.execute("DELETE FROM games WHERE id = %s", (game_id,))
-        db.commit()
+        if game[0]:
+            # A completed game counted towards leaderboards and achievement counters.
+            await leaderboards.on_game_deleted(db, game_id)
+            await jobs.enqueue(db, 'game.deleted', {"game_id": game_id})
+        # Rows derived from the game go first; hole_scores also references game_players.
+        for table in ("hole_scores", "game_standings", "game_events", "game_snapshots", "game_results",
+                      "game_players"):
+            await cursor.execute(f"DELETE FROM {table} WHERE game_id = %s", (game_id,))
+        # Achievements stay unlocked; they just no longer point at the deleted game.
+        await cursor.execute("UPDATE user_achievements SET game_id = NULL WHERE game_id = %s", (game_id,))
+        await cursor.execute("DELETE FROM games WHERE id = %s", (game_id,))
+        await db.commit()
         logger.info(f"Deleted game {game_id} and its players.")
         return {"message": f"Game {game_id} deleted."}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error deleting game: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to delete game.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
 
 # Achievement and Leaderboard Endpoints
 
 @app.get("/achievements")
-def get_all_achievements():
+async def get_all_achievements(request: Request):
     """
     Get all achievements. Secret achievements are included but marked as such.
+    The catalog is cached in-process and carries a content ETag, so repeat
+    requests are answered from memory (or with 304).
     """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        cursor.execute("""
-            SELECT id, name, description, icon, category, points, is_secret
-            FROM achievements 
-            ORDER BY category, points DESC
-        """)
-        achievements = cursor.fetchall()
-        return {"achievements": achievements}
+        rows, etag = await achievements.catalog(pool)
+    except PoolTimeout:
+        raise
     except Exception as e:
         logger.error(f"Error fetching achievements: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch achievements.")
-    finally:
-        cursor.close()
-        db.close()
+    return http_cache.conditional_json(request, {"achievements": rows}, etag, http_cache.CATALOG)
 
 @app.get("/users/{user_id}/achievements")
-def get_user_achievements(user_id: int):
+async def get_user_achievements(user_id: int, db=Depends(get_db)):
     """
     Get user's unlocked achievements with unlock dates.
     """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor = db.cursor(row_factory=dict_row)
     try:
-        cursor.execute("""
+        await cursor.execute("""
             SELECT a.id, a.name, a.description, a.icon, a.category, a.points, 
                    a.is_secret, ua.unlocked_at, ua.progress_data
             FROM achievements a
             LEFT JOIN user_achievements ua ON a.id = ua.achievement_id AND ua.user_id = %s
             ORDER BY a.category, ua.unlocked_at DESC NULLS LAST, a.points DESC
         """, (user_id,))
-        achievements = cursor.fetchall()
+        achievements = await cursor.fetchall()
         
         # Process achievements to show unlock status
         processed_achievements = []
@@ -512,195 +798,144 @@ def get_user_achievements(user_id: int):
         logger.error(f"Error fetching user achievements: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch user achievements.")
     finally:
-        cursor.close()
-        db.close()
+        await cursor.close()
 
 @app.post("/users/{user_id}/achievements/{achievement_id}/unlock")
-def unlock_achievement(user_id: int, achievement_id: int, game_id: Optional[int] = None):
+async def unlock_achievement(user_id: int, achievement_id: int, game_id: Optional[int] = None, db=Depends(get_db)):
     """
     Unlock an achievement for a user. Called internally when conditions are met.
+    Safe to repeat: an achievement the user already has is left untouched.
     """
-    db = get_db()
-    cursor = db.cursor()
     try:
-        # Check if already unlocked
-        cursor.execute(
-            "SELECT id FROM user_achievements WHERE user_id = %s AND achievement_id = %s",
-            (user_id, achievement_id)
-        )
-        if cursor.fetchone():
-            return {"message": "Achievement already unlocked"}
-            
-        # Unlock the achievement
-        cursor.execute("""
-            INSERT INTO user_achievements (user_id, achievement_id, game_id, unlocked_at)
-            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-        """, (user_id, achievement_id, game_id))
-        
-        db.commit()
+        unlocked = await achievements.unlock_many(db, [(user_id, achievement_id, game_id)])
+        await db.commit()
+        if not unlocked:
+            return {"message": "Achievement already unlocked", "unlocked": False}
         logger.info(f"Unlocked achievement {achievement_id} for user {user_id}")
-        return {"message": "Achievement unlocked!"}
+        return {"message": "Achievement unlocked!", "unlocked": True}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error unlocking achievement: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to unlock achievement.")
-    finally:
-        cursor.close()
-        db.close()
+
+@app.post("/achievements/unlock")
+async def unlock_achievements_bulk(request: BulkUnlockRequest, db=Depends(get_db)):
+    """
+    Unlock many (user_id, achievement_id, game_id) at once in a single statement.
+    Pairs a user already has, and unknown users or achievements, are skipped.
+    Returns only the newly unlocked ones, so the UI can animate just those.
+    """
+    if len(request.unlocks) > MAX_BULK_UNLOCKS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_UNLOCKS} unlocks per request.")
+    try:
+        unlocked = await achievements.unlock_many(
+            db, [(u.user_id, u.achievement_id, u.game_id) for u in request.unlocks]
+        )
+        await db.commit()
+        logger.info(f"Bulk unlock: {len(unlocked)} new of {len(request.unlocks)} requested")
+        return {"unlocked": unlocked}
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error unlocking achievements: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to unlock achievements.")
+
+@app.get("/leaderboards/batch")
+async def get_leaderboards_batch(
+    types: List[str] = Query(['all_time', 'monthly', 'weekly']),
+    game_types: List[str] = Query(['all']),
+    user_id: Optional[int] = None,
+    limit: int = 50,
+    db=Depends(get_db)
+):
+    """
+    Several leaderboards in one round trip: every combination of ?types= and
+    ?game_types= ('all' means every game type), e.g.
+    /leaderboards/batch?types=weekly&types=all_time&game_types=all&game_types=wolf&user_id=7
+    When user_id is given each board also includes my_entry, that user's own
+    row, even if they rank below limit.
+    """
+    boards = [(t, None if gt == 'all' else gt) for t in types for gt in game_types]
+    try:
+        return {"boards": await leaderboards.get_boards(db, boards, limit, user_id)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching leaderboards: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch leaderboards.")
+
+@app.get("/leaderboards/custom")
+async def get_custom_leaderboard(
+    start: date,
+    end: date,
+    game_type: Optional[str] = None,
+    limit: int = 50,
+    db=Depends(get_db)
+):
+    """
+    Leaderboard over any inclusive date range, e.g. a league season:
+    /leaderboards/custom?start=2025-04-01&end=2025-09-30&game_type=wolf
+    Summed from per-user daily buckets, so long ranges stay cheap.
+    """
+    try:
+        return await leaderboards.get_custom_board(db, start, end, game_type, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching custom leaderboard: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch leaderboard.")
 
 @app.get("/leaderboards/{leaderboard_type}")
-def get_leaderboard(
+async def get_leaderboard(
     leaderboard_type: str, 
     game_type: Optional[str] = None,
-    limit: int = 50
+    limit: int = 50,
+    db=Depends(get_db)
 ):
     """
     Get leaderboard data. Types: 'weekly', 'monthly', 'all_time'
     Optional game_type filter: 'wolf', 'skins', etc.
+    Served from the materialized leaderboard_cache (see leaderboards.py);
+    last_updated is when the board's data was actually computed.
     """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        # Calculate date ranges for weekly/monthly
-        now = datetime.now()
-        if leaderboard_type == 'weekly':
-            start_date = now - timedelta(days=7)
-        elif leaderboard_type == 'monthly':
-            start_date = now - timedelta(days=30)
-        elif leaderboard_type == 'all_time':
-            start_date = None
-        else:
-            raise HTTPException(status_code=400, detail="Invalid leaderboard type")
-        
-        # Build query based on parameters
-        base_query = """
-            SELECT 
-                u.id as user_id,
-                u.name as user_name,
-                COUNT(CASE WHEN winner.user_id IS NOT NULL THEN 1 END) as games_won,
-                COUNT(g.id) as total_games,
-                CASE 
-                    WHEN COUNT(g.id) > 0 
-                    THEN ROUND(COUNT(CASE WHEN winner.user_id IS NOT NULL THEN 1 END)::numeric / COUNT(g.id) * 100, 1)
-                    ELSE 0 
-                END as win_rate,
-                COALESCE(SUM(ua_points.points), 0) as total_achievement_points
-            FROM users u
-            LEFT JOIN game_players gp ON u.id = gp.user_id
-            LEFT JOIN games g ON gp.game_id = g.id AND g.is_complete = true
-        """
-        
-        # Add date filter if needed
-        if start_date:
-            base_query += " AND g.completed_at >= %s"
-        
-        # Add game type filter if specified
-        if game_type:
-            base_query += " AND g.game_type = %s"
-        
-        # Add winner calculation (simplified - you may need to adjust based on your win logic)
-        base_query += """
-            LEFT JOIN (
-                SELECT DISTINCT g.id as game_id, winner_gp.user_id
-                FROM games g
-                JOIN game_players winner_gp ON g.id = winner_gp.game_id
-                WHERE g.is_complete = true
-                -- Add your specific win condition logic here based on game type
-            ) winner ON g.id = winner.game_id AND u.id = winner.user_id
-            LEFT JOIN (
-                SELECT ua.user_id, SUM(a.points) as points
-                FROM user_achievements ua
-                JOIN achievements a ON ua.achievement_id = a.id
-                GROUP BY ua.user_id
-            ) ua_points ON u.id = ua_points.user_id
-            GROUP BY u.id, u.name, ua_points.points
-            HAVING COUNT(g.id) > 0
-            ORDER BY games_won DESC, win_rate DESC, total_achievement_points DESC
-            LIMIT %s
-        """
-        
-        # Prepare parameters
-        params = []
-        if start_date:
-            params.append(start_date)
-        if game_type:
-            params.append(game_type)
-        params.append(limit)
-        
-        cursor.execute(base_query, params)
-        leaderboard_data = cursor.fetchall()
-        
-        # Add rankings
-        for i, entry in enumerate(leaderboard_data):
-            entry['rank'] = i + 1
-        
-        return {
-            "leaderboard_type": leaderboard_type,
-            "game_type": game_type,
-            "entries": leaderboard_data,
-            "last_updated": now.isoformat()
-        }
+    try:
+        return await leaderboards.get_board(db, leaderboard_type, game_type, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching leaderboard: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch leaderboard.")
-    finally:
-        cursor.close()
-        db.close()
-
-def check_and_unlock_achievements(user_id: int, game_id: int):
-    """
-    Check if user qualifies for any achievements after completing a game.
-    This should be called after every completed game.
-    """
-    db = get_db()
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
-        # Get user's game history and stats for achievement checking
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_games,
-                COUNT(CASE WHEN g.is_complete THEN 1 END) as completed_games,
-                COUNT(CASE WHEN winner.game_id IS NOT NULL THEN 1 END) as games_won
-            FROM game_players gp
-            JOIN games g ON gp.game_id = g.id
-            LEFT JOIN (
-                -- Simplified win detection - adjust based on your game logic
-                SELECT game_id FROM games WHERE is_complete = true
-            ) winner ON g.id = winner.game_id
-            WHERE gp.user_id = %s
-        """, (user_id,))
-        stats = cursor.fetchone()
-        
-        achievements_to_unlock = []
-        
-        # Check various achievement conditions
-        if stats['completed_games'] == 1:
-            achievements_to_unlock.append(1)  # Getting Started
-        if stats['games_won'] == 1:
-            achievements_to_unlock.append(2)  # First Win
-        if stats['completed_games'] == 100:
-            achievements_to_unlock.append(11)  # Century Club
-            
-        # Unlock achievements
-        for achievement_id in achievements_to_unlock:
-            try:
-                unlock_achievement(user_id, achievement_id, game_id)
-            except:
-                pass  # Achievement may already be unlocked
-                
-        return achievements_to_unlock
+
+@app.post("/leaderboards/rebuild")
+async def rebuild_leaderboards(db=Depends(get_db)):
+    """
+    Recompute every materialized leaderboard from scratch.
+    Normally not needed: boards update incrementally as games complete.
+    """
+    try:
+        counts = await leaderboards.rebuild_all(db)
+        await db.commit()
+        logger.info(f"Rebuilt {len(counts)} leaderboards")
+        return {"message": "Leaderboards rebuilt", "entries": counts}
     except Exception as e:
-        logger.error(f"Error checking achievements: {e}", exc_info=True)
-        return []
-    finally:
-        cursor.close()
-        db.close()
+        await db.rollback()
+        logger.error(f"Error rebuilding leaderboards: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to rebuild leaderboards.")
 
 # WebSocket endpoint for real-time game updates
-from websocket_manager import ConnectionManager
-from fastapi import WebSocket
+manager = ConnectionManager(
+    queue_size=int(os.getenv("WS_SEND_QUEUE_SIZE", "64")),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "5")),
+)
 
-manager = ConnectionManager()
+# Relay broadcasts between uvicorn workers/instances; WS_BACKPLANE=off keeps them in-process.
+backplane = None
+if os.getenv("WS_BACKPLANE", "postgres") != "off":
+    backplane = PostgresBackplane(
+        DATABASE_URL,
+        manager,
+        pool,
+        coalesce_window=float(os.getenv("WS_BACKPLANE_COALESCE_MS", "5")) / 1000,
+    )
 
 @app.websocket("/ws/games/{game_id}")
 async def game_updates(websocket: WebSocket, game_id: int):
@@ -708,7 +943,16 @@ async def game_updates(websocket: WebSocket, game_id: int):
     try:
         while True:
             data = await websocket.receive_json()
-            await manager.broadcast(game_id, data)
+            if backplane is not None:
+                await backplane.publish(game_id, data)
+            else:
+                await manager.broadcast(game_id, data)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(game_id, websocket)
 
+@app.get("/ws/stats")
+async def get_websocket_stats():
+    """Live websocket connections, send-queue depth, evictions, delivery latency and cross-worker relay stats."""
+    return {**manager.stats(), "backplane": backplane.stats() if backplane is not None else None}
@@ -0,0 +1,133 @@
+"""
+Lightweight in-process metrics shared by the backend modules.
+
+- ``Histogram`` / ``LatencyHistogram``: cumulative, Prometheus-style histograms.
+- ``RequestStats`` / ``current_request``: what the current HTTP request spent
+  on the database. ``database.py`` adds to it and ``http_metrics.py`` reads it.
+- ``PrometheusWriter``: renders metrics in the Prometheus text format for
+  ``GET /metrics``.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram. Every observation lands in the first
+    bucket whose bound is greater than or equal to it (plus the implicit +Inf).
+    """
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def _cumulative(self) -> Tuple[List[Dict], int, float]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += count
+            cumulative.append({"le": bound, "count": running})
+        return cumulative, running, total
+
+    def snapshot(self) -> Dict:
+        """Return cumulative bucket counts, total count and sum."""
+        cumulative, count, total = self._cumulative()
+        return {"buckets": cumulative, "count": count, "sum": round(total, 3)}
+
+
+class LatencyHistogram(Histogram):
+    """Histogram of durations: observed in seconds, bucket bounds and snapshot in milliseconds."""
+
+    DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = DEFAULT_BUCKETS_MS) -> None:
+        super().__init__(buckets_ms)
+        self.buckets_ms = self.buckets
+
+    def observe(self, seconds: float) -> None:
+        super().observe(seconds * 1000.0)
+
+    def snapshot(self) -> Dict:
+        """Return cumulative bucket counts, total count and sum (ms)."""
+        cumulative, count, total = self._cumulative()
+        return {"buckets": cumulative, "count": count, "sum_ms": round(total, 3)}
+
+
+@dataclass
+class RequestStats:
+    """Database work done on behalf of one HTTP request."""
+    db_seconds: float = 0.0
+    queries: int = 0
+    rows: int = 0
+    pool_wait_seconds: float = 0.0
+
+
+# Set by the metrics middleware for the duration of each HTTP request; None elsewhere
+# (background jobs, websocket handlers, CLI commands).
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Optional[Dict[str, object]], extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in (labels or {}).items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class PrometheusWriter:
+    """Accumulates samples and renders them in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._lines: List[str] = []
+        self._declared = set()
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        if name not in self._declared:
+            self._declared.add(name)
+            self._lines.append(f"# HELP {name} {help_text}")
+            self._lines.append(f"# TYPE {name} {kind}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, object]] = None) -> None:
+        self._declare(name, "counter", help_text)
+        self._lines.append(f"{name}{_labels(labels)} {value}")
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, object]] = None) -> None:
+        self._declare(name, "gauge", help_text)
+        self._lines.append(f"{name}{_labels(labels)} {value}")
+
+    def histogram(self, name: str, help_text: str, snapshot: Dict,
+                  labels: Optional[Dict[str, object]] = None, scale: float = 1.0) -> None:
+        """
+        Write a ``Histogram.snapshot()``. ``scale`` converts bucket bounds and
+        the sum to the metric's unit (0.001 turns a ``LatencyHistogram``'s
+        milliseconds into seconds).
+        """
+        self._declare(name, "histogram", help_text)
+        for bucket in snapshot["buckets"]:
+            bound = bucket["le"] if bucket["le"] == "+Inf" else repr(round(bucket["le"] * scale, 9))
+            le = 'le="' + bound + '"'
+            self._lines.append(f"{name}_bucket{_labels(labels, le)} {bucket['count']}")
+        total = snapshot["sum_ms"] if "sum_ms" in snapshot else snapshot["sum"]
+        self._lines.append(f"{name}_sum{_labels(labels)} {total * scale}")
+        self._lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
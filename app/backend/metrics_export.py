@@ -0,0 +1,67 @@
+"""
+Prometheus rendering of the ``stats()`` that each component already keeps.
+
+``GET /metrics`` combines these with the per-route HTTP metrics
+(http_metrics.py). Everything is read from memory; scraping never touches
+the database.
+"""
+from typing import Dict, Optional
+
+from metrics import PrometheusWriter
+
+MS = 0.001
+
+
+def write_pool(out: PrometheusWriter, stats: Dict) -> None:
+    for key in ("in_use", "idle", "size", "waiting", "min_size", "max_size"):
+        out.gauge(f"db_pool_{key}", f"Connection pool {key.replace('_', ' ')}.", stats[key])
+    for key in ("connections_opened", "connections_lost", "health_check_failures", "acquire_timeouts"):
+        out.counter(f"db_pool_{key}_total", f"Connection pool {key.replace('_', ' ')}.", stats[key])
+    out.histogram("db_pool_acquire_seconds", "Time to get a connection from the pool.",
+                  stats["acquire_latency_ms"], scale=MS)
+
+
+def write_websockets(out: PrometheusWriter, stats: Dict, connections_per_game: Dict[int, int]) -> None:
+    out.gauge("ws_games", "Games with at least one live websocket.", stats["games"])
+    out.gauge("ws_connections", "Live websocket connections.", stats["connections"])
+    for game_id, count in sorted(connections_per_game.items()):
+        out.gauge("ws_game_connections", "Live websocket connections per game.", count, {"game_id": game_id})
+    out.gauge("ws_queued_messages", "Messages waiting in send queues.", stats["queued_messages"])
+    out.gauge("ws_max_queue_depth", "Deepest send queue.", stats["max_queue_depth"])
+    out.counter("ws_broadcasts_total", "Broadcasts handed to the connection manager.", stats["broadcasts"])
+    out.counter("ws_messages_sent_total", "Messages delivered to sockets.", stats["messages_sent"])
+    out.counter("ws_slow_consumer_evictions_total", "Connections closed for falling behind.",
+                stats["slow_consumer_evictions"])
+    out.counter("ws_dead_socket_removals_total", "Connections removed after a failed send.",
+                stats["dead_socket_removals"])
+    out.histogram("ws_delivery_seconds", "Broadcast-to-delivered latency per message.",
+                  stats["delivery_latency_ms"], scale=MS)
+
+
+def write_backplane(out: PrometheusWriter, stats: Optional[Dict]) -> None:
+    if stats is None:
+        return
+    out.gauge("ws_backplane_pending_messages", "Messages waiting to be relayed to other workers.",
+              stats["pending_messages"])
+    for key in ("messages_published", "notifications_sent", "notifications_received", "messages_spilled",
+                "publish_failures", "listener_reconnects"):
+        out.counter(f"ws_backplane_{key}_total", f"Websocket backplane {key.replace('_', ' ')}.", stats[key])
+    out.histogram("ws_backplane_relay_seconds", "Publish-to-receive latency between workers.",
+                  stats["relay_latency_ms"], scale=MS)
+
+
+def write_job_worker(out: PrometheusWriter, stats: Optional[Dict]) -> None:
+    if stats is None:
+        return
+    out.gauge("jobs_worker_concurrency", "Job loops in this process.", stats["concurrency"])
+    for key in ("processed", "retried", "dead_lettered"):
+        out.counter(f"jobs_{key}_total", f"Jobs {key.replace('_', ' ')} by this process.", stats[key])
+    out.histogram("jobs_enqueue_to_done_seconds", "Time from enqueue to completion per job.",
+                  stats["enqueue_to_done_ms"], scale=MS)
+
+
+def write_cache(out: PrometheusWriter, name: str, stats: Dict) -> None:
+    labels = {"cache": name}
+    out.gauge("cache_entries", "Entries in an in-process cache.", stats["size"], labels)
+    for key in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        out.counter(f"cache_{key}_total", f"In-process cache {key}.", stats[key], labels)
@@ -0,0 +1,21 @@
+-- Adds the game_results table (see game_results.py).
+-- After applying, run `python cli.py backfill-results` to fill in existing games.
+
+-- final per-player results, written when a game is marked complete
+CREATE TABLE IF NOT EXISTS game_results (
+    game_id INT NOT NULL,
+    game_player_id INT NOT NULL UNIQUE,
+    user_id INT, -- null for guests without a user account
+    email VARCHAR(255) NOT NULL,
+    game_type game_type_enum NOT NULL,
+    final_score NUMERIC(10,2) NOT NULL, -- wolf points or skins winnings
+    placement INT NOT NULL, -- 1 = first (ties share a placement)
+    outcome VARCHAR(10) NOT NULL CHECK (outcome IN ('won', 'tied', 'lost')),
+    completed_at TIMESTAMP,
+    PRIMARY KEY (game_id, game_player_id),
+    FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (game_player_id) REFERENCES game_players(id),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_game_results_user_outcome ON game_results(user_id, outcome, completed_at DESC);
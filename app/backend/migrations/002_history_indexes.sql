@@ -0,0 +1,4 @@
+-- Indexes for the paginated /users/{user_id}/history endpoint (see game_history.py).
+
+CREATE INDEX IF NOT EXISTS idx_game_results_user_completed ON game_results(user_id, completed_at DESC, game_id DESC);
+CREATE INDEX IF NOT EXISTS idx_game_players_game_id ON game_players(game_id);
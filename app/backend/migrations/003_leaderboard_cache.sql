@@ -0,0 +1,7 @@
+-- One row per (board, user) in leaderboard_cache so boards can be updated
+-- incrementally (see leaderboards.py). The table is only a cache, so it is
+-- emptied first; boards rebuild themselves on the next read, or run
+-- `python cli.py rebuild-leaderboards`.
+
+DELETE FROM leaderboard_cache;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_cache_board_user ON leaderboard_cache(leaderboard_type, (COALESCE(game_type, '')), user_id);
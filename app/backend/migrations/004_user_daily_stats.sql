@@ -0,0 +1,27 @@
+-- Daily leaderboard buckets (see leaderboards.py), filled from existing game_results.
+-- Run after migrations/001-003 and `python cli.py backfill-results`.
+
+-- per-user daily leaderboard buckets, bumped as games complete
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+    user_id INT NOT NULL,
+    game_type game_type_enum NOT NULL,
+    day DATE NOT NULL,
+    games_played INT NOT NULL DEFAULT 0,
+    games_won INT NOT NULL DEFAULT 0,
+    points NUMERIC(12,2) NOT NULL DEFAULT 0, -- wolf points or skins winnings
+    PRIMARY KEY (user_id, game_type, day),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_daily_stats_day ON user_daily_stats(day);
+
+INSERT INTO user_daily_stats (user_id, game_type, day, games_played, games_won, points)
+SELECT user_id, game_type, completed_at::date,
+       COUNT(*), COUNT(*) FILTER (WHERE outcome IN ('won', 'tied')), SUM(final_score)
+FROM game_results
+WHERE user_id IS NOT NULL AND completed_at IS NOT NULL
+GROUP BY user_id, game_type, completed_at::date
+ON CONFLICT (user_id, game_type, day) DO NOTHING;
+
+-- Rolling boards now span exactly 7/30 daily buckets; drop the cached rows.
+DELETE FROM leaderboard_cache;
@@ -0,0 +1,11 @@
+-- Oversized websocket messages relayed between workers (see websocket_backplane.py).
+-- Rows are short-lived: the publishing worker deletes anything older than a few minutes.
+
+CREATE TABLE IF NOT EXISTS ws_message_spill (
+    id BIGSERIAL PRIMARY KEY,
+    game_id INT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ws_message_spill_created_at ON ws_message_spill(created_at);
@@ -0,0 +1,69 @@
+-- Incremental game-state updates (see state_patch.py):
+-- a version counter for optimistic concurrency and a JSON Patch function
+-- that applies add/remove/replace/test operations with jsonb operators.
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS state_version INT NOT NULL DEFAULT 0;
+
+-- ops: [{"op": "replace", "path": ["scores", "a@example.com", "4"], "value": 5}, ...]
+-- Paths arrive already split into segments. Raises SQLSTATE GP001 for an
+-- invalid operation or path and GP002 when a "test" operation fails.
+CREATE OR REPLACE FUNCTION jsonb_apply_patch(target JSONB, ops JSONB) RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    op JSONB;
+    path TEXT[];
+    parent_path TEXT[];
+    parent JSONB;
+    key TEXT;
+    depth INT;
+BEGIN
+    target := COALESCE(target, '{}'::jsonb);
+    FOR op IN SELECT value FROM jsonb_array_elements(ops) LOOP
+        path := ARRAY(SELECT jsonb_array_elements_text(op -> 'path'));
+        depth := cardinality(path);
+        IF depth = 0 THEN
+            RAISE EXCEPTION 'JSON Patch path must not be empty' USING ERRCODE = 'GP001';
+        END IF;
+        parent_path := path[1:depth - 1];
+        key := path[depth];
+        parent := target #> parent_path;
+        IF parent IS NULL OR jsonb_typeof(parent) NOT IN ('object', 'array') THEN
+            RAISE EXCEPTION 'Path /% has no parent object or array', array_to_string(path, '/') USING ERRCODE = 'GP001';
+        END IF;
+        IF jsonb_typeof(parent) = 'array' AND key !~ '^(0|[1-9][0-9]{0,5})$'
+           AND NOT (key = '-' AND op ->> 'op' = 'add') THEN
+            RAISE EXCEPTION 'Invalid array index in path /%', array_to_string(path, '/') USING ERRCODE = 'GP001';
+        END IF;
+
+        CASE op ->> 'op'
+        WHEN 'add' THEN
+            IF jsonb_typeof(parent) = 'object' THEN
+                target := jsonb_set(target, path, op -> 'value', true);
+            ELSIF key = '-' OR key::int = jsonb_array_length(parent) THEN
+                target := jsonb_set(target, parent_path, parent || jsonb_build_array(op -> 'value'));
+            ELSIF key::int > jsonb_array_length(parent) THEN
+                RAISE EXCEPTION 'Array index out of range in path /%', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            ELSE
+                target := jsonb_insert(target, path, op -> 'value');
+            END IF;
+        WHEN 'replace' THEN
+            IF target #> path IS NULL THEN
+                RAISE EXCEPTION 'Path /% does not exist', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            END IF;
+            target := jsonb_set(target, path, op -> 'value', false);
+        WHEN 'remove' THEN
+            IF target #> path IS NULL THEN
+                RAISE EXCEPTION 'Path /% does not exist', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            END IF;
+            target := target #- path;
+        WHEN 'test' THEN
+            IF (target #> path) IS DISTINCT FROM (op -> 'value') THEN
+                RAISE EXCEPTION 'Test failed at path /%', array_to_string(path, '/') USING ERRCODE = 'GP002';
+            END IF;
+        ELSE
+            RAISE EXCEPTION 'Unsupported JSON Patch op %', op ->> 'op' USING ERRCODE = 'GP001';
+        END CASE;
+    END LOOP;
+    RETURN target;
+END;
+$$;
@@ -0,0 +1,33 @@
+-- Per-user counters for the achievement rules engine (see achievements.py).
+-- After running this, fill them from existing games with
+-- `python cli.py rebuild-achievement-stats`.
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INT PRIMARY KEY,
+    games_played INT NOT NULL DEFAULT 0,
+    games_won INT NOT NULL DEFAULT 0, -- ties for first count as wins
+    wins_by_game_type JSONB NOT NULL DEFAULT '{}', -- {"wolf": 3, "skins": 1}
+    current_win_streak INT NOT NULL DEFAULT 0,
+    best_win_streak INT NOT NULL DEFAULT 0,
+    last_played_on DATE,
+    current_day_streak INT NOT NULL DEFAULT 0,
+    best_day_streak INT NOT NULL DEFAULT 0,
+    distinct_partners INT NOT NULL DEFAULT 0,
+    aces INT NOT NULL DEFAULT 0,
+    eagles INT NOT NULL DEFAULT 0,
+    best_birdies_in_game INT NOT NULL DEFAULT 0,
+    under_par_games INT NOT NULL DEFAULT 0,
+    low_variance_games INT NOT NULL DEFAULT 0,
+    comeback_wins INT NOT NULL DEFAULT 0,
+    lucky_number_wins INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- everyone each user has played with: a user id, or "email:<address>" for guests
+CREATE TABLE IF NOT EXISTS user_partners (
+    user_id INT NOT NULL,
+    partner VARCHAR(255) NOT NULL,
+    PRIMARY KEY (user_id, partner),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
@@ -0,0 +1,25 @@
+-- Background job queue (see jobs.py).
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL, -- e.g. 'game.completed'
+    payload JSONB NOT NULL DEFAULT '{}',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- not before; pushed back on each retry
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- jobs that used up their attempts, kept for inspection
+CREATE TABLE IF NOT EXISTS job_dead_letter (
+    id BIGINT PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+    attempts INT NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL,
+    failed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_queue_run_at ON job_queue(run_at, id);
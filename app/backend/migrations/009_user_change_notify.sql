@@ -0,0 +1,24 @@
+-- Announce every change to users on the user_changes channel so each
+-- worker's user lookup cache can drop stale entries (see users.py).
+
+CREATE OR REPLACE FUNCTION notify_user_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    old_row JSON;
+    new_row JSON;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        old_row := json_build_object('email', OLD.email, 'auth0_id', OLD.auth0_id);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_row := json_build_object('email', NEW.email, 'auth0_id', NEW.auth0_id);
+    END IF;
+    PERFORM pg_notify('user_changes', json_build_object('old', old_row, 'new', new_row)::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_notify_change ON users;
+CREATE TRIGGER users_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_change();
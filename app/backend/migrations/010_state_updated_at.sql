@@ -0,0 +1,5 @@
+-- Last-Modified for conditional GET /games/{id}/state (see http_cache.py).
+-- The ETag is state_version, which completing a game now also bumps.
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS state_updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+UPDATE games SET state_updated_at = completed_at WHERE completed_at IS NOT NULL;
@@ -0,0 +1,26 @@
+-- Running wolf totals per player (see wolf.py), read by GET /games/{id}/standings
+-- and by game_results when a wolf game completes. Filled here from the points
+-- already in state_json.
+
+CREATE TABLE IF NOT EXISTS game_standings (
+    game_id INT NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    points NUMERIC(10,2) NOT NULL DEFAULT 0,
+    holes_won INT NOT NULL DEFAULT 0, -- holes on which the player scored
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, email),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+
+INSERT INTO game_standings (game_id, email, points, holes_won)
+SELECT g.id, p.key,
+       COALESCE(SUM(h.value::numeric), 0),
+       COUNT(*) FILTER (WHERE h.value::numeric > 0)
+FROM games g
+CROSS JOIN LATERAL jsonb_each(g.state_json->'points') p
+LEFT JOIN LATERAL jsonb_array_elements_text(
+    CASE WHEN jsonb_typeof(p.value) = 'array' THEN p.value ELSE '[]'::jsonb END
+) h(value) ON h.value ~ '^-?[0-9]+(\.[0-9]+)?$'
+WHERE g.game_type = 'wolf' AND jsonb_typeof(g.state_json->'points') = 'object'
+GROUP BY g.id, p.key
+ON CONFLICT (game_id, email) DO NOTHING;
@@ -0,0 +1,56 @@
+-- One row per player per hole, kept in sync with games.state_json (see hole_scores.py),
+-- so stroke statistics and achievement facts are SQL aggregates instead of JSON parsing.
+-- After applying, run `python cli.py backfill-hole-scores` to fill in existing games.
+
+CREATE TABLE IF NOT EXISTS hole_scores (
+    game_id INT NOT NULL,
+    game_player_id INT NOT NULL,
+    hole SMALLINT NOT NULL, -- 1-based
+    strokes SMALLINT, -- null until scored (wolf holes may only have points)
+    par SMALLINT,
+    points NUMERIC(6,2), -- wolf points for the hole
+    PRIMARY KEY (game_player_id, hole),
+    FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (game_player_id) REFERENCES game_players(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_hole_scores_game_id ON hole_scores(game_id);
+
+-- Per-hole rows for one player of a state_json: strokes from scores.{email} (or
+-- players[].scores), par from pars, points from points.{email}. Holes with
+-- neither strokes nor points are skipped; out-of-range numbers become NULL.
+CREATE OR REPLACE FUNCTION hole_score_rows(state JSONB, player_email TEXT)
+RETURNS TABLE (hole INT, strokes SMALLINT, par SMALLINT, points NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+    WITH src AS (
+        SELECT COALESCE(
+                   CASE WHEN jsonb_typeof(state->'scores') = 'object' THEN state->'scores'->player_email END,
+                   (SELECT p->'scores'
+                    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(state->'players') = 'array'
+                                                   THEN state->'players' ELSE '[]'::jsonb END) p
+                    WHERE jsonb_typeof(p) = 'object' AND p->>'email' = player_email
+                    LIMIT 1)
+               ) AS strokes,
+               CASE WHEN jsonb_typeof(state->'points') = 'object' THEN state->'points'->player_email END AS points,
+               CASE WHEN jsonb_typeof(state->'pars') = 'array' THEN state->'pars' END AS pars
+    ),
+    cells AS (
+        SELECT h.hole,
+               CASE WHEN jsonb_typeof(src.strokes->(h.hole - 1)) = 'number'
+                    THEN (src.strokes->>(h.hole - 1))::numeric END AS strokes,
+               CASE WHEN jsonb_typeof(src.pars->(h.hole - 1)) = 'number'
+                    THEN (src.pars->>(h.hole - 1))::numeric END AS par,
+               CASE WHEN jsonb_typeof(src.points->(h.hole - 1)) = 'number'
+                    THEN (src.points->>(h.hole - 1))::numeric END AS points
+        FROM src, generate_series(1, GREATEST(
+            CASE WHEN jsonb_typeof(src.strokes) = 'array' THEN jsonb_array_length(src.strokes) ELSE 0 END,
+            CASE WHEN jsonb_typeof(src.points) = 'array' THEN jsonb_array_length(src.points) ELSE 0 END
+        )) AS h(hole)
+    )
+    SELECT hole,
+           CASE WHEN strokes BETWEEN 1 AND 99 THEN strokes::smallint END,
+           CASE WHEN par BETWEEN 1 AND 9 THEN par::smallint END,
+           CASE WHEN abs(points) < 10000 THEN points END
+    FROM cells
+    WHERE (strokes BETWEEN 1 AND 99) OR (abs(points) < 10000)
+$$;
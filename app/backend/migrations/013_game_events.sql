@@ -0,0 +1,25 @@
+-- Event-sourced history of games.state_json (see game_log.py): an append-only
+-- log per game plus periodic snapshots to rebuild any point from.
+-- Existing games get a seq-0 snapshot of their state on their first logged change.
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS event_seq INT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS game_events (
+    game_id INT NOT NULL,
+    seq INT NOT NULL, -- 1, 2, ... per game (games.event_seq is the last one)
+    kind VARCHAR(20) NOT NULL, -- score, partner, advance, wolf_hole, replace, undo
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, seq),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+
+CREATE TABLE IF NOT EXISTS game_snapshots (
+    game_id INT NOT NULL,
+    seq INT NOT NULL, -- state after event seq (0: before the first logged event)
+    current_hole INT NOT NULL DEFAULT 0,
+    state JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, seq),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
@@ -0,0 +1,12 @@
+-- When each leaderboard was last built and for which window (see leaderboards.py),
+-- so a board with no entries is not mistaken for one that was never built.
+-- Boards without a row are rebuilt on their next read.
+
+CREATE TABLE IF NOT EXISTS leaderboard_boards (
+    leaderboard_type VARCHAR(50) NOT NULL,
+    game_type VARCHAR(50) NOT NULL DEFAULT '', -- '' for the overall board
+    period_start DATE,
+    period_end DATE,
+    last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (leaderboard_type, game_type)
+);
@@ -0,0 +1,57 @@
+-- hole_score_rows takes the game type: a wolf game's players[].scores hold the points
+-- each hole earned (0-2), not strokes, so they are no longer read as a fallback.
+-- Existing wolf rows are rebuilt here; rebuild the achievement counters afterwards
+-- with `python cli.py rebuild-achievement-stats`.
+
+DROP FUNCTION IF EXISTS hole_score_rows(JSONB, TEXT);
+
+-- Per-hole rows for one player of a state_json: strokes from scores.{email} (or
+-- players[].scores, except in wolf games where those hold points), par from pars,
+-- points from points.{email}. Holes with neither strokes nor points are skipped;
+-- out-of-range numbers become NULL.
+CREATE OR REPLACE FUNCTION hole_score_rows(state JSONB, player_email TEXT, of_game_type TEXT)
+RETURNS TABLE (hole INT, strokes SMALLINT, par SMALLINT, points NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+    WITH src AS (
+        SELECT COALESCE(
+                   CASE WHEN jsonb_typeof(state->'scores') = 'object' THEN state->'scores'->player_email END,
+                   (SELECT p->'scores'
+                    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(state->'players') = 'array'
+                                                   THEN state->'players' ELSE '[]'::jsonb END) p
+                    WHERE of_game_type IS DISTINCT FROM 'wolf'
+                      AND jsonb_typeof(p) = 'object' AND p->>'email' = player_email
+                    LIMIT 1)
+               ) AS strokes,
+               CASE WHEN jsonb_typeof(state->'points') = 'object' THEN state->'points'->player_email END AS points,
+               CASE WHEN jsonb_typeof(state->'pars') = 'array' THEN state->'pars' END AS pars
+    ),
+    cells AS (
+        SELECT h.hole,
+               CASE WHEN jsonb_typeof(src.strokes->(h.hole - 1)) = 'number'
+                    THEN (src.strokes->>(h.hole - 1))::numeric END AS strokes,
+               CASE WHEN jsonb_typeof(src.pars->(h.hole - 1)) = 'number'
+                    THEN (src.pars->>(h.hole - 1))::numeric END AS par,
+               CASE WHEN jsonb_typeof(src.points->(h.hole - 1)) = 'number'
+                    THEN (src.points->>(h.hole - 1))::numeric END AS points
+        FROM src, generate_series(1, GREATEST(
+            CASE WHEN jsonb_typeof(src.strokes) = 'array' THEN jsonb_array_length(src.strokes) ELSE 0 END,
+            CASE WHEN jsonb_typeof(src.points) = 'array' THEN jsonb_array_length(src.points) ELSE 0 END
+        )) AS h(hole)
+    )
+    SELECT hole,
+           CASE WHEN strokes BETWEEN 1 AND 99 THEN strokes::smallint END,
+           CASE WHEN par BETWEEN 1 AND 9 THEN par::smallint END,
+           CASE WHEN abs(points) < 10000 THEN points END
+    FROM cells
+    WHERE (strokes BETWEEN 1 AND 99) OR (abs(points) < 10000)
+$$;
+
+DELETE FROM hole_scores hs USING games g WHERE hs.game_id = g.id AND g.game_type = 'wolf';
+
+INSERT INTO hole_scores (game_id, game_player_id, hole, strokes, par, points)
+SELECT gp.game_id, gp.id, r.hole, r.strokes, r.par, r.points
+FROM games g
+JOIN game_players gp ON gp.game_id = g.id
+CROSS JOIN LATERAL hole_score_rows(g.state_json, gp.email, g.game_type::text) r
+WHERE g.game_type = 'wolf' AND g.state_json IS NOT NULL
+ON CONFLICT (game_player_id, hole) DO NOTHING;
@@ -0,0 +1,14 @@
+-- Completed games nothing ranks (six-six-six, or no scores entered) now get a
+-- game_results row per player as well, without a score, placement or outcome, so
+-- /users/{user_id}/history pages every completed game on idx_game_results_user_completed.
+-- After applying, run `python cli.py backfill-results` to add the rows for earlier games.
+
+ALTER TABLE game_results
+    ALTER COLUMN final_score DROP NOT NULL,
+    ALTER COLUMN placement DROP NOT NULL,
+    ALTER COLUMN outcome DROP NOT NULL;
+
+-- The history keyset compares completed_at, so it must not be null.
+UPDATE game_results gr SET completed_at = g.created_at
+FROM games g
+WHERE g.id = gr.game_id AND gr.completed_at IS NULL;
@@ -18,7 +18,10 @@ CREATE TABLE games (
     state_json JSONB DEFAULT NULL,
     is_complete BOOLEAN DEFAULT FALSE,
     completed_at TIMESTAMP DEFAULT NULL,
-    skin_value NUMERIC(10,2) DEFAULT NULL
+    skin_value NUMERIC(10,2) DEFAULT NULL,
+    state_version INT NOT NULL DEFAULT 0, -- bumped on every state write, for optimistic concurrency and ETags
+    state_updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Last-Modified of GET /games/{id}/state
+    event_seq INT NOT NULL DEFAULT 0 -- seq of the game's last game_events row
     -- Optionally: status VARCHAR(50), created_by INT, FOREIGN KEY (created_by) REFERENCES users(id)
 );
 
@@ -35,6 +38,142 @@ CREATE TABLE game_players (
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+-- final per-player results, written when a game is marked complete
+CREATE TABLE game_results (
+    game_id INT NOT NULL,
+    game_player_id INT NOT NULL UNIQUE,
+    user_id INT, -- null for guests without a user account
+    email VARCHAR(255) NOT NULL,
+    game_type game_type_enum NOT NULL,
+    final_score NUMERIC(10,2), -- wolf points or skins winnings; null when nothing ranks the game
+    placement INT, -- 1 = first (ties share a placement)
+    outcome VARCHAR(10) CHECK (outcome IN ('won', 'tied', 'lost')),
+    completed_at TIMESTAMP,
+    PRIMARY KEY (game_id, game_player_id),
+    FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (game_player_id) REFERENCES game_players(id),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- running wolf points per player, moved hole by hole (see wolf.py)
+CREATE TABLE game_standings (
+    game_id INT NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    points NUMERIC(10,2) NOT NULL DEFAULT 0,
+    holes_won INT NOT NULL DEFAULT 0, -- holes on which the player scored
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, email),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+
+-- one row per player per hole, synced from state_json (see hole_scores.py)
+CREATE TABLE hole_scores (
+    game_id INT NOT NULL,
+    game_player_id INT NOT NULL,
+    hole SMALLINT NOT NULL, -- 1-based
+    strokes SMALLINT, -- null until scored (wolf holes may only have points)
+    par SMALLINT,
+    points NUMERIC(6,2), -- wolf points for the hole
+    PRIMARY KEY (game_player_id, hole),
+    FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (game_player_id) REFERENCES game_players(id)
+);
+
+-- append-only log of state changes, and snapshots to replay it from (see game_log.py)
+CREATE TABLE game_events (
+    game_id INT NOT NULL,
+    seq INT NOT NULL, -- 1, 2, ... per game (games.event_seq is the last one)
+    kind VARCHAR(20) NOT NULL, -- score, partner, advance, wolf_hole, replace, undo
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, seq),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+
+CREATE TABLE game_snapshots (
+    game_id INT NOT NULL,
+    seq INT NOT NULL, -- state after event seq (0: before the first logged event)
+    current_hole INT NOT NULL DEFAULT 0,
+    state JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (game_id, seq),
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+
+-- per-user daily leaderboard buckets, bumped as games complete
+CREATE TABLE user_daily_stats (
+    user_id INT NOT NULL,
+    game_type game_type_enum NOT NULL,
+    day DATE NOT NULL,
+    games_played INT NOT NULL DEFAULT 0,
+    games_won INT NOT NULL DEFAULT 0,
+    points NUMERIC(12,2) NOT NULL DEFAULT 0, -- wolf points or skins winnings
+    PRIMARY KEY (user_id, game_type, day),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- per-user achievement counters, bumped as games complete
+CREATE TABLE user_stats (
+    user_id INT PRIMARY KEY,
+    games_played INT NOT NULL DEFAULT 0,
+    games_won INT NOT NULL DEFAULT 0, -- ties for first count as wins
+    wins_by_game_type JSONB NOT NULL DEFAULT '{}', -- {"wolf": 3, "skins": 1}
+    current_win_streak INT NOT NULL DEFAULT 0,
+    best_win_streak INT NOT NULL DEFAULT 0,
+    last_played_on DATE,
+    current_day_streak INT NOT NULL DEFAULT 0,
+    best_day_streak INT NOT NULL DEFAULT 0,
+    distinct_partners INT NOT NULL DEFAULT 0,
+    aces INT NOT NULL DEFAULT 0,
+    eagles INT NOT NULL DEFAULT 0,
+    best_birdies_in_game INT NOT NULL DEFAULT 0,
+    under_par_games INT NOT NULL DEFAULT 0,
+    low_variance_games INT NOT NULL DEFAULT 0,
+    comeback_wins INT NOT NULL DEFAULT 0,
+    lucky_number_wins INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- everyone each user has played with: a user id, or "email:<address>" for guests
+CREATE TABLE user_partners (
+    user_id INT NOT NULL,
+    partner VARCHAR(255) NOT NULL,
+    PRIMARY KEY (user_id, partner),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- oversized websocket messages relayed between workers, kept for a few minutes
+CREATE TABLE ws_message_spill (
+    id BIGSERIAL PRIMARY KEY,
+    game_id INT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- background jobs, drained by workers (see jobs.py)
+CREATE TABLE job_queue (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL, -- e.g. 'game.completed'
+    payload JSONB NOT NULL DEFAULT '{}',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- not before; pushed back on each retry
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- jobs that used up their attempts, kept for inspection
+CREATE TABLE job_dead_letter (
+    id BIGINT PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+    attempts INT NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL,
+    failed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- achievements definition table
 CREATE TABLE achievements (
     id SERIAL PRIMARY KEY,
@@ -76,6 +215,16 @@ CREATE TABLE leaderboard_cache (
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+-- when each board was last built, including boards with no entries
+CREATE TABLE leaderboard_boards (
+    leaderboard_type VARCHAR(50) NOT NULL,
+    game_type VARCHAR(50) NOT NULL DEFAULT '', -- '' for the overall board
+    period_start DATE,
+    period_end DATE,
+    last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (leaderboard_type, game_type)
+);
+
 -- indexes for performance
 CREATE INDEX idx_user_achievements_user_id ON user_achievements(user_id);
 CREATE INDEX idx_user_achievements_achievement_id ON user_achievements(achievement_id);
@@ -83,3 +232,139 @@ CREATE INDEX idx_leaderboard_cache_type_period ON leaderboard_cache(leaderboard_
 CREATE INDEX idx_leaderboard_cache_game_type ON leaderboard_cache(game_type);
 CREATE INDEX idx_games_completed_at ON games(completed_at) WHERE is_complete = true;
 CREATE INDEX idx_game_players_user_id ON game_players(user_id);
+CREATE INDEX idx_game_results_user_outcome ON game_results(user_id, outcome, completed_at DESC);
+CREATE INDEX idx_game_results_user_completed ON game_results(user_id, completed_at DESC, game_id DESC);
+CREATE INDEX idx_game_players_game_id ON game_players(game_id);
+CREATE UNIQUE INDEX idx_leaderboard_cache_board_user ON leaderboard_cache(leaderboard_type, (COALESCE(game_type, '')), user_id);
+CREATE INDEX idx_user_daily_stats_day ON user_daily_stats(day);
+CREATE INDEX idx_ws_message_spill_created_at ON ws_message_spill(created_at);
+CREATE INDEX idx_job_queue_run_at ON job_queue(run_at, id);
+CREATE INDEX idx_hole_scores_game_id ON hole_scores(game_id);
+
+-- JSON Patch for games.state_json (see state_patch.py)
+-- ops: [{"op": "replace", "path": ["scores", "a@example.com", "4"], "value": 5}, ...]
+-- Paths arrive already split into segments. Raises SQLSTATE GP001 for an
+-- invalid operation or path and GP002 when a "test" operation fails.
+CREATE OR REPLACE FUNCTION jsonb_apply_patch(target JSONB, ops JSONB) RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    op JSONB;
+    path TEXT[];
+    parent_path TEXT[];
+    parent JSONB;
+    key TEXT;
+    depth INT;
+BEGIN
+    target := COALESCE(target, '{}'::jsonb);
+    FOR op IN SELECT value FROM jsonb_array_elements(ops) LOOP
+        path := ARRAY(SELECT jsonb_array_elements_text(op -> 'path'));
+        depth := cardinality(path);
+        IF depth = 0 THEN
+            RAISE EXCEPTION 'JSON Patch path must not be empty' USING ERRCODE = 'GP001';
+        END IF;
+        parent_path := path[1:depth - 1];
+        key := path[depth];
+        parent := target #> parent_path;
+        IF parent IS NULL OR jsonb_typeof(parent) NOT IN ('object', 'array') THEN
+            RAISE EXCEPTION 'Path /% has no parent object or array', array_to_string(path, '/') USING ERRCODE = 'GP001';
+        END IF;
+        IF jsonb_typeof(parent) = 'array' AND key !~ '^(0|[1-9][0-9]{0,5})$'
+           AND NOT (key = '-' AND op ->> 'op' = 'add') THEN
+            RAISE EXCEPTION 'Invalid array index in path /%', array_to_string(path, '/') USING ERRCODE = 'GP001';
+        END IF;
+
+        CASE op ->> 'op'
+        WHEN 'add' THEN
+            IF jsonb_typeof(parent) = 'object' THEN
+                target := jsonb_set(target, path, op -> 'value', true);
+            ELSIF key = '-' OR key::int = jsonb_array_length(parent) THEN
+                target := jsonb_set(target, parent_path, parent || jsonb_build_array(op -> 'value'));
+            ELSIF key::int > jsonb_array_length(parent) THEN
+                RAISE EXCEPTION 'Array index out of range in path /%', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            ELSE
+                target := jsonb_insert(target, path, op -> 'value');
+            END IF;
+        WHEN 'replace' THEN
+            IF target #> path IS NULL THEN
+                RAISE EXCEPTION 'Path /% does not exist', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            END IF;
+            target := jsonb_set(target, path, op -> 'value', false);
+        WHEN 'remove' THEN
+            IF target #> path IS NULL THEN
+                RAISE EXCEPTION 'Path /% does not exist', array_to_string(path, '/') USING ERRCODE = 'GP001';
+            END IF;
+            target := target #- path;
+        WHEN 'test' THEN
+            IF (target #> path) IS DISTINCT FROM (op -> 'value') THEN
+                RAISE EXCEPTION 'Test failed at path /%', array_to_string(path, '/') USING ERRCODE = 'GP002';
+            END IF;
+        ELSE
+            RAISE EXCEPTION 'Unsupported JSON Patch op %', op ->> 'op' USING ERRCODE = 'GP001';
+        END CASE;
+    END LOOP;
+    RETURN target;
+END;
+$$;
+
+-- Announce changes to users for the per-worker user lookup cache (see users.py)
+CREATE OR REPLACE FUNCTION notify_user_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    old_row JSON;
+    new_row JSON;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        old_row := json_build_object('email', OLD.email, 'auth0_id', OLD.auth0_id);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_row := json_build_object('email', NEW.email, 'auth0_id', NEW.auth0_id);
+    END IF;
+    PERFORM pg_notify('user_changes', json_build_object('old', old_row, 'new', new_row)::text);
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER users_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_change();
+
+-- Per-hole rows for one player of a state_json: strokes from scores.{email} (or
+-- players[].scores, except in wolf games where those hold points), par from pars,
+-- points from points.{email}. Holes with neither strokes nor points are skipped;
+-- out-of-range numbers become NULL.
+CREATE OR REPLACE FUNCTION hole_score_rows(state JSONB, player_email TEXT, of_game_type TEXT)
+RETURNS TABLE (hole INT, strokes SMALLINT, par SMALLINT, points NUMERIC)
+LANGUAGE sql IMMUTABLE AS $$
+    WITH src AS (
+        SELECT COALESCE(
+                   CASE WHEN jsonb_typeof(state->'scores') = 'object' THEN state->'scores'->player_email END,
+                   (SELECT p->'scores'
+                    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(state->'players') = 'array'
+                                                   THEN state->'players' ELSE '[]'::jsonb END) p
+                    WHERE of_game_type IS DISTINCT FROM 'wolf'
+                      AND jsonb_typeof(p) = 'object' AND p->>'email' = player_email
+                    LIMIT 1)
+               ) AS strokes,
+               CASE WHEN jsonb_typeof(state->'points') = 'object' THEN state->'points'->player_email END AS points,
+               CASE WHEN jsonb_typeof(state->'pars') = 'array' THEN state->'pars' END AS pars
+    ),
+    cells AS (
+        SELECT h.hole,
+               CASE WHEN jsonb_typeof(src.strokes->(h.hole - 1)) = 'number'
+                    THEN (src.strokes->>(h.hole - 1))::numeric END AS strokes,
+               CASE WHEN jsonb_typeof(src.pars->(h.hole - 1)) = 'number'
+                    THEN (src.pars->>(h.hole - 1))::numeric END AS par,
+               CASE WHEN jsonb_typeof(src.points->(h.hole - 1)) = 'number'
+                    THEN (src.points->>(h.hole - 1))::numeric END AS points
+        FROM src, generate_series(1, GREATEST(
+            CASE WHEN jsonb_typeof(src.strokes) = 'array' THEN jsonb_array_length(src.strokes) ELSE 0 END,
+            CASE WHEN jsonb_typeof(src.points) = 'array' THEN jsonb_array_length(src.points) ELSE 0 END
+        )) AS h(hole)
+    )
+    SELECT hole,
+           CASE WHEN strokes BETWEEN 1 AND 99 THEN strokes::smallint END,
+           CASE WHEN par BETWEEN 1 AND 9 THEN par::smallint END,
+           CASE WHEN abs(points) < 10000 THEN points END
+    FROM cells
+    WHERE (strokes BETWEEN 1 AND 99) OR (abs(points) < 10000)
+$$;
@@ -0,0 +1,60 @@
+"""
+One JSON codec for the whole backend, built on orjson.
+
+Game state used to be converted several times per request: ``json.dumps``
+before writing it to JSONB, a defensive ``json.loads`` after reading it back,
+then FastAPI's ``jsonable_encoder`` walk and ``json.dumps`` again for the
+response. Now:
+
+- ``configure_psycopg`` makes psycopg's JSON adapters use orjson, so JSONB
+  columns come back as dicts/lists and values are written by wrapping them in
+  ``Jsonb(...)`` (no hand-made JSON strings).
+- ``FastJSONResponse`` is the app's default response class and renders with
+  orjson. Endpoints whose payload is already plain JSON data (rows from the
+  database, dicts built in code) return it directly, which also skips
+  FastAPI's ``jsonable_encoder`` pass.
+
+``benchmarks/json_serialization.py`` measures the difference.
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from psycopg.types.json import set_json_dumps, set_json_loads
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    # NUMERIC columns (e.g. skin_value) arrive as Decimal; jsonable_encoder sent them as numbers too.
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any, sort_keys: bool = False) -> bytes:
+    """Serialize ``value`` to UTF-8 JSON bytes."""
+    return orjson.dumps(value, default=_default, option=_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _OPTIONS)
+
+
+def dumps_str(value: Any) -> str:
+    return dumps(value).decode()
+
+
+loads = orjson.loads
+
+
+def configure_psycopg() -> None:
+    """Use orjson for every ``Json``/``Jsonb`` parameter and JSON/JSONB result, process-wide."""
+    set_json_dumps(dumps)
+    set_json_loads(loads)
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered with orjson (datetimes as ISO 8601, Decimals as numbers)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,197 @@
+"""
+Skins settlement.
+
+A skins game is settled from ``state_json['scores']`` ({email: [strokes per
+hole]}): the lowest score on a hole wins the skin outright; a tie (or a hole
+not everyone has scored yet) carries the skin over, so the next outright win
+is worth ``skin_value * (carried + 1)``.
+
+Scores are turned into a players x holes matrix once, and each hole is then
+settled from its column (``min`` and ``count`` on a tuple) rather than by
+building a dict per hole. Ragged score lists are padded: a missing or
+non-positive score means the hole is unfinished and carries over, as in the
+app's ``useSkinsGameLogic.calculateSkins``.
+
+Settlements only change when the state does, so ``settle_game`` caches them
+per ``(game_id, state_version)``. ``settle_season`` settles every completed
+skins game in a date range and sums payouts per player, e.g. for a league
+season's report.
+"""
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from psycopg.rows import dict_row
+
+from cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Settled games kept in memory; entries never go stale (the key includes the state version).
+settlement_cache = TTLCache(
+    maxsize=int(os.getenv("SKINS_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("SKINS_CACHE_TTL", "3600")),
+)
+
+
+@dataclass
+class Settlement:
+    emails: Tuple[str, ...]
+    skins: List[dict]
+    # Skins won and winnings per email; only players who won at least one skin appear.
+    player_totals: Dict[str, dict] = field(default_factory=dict)
+    # Skins still carried over after the last hole.
+    carryover: int = 0
+
+    def as_dict(self) -> dict:
+        return {'skins': self.skins, 'player_totals': self.player_totals}
+
+
+def score_matrix(scores: Dict[str, Sequence]) -> Tuple[Tuple[str, ...], List[Tuple[int, ...]]]:
+    """
+    ``(emails, rows)``: one row of strokes per player, all padded to the
+    longest list. Missing, non-numeric and non-positive strokes become 0.
+    """
+    emails = tuple(scores)
+    rows = [tuple(strokes or ()) for strokes in scores.values()]
+    try:
+        # Common case, a finished game: equal lengths and every stroke a positive number.
+        if len(set(map(len, rows))) <= 1 and min(map(min, filter(None, rows)), default=1) > 0:
+            return emails, rows
+    except TypeError:
+        pass
+    width = max(map(len, rows), default=0)
+    rows = []
+    for email in emails:
+        strokes = scores[email] or ()
+        row = [s if isinstance(s, (int, float)) and not isinstance(s, bool) and s > 0 else 0 for s in strokes]
+        row.extend([0] * (width - len(row)))
+        rows.append(tuple(row))
+    return emails, rows
+
+
+def settle(emails: Sequence[str], rows: Sequence[Sequence[int]], skin_value: float) -> Settlement:
+    """Settle a players x holes matrix from ``score_matrix``."""
+    skins = []
+    totals: Dict[str, dict] = {}
+    carryover = 0
+    columns = list(zip(*rows))
+    for hole, (column, best) in enumerate(zip(columns, map(min, columns)), start=1):
+        if best > 0 and column.count(best) == 1:
+            winner = emails[column.index(best)]
+            value = skin_value * (carryover + 1)
+            skins.append({'hole': hole, 'winner': winner, 'value': value})
+            total = totals.get(winner)
+            if total is None:
+                total = totals[winner] = {'skins': 0, 'winnings': 0}
+            total['skins'] += 1
+            total['winnings'] += value
+            carryover = 0
+        else:
+            skins.append({'hole': hole, 'winner': None, 'value': 0})
+            carryover += 1
+    return Settlement(tuple(emails), skins, totals, carryover)
+
+
+def settle_state(state: dict, skin_value: float) -> Settlement:
+    emails, rows = score_matrix(state.get('scores') or {})
+    return settle(emails, rows, skin_value)
+
+
+def settle_game(game_id: int, state_version: int, state: dict, skin_value: float) -> Settlement:
+    """``settle_state``, cached per game and state version."""
+    key = (game_id, state_version)
+    cached = settlement_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    settlement = settle_state(state, skin_value)
+    settlement_cache.set(key, settlement)
+    return settlement
+
+
+async def fetch_settlement(db, game_id: int) -> Optional[Tuple[Settlement, int]]:
+    """
+    ``(settlement, state_version)`` for one game, or ``None`` if it does not
+    exist. Scores are only read from the database when the cached settlement
+    is for an older version. Raises ValueError if the game has no scores yet.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("SELECT skin_value, state_version FROM games WHERE id = %s", (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
+            return None
+        version = game['state_version']
+        cached = settlement_cache.get((game_id, version))
+        if cached is not MISSING:
+            return cached, version
+        await cursor.execute("SELECT state_json->'scores' AS scores FROM games WHERE id = %s", (game_id,))
+        row = await cursor.fetchone()
+    scores = (row or {}).get('scores') or {}
+    if not scores:
+        raise ValueError("No scores found for this game.")
+    return settle_game(game_id, version, {'scores': scores}, float(game['skin_value'] or 0)), version
+
+
+async def settle_season(db, start: date, end: date, user_id: Optional[int] = None) -> dict:
+    """
+    Settle every skins game completed between ``start`` and ``end``
+    (inclusive) and total the payouts per player, best earner first.
+    ``user_id`` limits the report to games that user played in.
+    """
+    if end < start:
+        raise ValueError("end must not be before start.")
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute(
+            """
+            SELECT g.id, g.state_version, g.skin_value
+            FROM games g
+            WHERE g.game_type = 'skins' AND g.is_complete = TRUE
+              AND g.completed_at >= %s AND g.completed_at < %s
+              AND (%s::int IS NULL OR EXISTS (
+                  SELECT 1 FROM game_players gp WHERE gp.game_id = g.id AND gp.user_id = %s))
+            ORDER BY g.completed_at
+            """,
+            (start, end + timedelta(days=1), user_id, user_id),
+        )
+        games = await cursor.fetchall()
+        settlements = {}
+        for game in games:
+            cached = settlement_cache.get((game['id'], game['state_version']))
+            if cached is not MISSING:
+                settlements[game['id']] = cached
+        missing = [game['id'] for game in games if game['id'] not in settlements]
+        scores = {}
+        if missing:
+            await cursor.execute("SELECT id, state_json->'scores' AS scores FROM games WHERE id = ANY(%s)", (missing,))
+            scores = {row['id']: row['scores'] or {} for row in await cursor.fetchall()}
+
+    players: Dict[str, dict] = {}
+    skins_played = 0
+    pot = 0.0
+    for game in games:
+        settlement = settlements.get(game['id'])
+        if settlement is None:
+            settlement = settle_state({'scores': scores.get(game['id'], {})}, float(game['skin_value'] or 0))
+            settlement_cache.set((game['id'], game['state_version']), settlement)
+        skins_played += len(settlement.skins)
+        for email in settlement.emails:
+            entry = players.get(email)
+            if entry is None:
+                entry = players[email] = {'email': email, 'games': 0, 'skins': 0, 'winnings': 0.0}
+            entry['games'] += 1
+            won = settlement.player_totals.get(email)
+            if won is not None:
+                entry['skins'] += won['skins']
+                entry['winnings'] += won['winnings']
+                pot += won['winnings']
+    standings = sorted(players.values(), key=lambda p: (-p['winnings'], -p['skins'], p['email']))
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'games': len(games),
+        'holes': skins_played,
+        'total_paid': pot,
+        'players': standings,
+    }
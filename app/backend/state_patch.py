@@ -0,0 +1,219 @@
+"""
+Incremental game-state updates with JSON Patch (RFC 6902).
+
+Saving a score used to mean sending the whole ``state_json`` for the game,
+validating all of it and rewriting the full JSONB column. With a patch the
+phone sends only what changed, for example one hole for one player:
+
+    {"version": 7, "current_hole": 5,
+     "ops": [{"op": "replace", "path": "/scores/ann@example.com/4", "value": 4}]}
+
+- Supported operations: ``add``, ``remove``, ``replace`` and ``test``.
+- Only the values being written are validated, against the known parts of
+  each game type's state (see ``_VALIDATORS``).
+- The operations are applied inside Postgres by ``jsonb_apply_patch`` (see
+  ``migrations/006_state_patch.sql``), so the state never travels back to
+  the API.
+- ``games.state_version`` goes up by one on every write. A patch must name the
+  version it was based on; if another phone saved first the patch is refused
+  with ``StateConflict`` instead of silently overwriting their change.
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+SUPPORTED_OPS = ('add', 'remove', 'replace', 'test')
+
+# SQLSTATEs raised by jsonb_apply_patch.
+SQLSTATE_INVALID_PATCH = 'GP001'
+SQLSTATE_TEST_FAILED = 'GP002'
+
+MAX_OPS = 200
+
+# Array indexes must be plain non-negative integers; Postgres would read "-1" as "last element".
+_NEGATIVE_INDEX = re.compile(r'^-\d+$')
+
+
+class StateConflict(Exception):
+    """The game state changed since the client's version, or a ``test`` operation failed."""
+
+    def __init__(self, message: str, current_version: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.current_version = current_version
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split a JSON Pointer (``/scores/a~1b@x.com/4``) into unescaped segments."""
+    if not pointer.startswith('/'):
+        raise ValueError(f"Invalid JSON Pointer {pointer!r}: must start with '/'.")
+    segments = [s.replace('~1', '/').replace('~0', '~') for s in pointer[1:].split('/')]
+    for segment in segments:
+        if _NEGATIVE_INDEX.match(segment):
+            raise ValueError(f"Invalid JSON Pointer {pointer!r}: negative array index.")
+    return segments
+
+
+def compile_ops(game_type: str, ops: List[dict]) -> List[dict]:
+    """
+    Validate ``ops`` for ``game_type`` and return them in the form
+    ``jsonb_apply_patch`` expects (paths split into segments).
+    Raises ``ValueError`` describing the first invalid operation.
+    """
+    if not ops:
+        raise ValueError("A patch needs at least one operation.")
+    if len(ops) > MAX_OPS:
+        raise ValueError(f"A patch may contain at most {MAX_OPS} operations.")
+    validators = _VALIDATORS.get(game_type, {})
+    compiled = []
+    for index, op in enumerate(ops):
+        name = op.get('op')
+        if name not in SUPPORTED_OPS:
+            raise ValueError(f"Operation {index}: unsupported op {name!r} (use one of {', '.join(SUPPORTED_OPS)}).")
+        if not isinstance(op.get('path'), str):
+            raise ValueError(f"Operation {index}: 'path' must be a JSON Pointer string.")
+        path = parse_pointer(op['path'])
+        if path == ['']:
+            raise ValueError(f"Operation {index}: replacing the whole state needs PATCH /games/{{id}}/state.")
+        entry = {"op": name, "path": path}
+        if name != 'remove':
+            if 'value' not in op:
+                raise ValueError(f"Operation {index}: '{name}' needs a 'value'.")
+            entry["value"] = op['value']
+        validator = validators.get(path[0])
+        if validator is not None:
+            if name == 'remove' and len(path) == 1 and path[0] in _REQUIRED_KEYS.get(game_type, ()):
+                raise ValueError(f"Operation {index}: '{path[0]}' cannot be removed from a {game_type} game.")
+            if name in ('add', 'replace'):
+                try:
+                    validator(path[1:], op['value'])
+                except ValueError as e:
+                    raise ValueError(f"Operation {index} ({op['path']}): {e}") from None
+        compiled.append(entry)
+    return compiled
+
+
+async def apply_patch(db, game_id: int, version: int, ops: List[dict],
+                      current_hole: Optional[int] = None) -> Optional[dict]:
+    """
+    Apply ``ops`` to the game's state if it is still at ``version``.
+
+    Returns ``{"version", "current_hole", "ops"}`` after the write (``ops``
+    compiled, for the game log), or ``None`` if the game does not exist. Raises ``ValueError`` for an invalid patch or a
+    completed game and ``StateConflict`` when the version is stale or a
+    ``test`` operation fails. The caller commits.
+    """
+    if current_hole is not None and current_hole < 0:
+        raise ValueError("current_hole cannot be negative.")
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("SELECT game_type, state_version, is_complete FROM games WHERE id = %s", (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
+            return None
+        if game['is_complete']:
+            raise ValueError("Cannot update a completed game.")
+        compiled = compile_ops(game['game_type'], ops)
+        try:
+            await cursor.execute("""
+                UPDATE games
+                SET state_json = jsonb_apply_patch(state_json, %(ops)s::jsonb),
+                    current_hole = COALESCE(%(current_hole)s, current_hole),
+                    state_version = state_version + 1,
+                    state_updated_at = CURRENT_TIMESTAMP
+                WHERE id = %(game_id)s AND state_version = %(version)s AND is_complete = FALSE
+                RETURNING state_version, current_hole
+            """, {"ops": Jsonb(compiled), "current_hole": current_hole, "game_id": game_id, "version": version})
+        except psycopg.Error as e:
+            if e.sqlstate == SQLSTATE_INVALID_PATCH:
+                raise ValueError(e.diag.message_primary) from None
+            if e.sqlstate == SQLSTATE_TEST_FAILED:
+                raise StateConflict(e.diag.message_primary, game['state_version']) from None
+            raise
+        row = await cursor.fetchone()
+        if row is None:
+            # Someone else wrote (or completed the game) between our read and the update.
+            await cursor.execute("SELECT state_version, is_complete FROM games WHERE id = %s", (game_id,))
+            latest = await cursor.fetchone()
+            if latest and latest['is_complete']:
+                raise ValueError("Cannot update a completed game.")
+            raise StateConflict(
+                f"Game state is at version {latest['state_version'] if latest else '?'}, not {version}; reload and retry.",
+                latest['state_version'] if latest else None,
+            )
+    return {"version": row['state_version'], "current_hole": row['current_hole'], "ops": compiled}
+
+
+# -- value validation per game type -------------------------------------------
+
+def _score(value: Any) -> None:
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise ValueError("expected a number or null")
+
+
+def _score_list(value: Any) -> None:
+    if not isinstance(value, list):
+        raise ValueError("expected a list of numbers")
+    for item in value:
+        _score(item)
+
+
+def _per_player(check: Callable[[Any], None]) -> Callable[[Any], None]:
+    def validate(value: Any) -> None:
+        if not isinstance(value, dict):
+            raise ValueError("expected an object keyed by player email")
+        for item in value.values():
+            check(item)
+    return validate
+
+
+def _per_player_per_hole(rest: List[str], value: Any) -> None:
+    """``{email: [score per hole]}`` addressed at any depth."""
+    if len(rest) == 0:
+        _per_player(_score_list)(value)
+    elif len(rest) == 1:
+        _score_list(value)
+    else:
+        _score(value)
+
+
+def _per_player_amount(rest: List[str], value: Any) -> None:
+    """``{email: amount}`` addressed at any depth."""
+    if len(rest) == 0:
+        _per_player(_score)(value)
+    else:
+        _score(value)
+
+
+def _skin_record(value: Any) -> None:
+    if not isinstance(value, dict) or not isinstance(value.get('hole'), int):
+        raise ValueError("expected a skin object with an integer 'hole'")
+
+
+def _skins_list(rest: List[str], value: Any) -> None:
+    """``[{hole, winner, carryover, value}, ...]``; fields inside a skin are not checked."""
+    if len(rest) == 0:
+        if not isinstance(value, list):
+            raise ValueError("expected a list of skins")
+        for item in value:
+            _skin_record(item)
+    elif len(rest) == 1:
+        _skin_record(value)
+
+
+_VALIDATORS: Dict[str, Dict[str, Callable[[List[str], Any], None]]] = {
+    'skins': {
+        'scores': _per_player_per_hole,
+        'skins': _skins_list,
+        'total_winnings': _per_player_amount,
+    },
+    'wolf': {
+        'points': _per_player_per_hole,
+    },
+}
+
+# Keys a full update must contain (SkinsGameState), so a patch may not remove them.
+_REQUIRED_KEYS = {
+    'skins': ('scores', 'skins', 'total_winnings'),
+}
@@ -0,0 +1,201 @@
+"""
+Logging setup with bounded cost on hot paths.
+
+Score entry, state reads and game creation run many times a minute on league
+night. Their log lines used to format whole Pydantic models and fetched rows
+with f-strings at INFO, so every request paid for serializing a full game
+state just to log it. ``configure_logging`` installs:
+
+- A ``QueueHandler`` on the root logger. Request code only puts the record on
+  a bounded in-memory queue; a background ``QueueListener`` thread formats and
+  writes it. If the queue is full (stdout stuck), records are dropped and
+  counted instead of blocking the event loop. Message formatting (``%``
+  arguments) happens on the listener thread too.
+- ``LOG_FORMAT=json`` (default ``text``): one JSON object per line with the
+  timestamp, level, logger, message and any structured fields.
+- ``LOG_MAX_FIELD_CHARS`` (default 1000): longer messages and field values
+  are truncated.
+
+High-volume events are logged with ``log_event``: structured fields instead
+of formatted text, nothing built when the level is disabled, and sampled at
+``LOG_SAMPLE_RATE`` (default 1, i.e. everything; per event with e.g.
+``LOG_SAMPLE_RATES=state.updated=0.1,games_won.fetched=0.01``). Sampled records
+carry their ``sample_rate`` so counts can be scaled back up.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+import serialization
+
+# Attributes every LogRecord has; anything else was passed via ``extra`` and is a structured field.
+# (uvicorn adds ``color_message`` to its own records.)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "color_message"}
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+
+def _truncate(value: str, limit: int) -> str:
+    if limit > 0 and len(value) > limit:
+        return value[:limit] + f"... [{len(value) - limit} chars truncated]"
+    return value
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; ``extra`` fields become top-level keys."""
+
+    def __init__(self, max_field_chars: int = 1000) -> None:
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage(), self.max_field_chars),
+        }
+        for key, value in _fields(record).items():
+            if not isinstance(value, (int, float, bool)) and value is not None:
+                value = _truncate(value if isinstance(value, str) else repr(value), self.max_field_chars)
+            entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return serialization.dumps_str(entry)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, with structured fields appended as ``key=value``."""
+
+    def __init__(self, max_field_chars: int = 1000) -> None:
+        super().__init__(TEXT_FORMAT)
+        self.max_field_chars = max_field_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_field_chars)
+        line = super().formatMessage(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={_truncate(str(value), self.max_field_chars)}"
+                                   for key, value in fields.items())
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    ``QueueHandler`` that never blocks and leaves formatting to the listener.
+
+    The stock handler formats the message in the caller's thread
+    (``prepare``); here only exception tracebacks are rendered up front,
+    because they reference live frames.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+class _Sampler:
+    def __init__(self, default_rate: float, rates: Dict[str, float]) -> None:
+        self.default_rate = default_rate
+        self.rates = rates
+
+    def rate(self, event: str) -> float:
+        return self.rates.get(event, self.default_rate)
+
+
+_sampler = _Sampler(1.0, {})
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        event, _, rate = item.partition('=')
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """
+    Log ``event`` with structured ``fields``, subject to the event's sample
+    rate. Does no work at all when ``level`` is disabled or the event is
+    sampled out. Pass identifiers and sizes, not whole payloads.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sampler.rate(event)
+    if rate < 1.0:
+        if random.random() >= rate:
+            return
+        fields["sample_rate"] = rate
+    fields["event"] = event
+    logger.log(level, event, extra=fields)
+
+
+def dropped_records() -> int:
+    """Records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Route all logging through a bounded queue to stdout, formatted per ``LOG_FORMAT``."""
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+    max_field_chars = int(os.getenv("LOG_MAX_FIELD_CHARS", "1000"))
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        formatter: logging.Formatter = JsonFormatter(max_field_chars)
+    else:
+        formatter = TextFormatter(max_field_chars)
+    _sampler.default_rate = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+    _sampler.rates = _parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,204 @@
+"""
+Looking up registered users for game players and signed-in visitors.
+
+A player added to a game may or may not have an account. Each player is
+matched to ``users`` by Auth0 id first and by email second, and every player
+of a game (or of a whole import) is resolved with one query instead of one
+query per player.
+
+User rows almost never change, yet the frontend looks up the signed-in user
+(``GET /users/by-auth0/{auth0_id}``) on nearly every page load. Lookups by
+Auth0 id and by email therefore go through ``user_cache``, a bounded LRU with
+a TTL (``USER_CACHE_SIZE``, ``USER_CACHE_TTL``; "no such user" answers expire
+after ``USER_CACHE_NEGATIVE_TTL``). A cache hit needs no database connection.
+
+Keeping the cache correct when users change:
+- ``invalidate_user`` drops the entries for one user; call it after writing
+  to ``users`` from this process.
+- ``migrations/009_user_change_notify.sql`` adds a trigger that announces
+  every insert, update and delete on ``users`` on the ``user_changes``
+  channel, whoever made the change. ``UserCacheSync`` listens on it and
+  invalidates, so all workers and instances drop stale entries together
+  (``USER_CACHE_SYNC=postgres``, the default). Without it, entries can be up
+  to one TTL stale.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Hashable, List, Optional, Sequence
+
+import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+CHANGE_CHANNEL = 'user_changes'
+
+
+def cache_from_env() -> TTLCache:
+    return TTLCache(
+        maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+        negative_ttl=float(os.getenv("USER_CACHE_NEGATIVE_TTL", "30")),
+    )
+
+
+user_cache = cache_from_env()
+
+
+def _auth0_key(auth0_id: str) -> Hashable:
+    return ('auth0', auth0_id)
+
+
+def _email_key(email: str) -> Hashable:
+    return ('email', email)
+
+
+def _remember(user: dict) -> None:
+    user_cache.set(_email_key(user['email']), user)
+    if user['auth0_id']:
+        user_cache.set(_auth0_key(user['auth0_id']), user)
+
+
+def invalidate_user(email: Optional[str] = None, auth0_id: Optional[str] = None) -> None:
+    """Forget the cached lookups for a user whose row was inserted, changed or deleted."""
+    if email:
+        user_cache.invalidate(_email_key(email))
+    if auth0_id:
+        user_cache.invalidate(_auth0_key(auth0_id))
+
+
+async def get_user_by_auth0(pool, auth0_id: str) -> Optional[dict]:
+    """
+    ``{id, name, email, auth0_id}`` of the user with ``auth0_id``, or ``None``.
+    Borrows a connection from ``pool`` only on a cache miss.
+    """
+    user = user_cache.get(_auth0_key(auth0_id))
+    if user is not MISSING:
+        return user
+    generation = user_cache.generation
+    async with pool.connection() as db:
+        async with db.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute("SELECT id, name, email, auth0_id FROM users WHERE auth0_id = %s", (auth0_id,))
+            user = await cursor.fetchone()
+    # Skip caching if the user changed while we were reading.
+    if generation == user_cache.generation:
+        if user is None:
+            user_cache.set(_auth0_key(auth0_id), None)
+        else:
+            _remember(user)
+    return user
+
+
+async def resolve_user_ids(db, players: Sequence) -> List[Optional[int]]:
+    """
+    ``users.id`` for each of ``players`` (objects with ``email`` and an
+    optional ``auth0_id``), in the same order; ``None`` for players without
+    an account. Only players missing from the cache are queried, all at once.
+    """
+    keys = []
+    for player in players:
+        auth0_id = getattr(player, 'auth0_id', None)
+        if auth0_id:
+            keys.append(_auth0_key(auth0_id))
+        else:
+            keys.append(_email_key(player.email) if player.email else None)
+
+    found: Dict[Hashable, Optional[dict]] = {}
+    for key in keys:
+        if key is not None and key not in found:
+            user = user_cache.get(key)
+            if user is not MISSING:
+                found[key] = user
+    missing = {key for key in keys if key is not None and key not in found}
+
+    if missing:
+        generation = user_cache.generation
+        emails = sorted(value for kind, value in missing if kind == 'email')
+        auth0_ids = sorted(value for kind, value in missing if kind == 'auth0')
+        async with db.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(
+                "SELECT id, name, email, auth0_id FROM users WHERE email = ANY(%s) OR auth0_id = ANY(%s)",
+                (emails, auth0_ids)
+            )
+            rows = await cursor.fetchall()
+        for row in rows:
+            found[_email_key(row['email'])] = row
+            if row['auth0_id']:
+                found[_auth0_key(row['auth0_id'])] = row
+        if generation == user_cache.generation:
+            for key in missing:
+                user_cache.set(key, found.get(key))
+
+    resolved = []
+    for key in keys:
+        user = found.get(key) if key is not None else None
+        resolved.append(user['id'] if user else None)
+    return resolved
+
+
+class UserCacheSync:
+    """Invalidates ``user_cache`` entries announced by the ``users`` change trigger."""
+
+    def __init__(self, dsn: Optional[str], cache: TTLCache = user_cache, channel: str = CHANGE_CHANNEL) -> None:
+        self.dsn = dsn
+        self.cache = cache
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        self._notifications_received = 0
+        self._listener_reconnects = 0
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "channel": self.channel,
+            "notifications_received": self._notifications_received,
+            "listener_reconnects": self._listener_reconnects,
+        }
+
+    async def _listen_loop(self) -> None:
+        backoff = 0.5
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    # Changes made while we weren't listening were missed; start over.
+                    self.cache.clear()
+                    backoff = 0.5
+                    async for notify in conn.notifies():
+                        self._notifications_received += 1
+                        self._invalidate(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._listener_reconnects += 1
+                logger.warning(f"User cache listener lost ({e!r}); reconnecting in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _invalidate(self, payload: str) -> None:
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed user change notification {payload!r}")
+            self.cache.clear()
+            return
+        for side in ('old', 'new'):
+            row = change.get(side)
+            if row:
+                if row.get('email'):
+                    self.cache.invalidate(_email_key(row['email']))
+                if row.get('auth0_id'):
+                    self.cache.invalidate(_auth0_key(row['auth0_id']))
@@ -0,0 +1,270 @@
+"""
+Cross-worker websocket broadcast over Postgres LISTEN/NOTIFY.
+
+``ConnectionManager`` only knows the sockets connected to its own process, so
+with several uvicorn workers (or several instances) players on different
+workers would never see each other's updates. The backplane relays every
+broadcast through a Postgres channel that all workers listen on; no extra
+service is needed.
+
+How a broadcast travels:
+1. ``publish`` hands the message to the local ``ConnectionManager`` right away
+   (local players don't wait for a database round trip) and queues it for
+   relay.
+2. A flush task waits ``coalesce_window`` seconds so a burst of updates shares
+   notifications, then packs the queued messages per game into as few
+   payloads as fit under Postgres' 8000-byte NOTIFY limit and sends them all
+   with a single ``pg_notify`` statement.
+3. A message too large for a notification on its own is written to
+   ``ws_message_spill`` and only its id is sent; receivers read it back.
+4. Every worker's listener delivers incoming messages to its local sockets,
+   skipping the ones it published itself.
+
+Background jobs, which have no sockets of their own, use ``notify_game`` to
+send a message the same way inside their transaction.
+
+Delivery is best effort, like the websocket itself: notifications sent while
+a listener is reconnecting are missed, and clients recover by reloading the
+game state.
+"""
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import psycopg
+from psycopg import sql
+
+from metrics import LatencyHistogram
+import serialization
+from websocket_manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'game_updates'
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_BYTES = 7999
+# Generous upper bound for the envelope around the messages (origin, sequence, game id, timestamp).
+ENVELOPE_OVERHEAD = 200
+
+# Spilled oversized messages only need to live long enough for every listener to read them.
+SPILL_RETENTION = '5 minutes'
+
+
+async def notify_game(db, game_id: int, message: dict, channel: str = DEFAULT_CHANNEL) -> None:
+    """
+    Broadcast ``message`` to ``game_id``'s sockets on every worker from code
+    that has no ``ConnectionManager`` (e.g. a background job). The
+    notification is sent when ``db``'s transaction commits; messages too large
+    for one notification are dropped with a warning.
+    """
+    payload = serialization.dumps({"o": "db", "s": uuid.uuid4().hex[:8], "g": game_id, "t": time.time(),
+                                   "m": [message]})
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        logger.warning(f"Game {game_id} notification of {len(payload)} bytes is too large for NOTIFY; dropped")
+        return
+    async with db.cursor() as cursor:
+        await cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload.decode()))
+
+
+class PostgresBackplane:
+    """Relays ``ConnectionManager`` broadcasts between workers through a Postgres channel."""
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        manager: ConnectionManager,
+        pool,
+        channel: str = DEFAULT_CHANNEL,
+        coalesce_window: float = 0.005,
+    ) -> None:
+        self.dsn = dsn or ""
+        self.manager = manager
+        self.pool = pool
+        self.channel = channel
+        self.coalesce_window = coalesce_window
+        self.origin = uuid.uuid4().hex[:12]
+        self.relay_latency = LatencyHistogram()
+        self._pending: Dict[int, List[bytes]] = {}
+        self._wake = asyncio.Event()
+        self._sequence = itertools.count()
+        self._publisher: Optional[psycopg.AsyncConnection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._messages_published = 0
+        self._notifications_sent = 0
+        self._notifications_received = 0
+        self._messages_spilled = 0
+        self._publish_failures = 0
+        self._listener_reconnects = 0
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._listen_loop()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+        logger.info(f"Websocket backplane listening on channel {self.channel!r} (origin {self.origin})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._publisher is not None:
+            await self._publisher.close()
+            self._publisher = None
+
+    # -- publishing --------------------------------------------------------
+
+    async def publish(self, game_id: int, message: dict) -> None:
+        """Deliver ``message`` to this worker's sockets now and to every other worker shortly after."""
+        await self.manager.broadcast(game_id, message)
+        self._pending.setdefault(game_id, []).append(serialization.dumps(message))
+        self._messages_published += 1
+        self._wake.set()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wake.wait()
+            # Let the rest of a burst (e.g. several players scoring the same hole) join this flush.
+            await asyncio.sleep(self.coalesce_window)
+            self._wake.clear()
+            pending, self._pending = self._pending, {}
+            try:
+                await self._send(pending)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._publish_failures += 1
+                logger.error(f"Websocket backplane publish failed: {e}", exc_info=True)
+                await self._reset_publisher()
+
+    async def _send(self, pending: Dict[int, List[bytes]]) -> None:
+        conn = await self._publisher_connection()
+        payloads: List[str] = []
+        budget = MAX_PAYLOAD_BYTES - ENVELOPE_OVERHEAD
+        for game_id, messages in pending.items():
+            batch: List[bytes] = []
+            size = 0
+            for message in messages:
+                # Messages are UTF-8 bytes, so len() is the byte length NOTIFY limits.
+                if batch and (size + len(message) > budget or len(message) > budget):
+                    payloads.append(self._envelope(game_id, batch))
+                    batch, size = [], 0
+                if len(message) > budget:
+                    payloads.append(await self._spill(conn, game_id, message))
+                    continue
+                batch.append(message)
+                size += len(message) + 2
+            if batch:
+                payloads.append(self._envelope(game_id, batch))
+        if not payloads:
+            return
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                (self.channel, payloads),
+            )
+        self._notifications_sent += len(payloads)
+
+    def _envelope(self, game_id: int, messages: List[bytes]) -> str:
+        # Messages are already JSON, so splice them in instead of re-encoding.
+        # The sequence number keeps Postgres from merging identical payloads.
+        header = serialization.dumps({"o": self.origin, "s": next(self._sequence), "g": game_id, "t": time.time()})
+        return (header[:-1] + b',"m":[' + b",".join(messages) + b"]}").decode()
+
+    async def _spill(self, conn: psycopg.AsyncConnection, game_id: int, message: bytes) -> str:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"DELETE FROM ws_message_spill WHERE created_at < NOW() - INTERVAL '{SPILL_RETENTION}'"
+            )
+            await cursor.execute(
+                "INSERT INTO ws_message_spill (game_id, payload) VALUES (%s, %s::jsonb) RETURNING id",
+                (game_id, message.decode()),
+            )
+            spill_id = (await cursor.fetchone())[0]
+        self._messages_spilled += 1
+        return serialization.dumps_str({"o": self.origin, "s": next(self._sequence), "g": game_id, "t": time.time(),
+                                        "r": spill_id})
+
+    async def _publisher_connection(self) -> psycopg.AsyncConnection:
+        if self._publisher is None or self._publisher.closed:
+            self._publisher = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        return self._publisher
+
+    async def _reset_publisher(self) -> None:
+        if self._publisher is not None:
+            try:
+                await self._publisher.close()
+            except Exception:
+                pass
+            self._publisher = None
+
+    # -- listening ---------------------------------------------------------
+
+    async def _listen_loop(self) -> None:
+        backoff = 0.5
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    backoff = 0.5
+                    async for notify in conn.notifies():
+                        self._notifications_received += 1
+                        try:
+                            await self._deliver(notify.payload)
+                        except Exception as e:
+                            logger.error(f"Could not deliver backplane notification: {e}", exc_info=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._listener_reconnects += 1
+                logger.warning(f"Websocket backplane listener lost ({e!r}); reconnecting in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def _deliver(self, payload: str) -> None:
+        envelope = serialization.loads(payload)
+        if envelope["o"] == self.origin:
+            return
+        game_id = envelope["g"]
+        if game_id not in self.manager.active_connections:
+            return
+        if "r" in envelope:
+            messages = [await self._read_spill(envelope["r"])]
+        else:
+            messages = envelope["m"]
+        self.relay_latency.observe(max(0.0, time.time() - envelope["t"]))
+        for message in messages:
+            if message is not None:
+                await self.manager.broadcast(game_id, message)
+
+    async def _read_spill(self, spill_id: int) -> Optional[dict]:
+        async with self.pool.connection() as db:
+            async with db.cursor() as cursor:
+                await cursor.execute("SELECT payload FROM ws_message_spill WHERE id = %s", (spill_id,))
+                row = await cursor.fetchone()
+        if row is None:
+            logger.warning(f"Spilled websocket message {spill_id} already expired")
+            return None
+        return row[0]
+
+    # -- stats -------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        return {
+            "channel": self.channel,
+            "origin": self.origin,
+            "pending_messages": sum(len(messages) for messages in self._pending.values()),
+            "messages_published": self._messages_published,
+            "notifications_sent": self._notifications_sent,
+            "notifications_received": self._notifications_received,
+            "messages_spilled": self._messages_spilled,
+            "publish_failures": self._publish_failures,
+            "listener_reconnects": self._listener_reconnects,
+            "relay_latency_ms": self.relay_latency.snapshot(),
+        }
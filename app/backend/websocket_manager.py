@@ -1,24 +1,176 @@
-from typing import Dict, List
+"""
+WebSocket connections per game and fan-out of live updates.
+
+Every connection gets its own bounded send queue and a dedicated writer task,
+so ``broadcast`` never waits on the network: it serializes the message once,
+drops it into each queue and returns. One player's phone on bad course Wi-Fi
+therefore only delays its own updates, not everyone else's.
+
+Misbehaving connections are cleaned up instead of breaking the broadcast:
+- Slow consumers: a connection whose queue is full, or whose single send takes
+  longer than ``send_timeout``, is evicted and closed with code 1013
+  ("try again later"). The client can reconnect and reload the game state.
+- Dead sockets: a send that fails (peer gone, connection reset) removes the
+  connection quietly.
+
+``stats()`` exposes connection counts, queue depth, eviction counters and a
+histogram of enqueue-to-delivered latency.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
 from fastapi import WebSocket
 
+from metrics import LatencyHistogram
+from serialization import dumps_str
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to evicted slow consumers (RFC 6455 "Try Again Later").
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class _Client:
+    """One connected socket with its pending messages and writer task."""
+
+    __slots__ = ("websocket", "queue", "writer")
+
+    def __init__(self, websocket: WebSocket, queue_size: int) -> None:
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[Tuple[str, float]]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+
 
 class ConnectionManager:
     """Manages WebSocket connections per game."""
 
-    def __init__(self) -> None:
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    def __init__(self, queue_size: int = 64, send_timeout: float = 5.0) -> None:
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1.")
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[int, Dict[WebSocket, _Client]] = {}
+        self.delivery_latency = LatencyHistogram()
+        self._broadcasts = 0
+        self._messages_sent = 0
+        self._slow_consumer_evictions = 0
+        self._dead_socket_removals = 0
+        # Strong references to fire-and-forget close tasks so they are not garbage collected mid-flight.
+        self._closing: Set[asyncio.Task] = set()
 
     async def connect(self, game_id: int, websocket: WebSocket) -> None:
         await websocket.accept()
-        self.active_connections.setdefault(game_id, []).append(websocket)
+        client = _Client(websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._write_loop(game_id, client))
+        self.active_connections.setdefault(game_id, {})[websocket] = client
 
     def disconnect(self, game_id: int, websocket: WebSocket) -> None:
-        if game_id in self.active_connections:
-            if websocket in self.active_connections[game_id]:
-                self.active_connections[game_id].remove(websocket)
-            if not self.active_connections[game_id]:
-                del self.active_connections[game_id]
-
-    async def broadcast(self, game_id: int, message: dict) -> None:
-        for connection in self.active_connections.get(game_id, []):
-            await connection.send_json(message)
+        """Forget ``websocket`` and stop its writer. Safe to call more than once."""
+        client = self._remove(game_id, websocket)
+        if client is not None:
+            self._stop_writer(client)
+
+    async def broadcast(self, game_id: int, message: dict) -> int:
+        """
+        Queue ``message`` for every connection in ``game_id`` and return how
+        many connections it was queued for. Never waits on a socket.
+        """
+        self._broadcasts += 1
+        clients = self.active_connections.get(game_id)
+        if not clients:
+            return 0
+        # Serialize once instead of once per connection.
+        text = dumps_str(message)
+        enqueued_at = time.monotonic()
+        queued = 0
+        for client in list(clients.values()):
+            try:
+                client.queue.put_nowait((text, enqueued_at))
+                queued += 1
+            except asyncio.QueueFull:
+                self._evict_slow(game_id, client, "send queue full")
+        return queued
+
+    async def close(self) -> None:
+        """Stop every writer and close every socket (used at application shutdown)."""
+        for game_id in list(self.active_connections):
+            for client in list(self.active_connections[game_id].values()):
+                self.disconnect(game_id, client.websocket)
+                self._close_in_background(client.websocket, 1001)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """Connection counts, queue depth, cleanup counters and delivery latency histogram."""
+        depths = [client.queue.qsize() for clients in self.active_connections.values() for client in clients.values()]
+        return {
+            "games": len(self.active_connections),
+            "connections": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_size": self.queue_size,
+            "broadcasts": self._broadcasts,
+            "messages_sent": self._messages_sent,
+            "slow_consumer_evictions": self._slow_consumer_evictions,
+            "dead_socket_removals": self._dead_socket_removals,
+            "delivery_latency_ms": self.delivery_latency.snapshot(),
+        }
+
+    def connections_per_game(self) -> Dict[int, int]:
+        return {game_id: len(clients) for game_id, clients in self.active_connections.items()}
+
+    # -- internals ---------------------------------------------------------
+
+    async def _write_loop(self, game_id: int, client: _Client) -> None:
+        """Send queued messages to one socket, in order, until it is removed."""
+        while True:
+            text, enqueued_at = await client.queue.get()
+            try:
+                await asyncio.wait_for(client.websocket.send_text(text), timeout=self.send_timeout)
+            except asyncio.TimeoutError:
+                self._evict_slow(game_id, client, f"send took longer than {self.send_timeout}s")
+                return
+            except Exception as e:
+                if self._remove(game_id, client.websocket) is not None:
+                    self._dead_socket_removals += 1
+                    logger.info(f"Removed dead websocket from game {game_id}: {e!r}")
+                return
+            self._messages_sent += 1
+            self.delivery_latency.observe(time.monotonic() - enqueued_at)
+
+    def _evict_slow(self, game_id: int, client: _Client, reason: str) -> None:
+        if self._remove(game_id, client.websocket) is None:
+            return
+        self._slow_consumer_evictions += 1
+        logger.warning(f"Evicting slow websocket consumer from game {game_id}: {reason}")
+        self._stop_writer(client)
+        self._close_in_background(client.websocket, CLOSE_TRY_AGAIN_LATER)
+
+    def _remove(self, game_id: int, websocket: WebSocket) -> Optional[_Client]:
+        clients = self.active_connections.get(game_id)
+        if not clients:
+            return None
+        client = clients.pop(websocket, None)
+        if not clients:
+            del self.active_connections[game_id]
+        return client
+
+    @staticmethod
+    def _stop_writer(client: _Client) -> None:
+        # The writer may be the task doing the eviction; it returns on its own then.
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def _close_in_background(self, websocket: WebSocket, code: int) -> None:
+        task = asyncio.create_task(self._close_quietly(websocket, code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close_quietly(self, websocket: WebSocket, code: int) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            # The peer is already gone or not reading; nothing more to do.
+            pass
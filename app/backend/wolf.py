@@ -0,0 +1,264 @@
+"""
+Server-side Wolf scoring and per-game standings.
+
+Each hole is one event: who was the wolf, the partner they picked (or that
+they went lone wolf) and which side won the hole (``winner`` is the email of
+any player on the winning side; ``None`` for a halved hole). Points, as in the
+app's ``useWolfGameLogic``:
+
+- halved hole: nobody scores
+- lone wolf wins: wolf 2; lone wolf loses: every other player 1
+- wolf and partner win: 1 each; they lose: every other player 1
+
+``record_hole`` writes the hole into ``state_json`` (``points`` per player and
+the event under ``holes``) and moves the running totals in ``game_standings``
+by the difference from what the hole was worth before, so recording or
+correcting a hole costs O(players) no matter how far the round is. The hole
+and its points are also appended to the game log (game_log.py).
+
+``game_standings`` is what ``GET /games/{id}/standings`` reads, and what
+``game_results`` ranks wolf games by when they complete, so win/loss lists and
+leaderboards come from the same totals. Clients that still send whole states
+keep it current through ``sync_from_state``.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+import game_log
+import hole_scores
+import skins
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HoleEvent:
+    hole: int  # 1-based
+    wolf: str
+    partner: Optional[str] = None
+    lone_wolf: bool = False
+    winner: Optional[str] = None  # any player on the winning side; None for a halved hole
+
+    def as_dict(self) -> dict:
+        return {"hole": self.hole, "wolf": self.wolf, "partner": self.partner,
+                "lone_wolf": self.lone_wolf, "winner": self.winner}
+
+
+def validate(emails: Sequence[str], event: HoleEvent, num_holes: int) -> None:
+    """Raise ValueError if ``event`` cannot happen in a game between ``emails``."""
+    if not 1 <= event.hole <= num_holes:
+        raise ValueError(f"hole must be between 1 and {num_holes}.")
+    if event.wolf not in emails:
+        raise ValueError(f"{event.wolf} is not playing in this game.")
+    if event.lone_wolf and event.partner is not None:
+        raise ValueError("A lone wolf has no partner.")
+    if not event.lone_wolf:
+        if event.partner is None:
+            raise ValueError("Pick a partner or play lone wolf.")
+        if event.partner not in emails:
+            raise ValueError(f"{event.partner} is not playing in this game.")
+        if event.partner == event.wolf:
+            raise ValueError("The wolf cannot partner themselves.")
+    if event.winner is not None and event.winner not in emails:
+        raise ValueError(f"{event.winner} is not playing in this game.")
+
+
+def hole_points(emails: Sequence[str], event: HoleEvent) -> Dict[str, int]:
+    """Points each player earns on the hole."""
+    points = dict.fromkeys(emails, 0)
+    if event.winner is None:
+        return points
+    wolf_side = {event.wolf} if event.lone_wolf else {event.wolf, event.partner}
+    if event.winner in wolf_side:
+        for email in wolf_side:
+            points[email] = 2 if event.lone_wolf else 1
+    else:
+        for email in emails:
+            if email not in wolf_side:
+                points[email] = 1
+    return points
+
+
+class Standings:
+    """Running totals for one game, moved hole by hole."""
+
+    def __init__(self, emails: Iterable[str]) -> None:
+        self.points: Dict[str, float] = dict.fromkeys(emails, 0)
+        self.holes_won: Dict[str, int] = dict.fromkeys(self.points, 0)
+
+    def apply(self, new: Dict[str, int], old: Optional[Dict[str, int]] = None) -> Dict[str, tuple]:
+        """
+        Replace a hole's ``old`` points (none if it is being recorded for the
+        first time) with ``new``. Returns ``{email: (points delta, holes_won
+        delta)}`` for the players whose totals changed.
+        """
+        old = old or {}
+        deltas = {}
+        for email, points in new.items():
+            before = old.get(email, 0)
+            delta = points - before
+            won = (points > 0) - (before > 0)
+            if delta or won:
+                self.points[email] = self.points.get(email, 0) + delta
+                self.holes_won[email] = self.holes_won.get(email, 0) + won
+                deltas[email] = (delta, won)
+        return deltas
+
+
+def _set_hole(values: Optional[list], hole: int, value, fill) -> list:
+    values = list(values or ())
+    if len(values) < hole:
+        values.extend([fill] * (hole - len(values)))
+    values[hole - 1] = value
+    return values
+
+
+async def record_hole(db, game_id: int, event: HoleEvent) -> Optional[dict]:
+    """
+    Score one hole of an in-progress wolf game, or re-score it. Runs in the
+    caller's transaction; the game row is locked so concurrent holes apply in
+    turn. Returns ``None`` if the game does not exist, raises ValueError for
+    an invalid event or a game that is not an in-progress wolf game.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("""
+            SELECT game_type, is_complete, num_holes, state_json->'points' AS points,
+                   state_json->'holes' AS holes
+            FROM games WHERE id = %s FOR UPDATE
+        """, (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
+            return None
+        if game['game_type'] != 'wolf':
+            raise ValueError("Holes can only be recorded for wolf games.")
+        if game['is_complete']:
+            raise ValueError("Cannot update a completed game.")
+        await cursor.execute("SELECT email FROM game_players WHERE game_id = %s ORDER BY id", (game_id,))
+        emails = [row['email'] for row in await cursor.fetchall()]
+        validate(emails, event, game['num_holes'] or 18)
+
+        stored = game['points'] if isinstance(game['points'], dict) else {}
+        old = {}
+        for email in emails:
+            previous = (stored.get(email) or [])[event.hole - 1:event.hole]
+            if previous and isinstance(previous[0], (int, float)):
+                old[email] = previous[0]
+        new = hole_points(emails, event)
+        deltas = Standings(emails).apply(new, old)
+
+        points = {email: _set_hole(stored.get(email), event.hole, new[email], 0) for email in emails}
+        holes = _set_hole(game['holes'] if isinstance(game['holes'], list) else None,
+                          event.hole, event.as_dict(), None)
+        await game_log.ensure_baseline(db, game_id)
+        await cursor.execute("""
+            UPDATE games
+            SET state_json = COALESCE(state_json, '{}'::jsonb) || jsonb_build_object('points', %s::jsonb, 'holes', %s::jsonb),
+                current_hole = GREATEST(COALESCE(current_hole, 0), %s),
+                state_version = state_version + 1, state_updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            RETURNING state_version
+        """, (Jsonb(points), Jsonb(holes), event.hole, game_id))
+        version = (await cursor.fetchone())['state_version']
+        if deltas:
+            changed = list(deltas)
+            await cursor.execute("""
+                INSERT INTO game_standings (game_id, email, points, holes_won)
+                SELECT %s, t.email, t.points, t.holes_won
+                FROM UNNEST(%s::text[], %s::numeric[], %s::int[]) AS t(email, points, holes_won)
+                ON CONFLICT (game_id, email) DO UPDATE SET
+                    points = game_standings.points + EXCLUDED.points,
+                    holes_won = game_standings.holes_won + EXCLUDED.holes_won,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (game_id, changed, [deltas[e][0] for e in changed], [deltas[e][1] for e in changed]))
+    await game_log.record_applied(db, game_id, 'wolf_hole', {**event.as_dict(), "points": new})
+    await hole_scores.sync_games(db, [game_id], [event.hole])
+    return {"hole": event.hole, "points": new, "version": version}
+
+
+async def sync_from_state(db, game_ids: List[int]) -> None:
+    """
+    Recompute ``game_standings`` from ``state_json->'points'`` for the wolf
+    games among ``game_ids``, after a client wrote the whole state (or
+    imported games). Other game types are ignored.
+    """
+    if not game_ids:
+        return
+    async with db.cursor() as cursor:
+        await cursor.execute("""
+            DELETE FROM game_standings s USING games g
+            WHERE s.game_id = g.id AND g.id = ANY(%s) AND g.game_type = 'wolf'
+        """, (game_ids,))
+        await cursor.execute("""
+            INSERT INTO game_standings (game_id, email, points, holes_won)
+            SELECT g.id, p.key,
+                   COALESCE(SUM(h.value::numeric), 0),
+                   COUNT(*) FILTER (WHERE h.value::numeric > 0)
+            FROM games g
+            CROSS JOIN LATERAL jsonb_each(g.state_json->'points') p
+            LEFT JOIN LATERAL jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(p.value) = 'array' THEN p.value ELSE '[]'::jsonb END
+            ) h(value) ON h.value ~ '^-?[0-9]+(\\.[0-9]+)?$'
+            WHERE g.id = ANY(%s) AND g.game_type = 'wolf' AND jsonb_typeof(g.state_json->'points') = 'object'
+            GROUP BY g.id, p.key
+        """, (game_ids,))
+
+
+async def final_points(db, game_id: int) -> Dict[str, float]:
+    """Standing points per email for one game, ``{}`` if none are stored."""
+    async with db.cursor() as cursor:
+        await cursor.execute("SELECT email, points FROM game_standings WHERE game_id = %s", (game_id,))
+        return {email: float(points) for email, points in await cursor.fetchall()}
+
+
+async def fetch_standings(db, game_id: int) -> Optional[dict]:
+    """
+    The game's standings, best first, with competition-ranked placements.
+    Wolf games read ``game_standings``; skins games their cached settlement.
+    Returns ``None`` if the game does not exist.
+    """
+    async with db.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute("SELECT game_type, current_hole, is_complete, state_version FROM games WHERE id = %s",
+                             (game_id,))
+        game = await cursor.fetchone()
+        if game is None:
+            return None
+        await cursor.execute("""
+            SELECT gp.email, gp.name, gp.user_id,
+                   COALESCE(s.points, 0) AS points, COALESCE(s.holes_won, 0) AS holes_won
+            FROM game_players gp
+            LEFT JOIN game_standings s ON s.game_id = gp.game_id AND s.email = gp.email
+            WHERE gp.game_id = %s
+            ORDER BY gp.id
+        """, (game_id,))
+        players = await cursor.fetchall()
+    if game['game_type'] == 'skins':
+        try:
+            settled = await skins.fetch_settlement(db, game_id)
+        except ValueError:
+            settled = None
+        totals = settled[0].player_totals if settled else {}
+        for player in players:
+            won = totals.get(player['email']) or {}
+            player['points'] = won.get('winnings', 0)
+            player['holes_won'] = won.get('skins', 0)
+    for player in players:
+        player['points'] = float(player['points'])
+    players.sort(key=lambda p: p['points'], reverse=True)
+    placement = 0
+    previous = None
+    for position, player in enumerate(players, start=1):
+        if player['points'] != previous:
+            placement, previous = position, player['points']
+        player['placement'] = placement
+    return {
+        "game_id": game_id,
+        "game_type": game['game_type'],
+        "current_hole": game['current_hole'],
+        "is_complete": game['is_complete'],
+        "version": game['state_version'],
+        "standings": players,
+    }
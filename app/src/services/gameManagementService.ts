@@ -45,12 +45,13 @@ export class GameManagementService {
     }
 
     try {
-      const games = await fetchUserGameHistory(this.dbUser.dbUser.value.id)
+      // In-progress games are always on the first history page
+      const { games } = await fetchUserGameHistory(this.dbUser.dbUser.value.id)
       
       // Filter for active games (not completed) and sort by date
       const activeGames = games
         .filter(game => !game.is_complete)
-        .sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime())
+        .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
       
       return activeGames.length > 0 ? activeGames[0] : null
     } catch (error) {
@@ -65,7 +66,7 @@ export class GameManagementService {
     
     if (recentGame) {
       this.currentGameId.setCurrentGameId(recentGame.id)
-      this.currentGameId.setCurrentGameType(recentGame.type)
+      this.currentGameId.setCurrentGameType(recentGame.game_type)
       return recentGame
     } else {
       this.currentGameId.clearCurrentGame()
@@ -87,7 +88,7 @@ export class GameManagementService {
     // If no current game, try to find the most recent active game
     const recentGame = await this.updateToMostRecentGame()
     if (recentGame) {
-      this.navigation.goToCurrentGame(recentGame.id, recentGame.type)
+      this.navigation.goToCurrentGame(recentGame.id, recentGame.game_type)
     } else {
       // No active games, go to game selection
       this.navigation.goToGameSelect()
@@ -45,22 +45,54 @@ export async function getPlayersForGame(gameId: number): Promise<Player[]> {
   return response.data
 }
 
+export interface HistoryPlayer {
+  name: string
+  email: string
+  user_id: number | null
+  final_score: number | null
+  placement: number | null
+  outcome: 'won' | 'tied' | 'lost' | null
+  points: number[] | null // Wolf points per hole, when recorded
+}
+
+export interface HistoryGame {
+  id: number
+  game_type: string
+  created_at: string
+  completed_at: string | null
+  is_complete: boolean
+  outcome: 'won' | 'tied' | 'lost' | 'in_progress' | null // null: completed, but nothing ranks it (e.g. SixSixSix)
+  summary: {
+    final_score: number | null
+    placement: number | null
+    num_players: number
+    num_holes: number
+    holes_played: number
+    skin_value: number | null
+    winners: string[]
+  }
+  players: HistoryPlayer[]
+}
+
+export interface GameHistoryPage {
+  games: HistoryGame[]
+  next_cursor: string | null // Pass back as `cursor` to load the next page
+}
+
 /**
- * Fetches the user's complete game history (won and lost).
+ * Fetches one page of the user's game history in a single request.
+ * In-progress games come first, then completed games newest first; every game
+ * already includes its players, so no per-game player calls are needed.
  * @param userId The internal DB user ID (number)
- * @returns Array of games (won and lost)
+ * @param cursor The `next_cursor` from the previous page (omit for the first page)
+ * @param limit Completed games per page
+ * @returns A page of games plus the cursor for the next page (null when done)
  */
-export async function fetchUserGameHistory(userId: number): Promise<any[]> {
-  const [won, lost] = await Promise.all([
-    api.get(`/users/${userId}/games-won`),
-    api.get(`/users/${userId}/games-lost`)
-  ])
-  // Combine and sort by date descending
-  const allGames = [...(won.data.games || []), ...(lost.data.games || [])]
-  console.log('[gameService] fetchUserGameHistory - won:', won.data.games)
-  console.log('[gameService] fetchUserGameHistory - lost:', lost.data.games)
-  console.log('[gameService] fetchUserGameHistory - allGames:', allGames)
-  return allGames.sort((a, b) => (a.date < b.date ? 1 : -1))
+export async function fetchUserGameHistory(userId: number, cursor?: string | null, limit = 20): Promise<GameHistoryPage> {
+  const response = await api.get(`/users/${userId}/history`, {
+    params: { limit, ...(cursor ? { cursor } : {}) }
+  })
+  return response.data
 }
 
 /**
@@ -9,12 +9,37 @@ export interface GameState {
   current_hole: number
   state_json: any
   num_holes?: number
+  version?: number
+}
+
+// One RFC 6902 operation, e.g. { op: 'replace', path: '/scores/ann@example.com/4', value: 4 }
+export interface StatePatchOp {
+  op: 'add' | 'remove' | 'replace' | 'test'
+  path: string
+  value?: any
+}
+
+export interface StatePatchResult {
+  version: number
+  current_hole: number
 }
 
 export async function saveGameState(gameId: number, state: GameState) {
   await api.patch(`/games/${gameId}/state`, state)
 }
 
+// Send only what changed. Rejects with a 409 if someone else saved since `version`;
+// reload the state and re-apply the edit in that case.
+export async function patchGameState(
+  gameId: number,
+  version: number,
+  ops: StatePatchOp[],
+  currentHole?: number
+): Promise<StatePatchResult> {
+  const res = await api.patch(`/games/${gameId}/state/patch`, { version, ops, current_hole: currentHole })
+  return res.data
+}
+
 export async function loadGameState(gameId: number): Promise<GameState> {
   const res = await api.get(`/games/${gameId}/state`)
   console.log('[gameStateService] loadGameState response:', res.data)